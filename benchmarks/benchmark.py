@@ -0,0 +1,458 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the rendering hot paths of pyHMSA-plot.
+
+Run the benchmarks and save the results::
+
+    python benchmarks/benchmark.py run -o results.json
+
+Compare the results of two runs (e.g. of two commits)::
+
+    python benchmarks/benchmark.py compare base.json results.json
+
+Each benchmark is run on synthetic data for several sizes (image width and
+height in pixels, number of channels or size of the filter kernel). The wall time of each repetition
+and the peak memory allocated during one additional run (traced with
+:mod:`tracemalloc`) are recorded.
+"""
+
+# Standard library modules.
+import os
+import sys
+import json
+import time
+import shutil
+import fnmatch
+import argparse
+import platform
+import datetime
+import tempfile
+import tracemalloc
+import subprocess
+from collections import OrderedDict
+
+# Third party modules.
+import numpy as np
+
+import scipy.ndimage as ndimage
+
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from pyhmsa.spec.datum.analysis import Analysis1D
+from pyhmsa.spec.datum.analysislist import AnalysisList0D
+from pyhmsa.spec.datum.imageraster import ImageRaster2D
+from pyhmsa.spec.condition.acquisition import \
+    AcquisitionRasterXY, POSITION_LOCATION_START
+from pyhmsa.spec.condition.specimenposition import SpecimenPosition
+
+# Local modules.
+import pyhmsa_plot
+from pyhmsa_plot.spec.datum.analysis import Analysis1DPlot
+from pyhmsa_plot.spec.datum.analysislist import AnalysisList0DPlot
+from pyhmsa_plot.spec.datum.imageraster import \
+    ImageRaster2DPlot, ImageRaster2DMontagePlot
+from pyhmsa_plot.util.modest_image import imshow
+from pyhmsa_plot.util.median import median_filter
+from pyhmsa_plot.util.composite import composite
+
+# Globals and constants variables.
+IMAGE_SIZES = [512, 1024, 2048, 4096, 8192, 16384]
+CHANNELS = [4096, 16384, 65536, 262144, 1048576]
+KERNEL_SIZES = [3, 7, 15, 31]
+MEDIAN_IMAGE_SIZE = 1024
+MONTAGE_COUNTS = [4, 16, 36]
+MONTAGE_IMAGE_SIZE = 512
+THUMBNAIL_SIZE = 256
+UPDATE_FRAMES = 10
+
+BENCHMARKS = OrderedDict()
+
+def benchmark(name, params):
+    """
+    Registers a benchmark. The decorated function is called with one of the
+    *params* and returns a callable, which is timed.
+    The preparation of the data done by the decorated function is not
+    timed.
+    """
+    def decorator(func):
+        BENCHMARKS[name] = (func, params)
+        return func
+    return decorator
+
+def create_imageraster2d(size, dtype=np.uint16):
+    random = np.random.RandomState(0)
+    datum = ImageRaster2D(size, size, dtype=dtype)
+    datum[:] = random.poisson(100, datum.shape)
+
+    acq = AcquisitionRasterXY(size, size, (1.0, 'um'), (1.0, 'um'))
+    acq.positions[POSITION_LOCATION_START] = \
+        SpecimenPosition((0.0, 'mm'), (0.0, 'mm'), 0.0)
+    datum.conditions.add('Acq0', acq)
+
+    return datum
+
+def create_analysis1d(channels):
+    random = np.random.RandomState(0)
+    datum = Analysis1D(channels, dtype=np.uint32)
+    datum[:] = random.poisson(100, datum.shape)
+    return datum
+
+def create_analysislist0d(count):
+    random = np.random.RandomState(0)
+    datum = AnalysisList0D(count)
+    datum[:] = random.normal(100.0, 10.0, datum.shape)
+    return datum
+
+def draw(fig):
+    FigureCanvasAgg(fig).draw()
+
+def _create_imageraster2d_plot():
+    plot = ImageRaster2DPlot()
+    plot.add_colorbar()
+    plot.add_scalebar()
+    return plot
+
+@benchmark('imageraster2d_plot', IMAGE_SIZES)
+def bench_imageraster2d_plot(size):
+    datum = create_imageraster2d(size)
+    plot = _create_imageraster2d_plot()
+    return lambda: draw(plot.plot(datum))
+
+@benchmark('imageraster2d_save', IMAGE_SIZES)
+def bench_imageraster2d_save(size):
+    datum = create_imageraster2d(size)
+    plot = _create_imageraster2d_plot()
+    filepath = os.path.join(_get_tmpdir(), 'imageraster2d.png')
+    return lambda: plot.save(filepath, datum)
+
+@benchmark('imageraster2d_save_thumbnail', IMAGE_SIZES)
+def bench_imageraster2d_save_thumbnail(size):
+    datum = create_imageraster2d(size)
+    plot = _create_imageraster2d_plot()
+    filepath = os.path.join(_get_tmpdir(), 'imageraster2d_thumbnail.png')
+    return lambda: plot.save_thumbnail(filepath, datum, THUMBNAIL_SIZE)
+
+@benchmark('imageraster2d_plot_median', IMAGE_SIZES)
+def bench_imageraster2d_plot_median(size):
+    datum = create_imageraster2d(size)
+    plot = _create_imageraster2d_plot()
+    plot.add_median_filter(5)
+    plot.set_cache_size(0)
+    return lambda: draw(plot.plot(datum))
+
+@benchmark('imageraster2d_plot_median_lazy', IMAGE_SIZES)
+def bench_imageraster2d_plot_median_lazy(size):
+    datum = create_imageraster2d(size)
+    plot = _create_imageraster2d_plot()
+    plot.add_median_filter(5)
+    plot.lazy_pipeline = True
+    return lambda: draw(plot.plot(datum))
+
+def _replot(size, update):
+    datums = [create_imageraster2d(size) for _ in range(UPDATE_FRAMES)]
+    plot = _create_imageraster2d_plot()
+    fig = plot.plot(datums[0])
+    ax = fig.axes[0]
+
+    def run():
+        for datum in datums:
+            draw(plot.plot(datum, ax, update=update))
+    return run
+
+@benchmark('imageraster2d_replot', IMAGE_SIZES)
+def bench_imageraster2d_replot(size):
+    return _replot(size, False)
+
+@benchmark('imageraster2d_update', IMAGE_SIZES)
+def bench_imageraster2d_update(size):
+    return _replot(size, True)
+
+@benchmark('imageraster2d_save_separate', MONTAGE_COUNTS)
+def bench_imageraster2d_save_separate(count):
+    datums = [create_imageraster2d(MONTAGE_IMAGE_SIZE) for _ in range(count)]
+    plot = _create_imageraster2d_plot()
+    filepath = os.path.join(_get_tmpdir(), 'imageraster2d_%i.png')
+
+    def run():
+        for index, datum in enumerate(datums):
+            plot.save(filepath % index, datum)
+    return run
+
+@benchmark('imageraster2d_save_montage', MONTAGE_COUNTS)
+def bench_imageraster2d_save_montage(count):
+    datums = [create_imageraster2d(MONTAGE_IMAGE_SIZE) for _ in range(count)]
+    plot = ImageRaster2DMontagePlot()
+    plot.add_colorbar()
+    plot.add_scalebar()
+    filepath = os.path.join(_get_tmpdir(), 'imageraster2d_montage.png')
+    return lambda: plot.save(filepath, datums)
+
+@benchmark('composite', IMAGE_SIZES)
+def bench_composite(size):
+    images = [create_imageraster2d(size).T for _ in range(3)]
+    return lambda: composite(images)
+
+@benchmark('analysis1d_plot', CHANNELS)
+def bench_analysis1d_plot(channels):
+    datum = create_analysis1d(channels)
+    plot = Analysis1DPlot()
+    return lambda: draw(plot.plot(datum))
+
+@benchmark('analysis1d_save', CHANNELS)
+def bench_analysis1d_save(channels):
+    datum = create_analysis1d(channels)
+    plot = Analysis1DPlot()
+    filepath = os.path.join(_get_tmpdir(), 'analysis1d.png')
+    return lambda: plot.save(filepath, datum)
+
+@benchmark('analysislist0d_plot', CHANNELS)
+def bench_analysislist0d_plot(count):
+    datum = create_analysislist0d(count)
+    plot = AnalysisList0DPlot()
+    return lambda: draw(plot.plot(datum))
+
+def _create_modest_image(size, **kwargs):
+    data = np.flipud(create_imageraster2d(size).T)
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes([0.0, 0.0, 1.0, 1.0])
+    imshow(ax, data, interpolation='none', **kwargs)
+    return fig, ax
+
+@benchmark('modest_image_draw', IMAGE_SIZES)
+def bench_modest_image_draw(size):
+    def run():
+        fig, _ax = _create_modest_image(size)
+        fig.canvas.draw()
+    return run
+
+def _pan(size, **kwargs):
+    fig, ax = _create_modest_image(size, **kwargs)
+    width = size // 4
+    ax.set_xlim(0, width)
+    ax.set_ylim(width, 0)
+    fig.canvas.draw()
+
+    def run():
+        for x0 in range(0, size - width, width // 4):
+            ax.set_xlim(x0, x0 + width)
+            fig.canvas.draw()
+    return run
+
+@benchmark('modest_image_pan', IMAGE_SIZES)
+def bench_modest_image_pan(size):
+    return _pan(size)
+
+@benchmark('modest_image_pan_tiled', IMAGE_SIZES)
+def bench_modest_image_pan_tiled(size):
+    return _pan(size, tile_size=256)
+
+@benchmark('modest_image_zoom', IMAGE_SIZES)
+def bench_modest_image_zoom(size):
+    fig, ax = _create_modest_image(size)
+    fig.canvas.draw()
+
+    def run():
+        width = size
+        while width >= 64:
+            ax.set_xlim(0, width)
+            ax.set_ylim(width, 0)
+            fig.canvas.draw()
+            width //= 2
+        while width <= size:
+            ax.set_xlim(0, width)
+            ax.set_ylim(width, 0)
+            fig.canvas.draw()
+            width *= 2
+    return run
+
+@benchmark('median_filter_scipy', KERNEL_SIZES)
+def bench_median_filter_scipy(size):
+    data = create_imageraster2d(MEDIAN_IMAGE_SIZE).T
+    return lambda: ndimage.median_filter(data, size)
+
+@benchmark('median_filter_histogram', KERNEL_SIZES)
+def bench_median_filter_histogram(size):
+    data = create_imageraster2d(MEDIAN_IMAGE_SIZE).T
+    return lambda: median_filter(data, size)
+
+@benchmark('median_filter_histogram_12bit', KERNEL_SIZES)
+def bench_median_filter_histogram_12bit(size):
+    # Many distinct values, as the maps of a 12-bit detector
+    random = np.random.RandomState(0)
+    data = random.randint(0, 4096, (MEDIAN_IMAGE_SIZE, MEDIAN_IMAGE_SIZE))
+    data = data.astype(np.uint16)
+    return lambda: median_filter(data, size)
+
+_tmpdir = None
+
+def _get_tmpdir():
+    global _tmpdir
+    if _tmpdir is None:
+        _tmpdir = tempfile.mkdtemp()
+    return _tmpdir
+
+def _get_commit():
+    basedir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         cwd=basedir, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode('ascii').strip()
+
+def measure(func, repeat):
+    """
+    Returns the wall times of *repeat* calls of *func* and the peak memory
+    allocated during one additional call.
+    """
+    func() # Warm up
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return times, peak
+
+def run(patterns=None, max_size=None, max_channels=None, repeat=3,
+        stream=sys.stdout):
+    """
+    Runs the benchmarks whose name matches one of the *patterns* and
+    returns the results.
+    """
+    results = []
+
+    for name, (setup, params) in BENCHMARKS.items():
+        if patterns and not any(fnmatch.fnmatch(name, p) for p in patterns):
+            continue
+
+        limit = None
+        if params is IMAGE_SIZES:
+            limit = max_size
+        elif params is CHANNELS:
+            limit = max_channels
+        for param in params:
+            if limit is not None and param > limit:
+                continue
+
+            times, peak = measure(setup(param), repeat)
+            result = OrderedDict()
+            result['name'] = name
+            result['param'] = param
+            result['times'] = times
+            result['best'] = min(times)
+            result['median'] = float(np.median(times))
+            result['peak_memory'] = peak
+            results.append(result)
+
+            stream.write('%-30s %10i %10.4f s %10.1f MB\n' % \
+                         (name, param, result['best'], peak / 2 ** 20))
+            stream.flush()
+
+    metadata = OrderedDict()
+    metadata['date'] = datetime.datetime.now().isoformat()
+    metadata['commit'] = _get_commit()
+    metadata['version'] = pyhmsa_plot.__version__
+    metadata['python'] = platform.python_version()
+    metadata['numpy'] = np.__version__
+    metadata['matplotlib'] = matplotlib.__version__
+    metadata['platform'] = platform.platform()
+    metadata['repeat'] = repeat
+
+    return OrderedDict([('metadata', metadata), ('results', results)])
+
+def compare(base, other, threshold=0.1, stream=sys.stdout):
+    """
+    Compares the results of two runs and returns the list of
+    ``(name, param)`` which are slower, or use more memory, by more than
+    *threshold* (fraction) in *other*.
+    """
+    base_results = dict(((r['name'], r['param']), r) for r in base['results'])
+    regressions = []
+
+    stream.write('%-30s %10s %10s %10s\n' % ('name', 'param', 'time', 'memory'))
+    for result in other['results']:
+        key = (result['name'], result['param'])
+        if key not in base_results:
+            continue
+        base_result = base_results[key]
+
+        time_ratio = result['best'] / base_result['best']
+        memory_ratio = result['peak_memory'] / max(1, base_result['peak_memory'])
+
+        flag = ''
+        if time_ratio > 1 + threshold or memory_ratio > 1 + threshold:
+            regressions.append(key)
+            flag = ' <--'
+
+        stream.write('%-30s %10i %9.2fx %9.2fx%s\n' % \
+                     (key[0], key[1], time_ratio, memory_ratio, flag))
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command')
+
+    parser_run = subparsers.add_parser('run', help='Run benchmarks')
+    parser_run.add_argument('patterns', nargs='*',
+                            help='Only run benchmarks matching these glob patterns')
+    parser_run.add_argument('-o', '--output', help='Path of JSON results')
+    parser_run.add_argument('--max-size', type=int,
+                            help='Maximum image width and height')
+    parser_run.add_argument('--max-channels', type=int,
+                            help='Maximum number of channels')
+    parser_run.add_argument('--repeat', type=int, default=3,
+                            help='Number of timed repetitions')
+
+    parser_compare = subparsers.add_parser('compare', help='Compare two runs')
+    parser_compare.add_argument('base', help='Path of base JSON results')
+    parser_compare.add_argument('other', help='Path of JSON results to compare')
+    parser_compare.add_argument('--threshold', type=float, default=0.1,
+                                help='Fraction above which a difference is a regression')
+
+    parser_list = subparsers.add_parser('list', help='List benchmarks')
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        try:
+            results = run(args.patterns, args.max_size, args.max_channels,
+                          args.repeat)
+        finally:
+            if _tmpdir is not None:
+                shutil.rmtree(_tmpdir, ignore_errors=True)
+
+        if args.output:
+            with open(args.output, 'w') as fp:
+                json.dump(results, fp, indent=2)
+
+    elif args.command == 'compare':
+        with open(args.base, 'r') as fp:
+            base = json.load(fp)
+        with open(args.other, 'r') as fp:
+            other = json.load(fp)
+
+        if compare(base, other, args.threshold):
+            sys.exit(1)
+
+    elif args.command == 'list':
+        for name, (_setup, params) in BENCHMARKS.items():
+            print('%-30s %s' % (name, ', '.join(map(str, params))))
+
+    else:
+        parser.print_help()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+"""
+Rendering of plots from :mod:`asyncio` code (e.g. a web service), without
+blocking the event loop::
+
+    renderer = AsyncRenderer(max_concurrency=4, memory_budget=2 * 1024 ** 3)
+    data = await renderer.render_bytes(plot, datum, 'png', key=session_id)
+
+The datums are plotted in a pool of threads managed by the renderer.
+A request waits until less than *max_concurrency* requests are running and
+until its estimated memory fits in the *memory_budget*.
+A request with the same *key* as a previous one (e.g. the same view of a
+client) cancels it, since its result is stale. A running request is
+interrupted at the start of its next stage (e.g. filtering, autoscaling or
+drawing, see :func:`stage <pyhmsa_plot.util.instrument.stage>`).
+
+Matplotlib is not thread-safe: the figures are drawn one at a time, while
+the datums are preprocessed (e.g. filtered and autoscaled) concurrently.
+The drawing of a renderer is therefore limited to one processor, and of
+all renderers of a process, since they share the same lock. To draw on
+several processors, run a renderer in each of several processes (e.g. the
+worker processes of the web server).
+"""
+
+# Standard library modules.
+import os
+import copy
+import asyncio
+import threading
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import concurrent.futures
+
+# Third party modules.
+
+# Local modules.
+from pyhmsa_plot.util.instrument import Recorder, record, count, bind
+
+# Globals and constants variables.
+
+# Estimated memory of a request, as a multiple of the size of its datums
+MEMORY_FACTOR = 4
+
+_draw_lock = threading.Lock()
+
+def estimate_memory(datum):
+    """
+    Returns the estimated memory (in bytes) required to plot *datum*, or a
+    list of datums (e.g. for a montage).
+    """
+    if isinstance(datum, (list, tuple)):
+        return sum(estimate_memory(d) for d in datum)
+    return int(getattr(datum, 'nbytes', 0)) * MEMORY_FACTOR
+
+class _Limiter(object):
+    """
+    Limits the number of running requests and the sum of their memory.
+    A request larger than the budget is only granted when no other request
+    is running. The requests are granted in order.
+    """
+
+    def __init__(self, max_concurrency=None, memory_budget=None):
+        self.max_concurrency = max_concurrency
+        self.memory_budget = memory_budget
+        self.running = 0
+        self.memory = 0
+        self._waiters = deque()
+
+    def _fits(self, nbytes):
+        if self.max_concurrency is not None and \
+                self.running >= self.max_concurrency:
+            return False
+        if self.memory_budget is not None and self.running > 0 and \
+                self.memory + nbytes > self.memory_budget:
+            return False
+        return True
+
+    def _grant(self, nbytes):
+        self.running += 1
+        self.memory += nbytes
+
+    def _wake(self):
+        while self._waiters:
+            future, nbytes = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(nbytes):
+                break
+            self._waiters.popleft()
+            self._grant(nbytes)
+            future.set_result(None)
+
+    async def acquire(self, nbytes):
+        if not self._waiters and self._fits(nbytes):
+            self._grant(nbytes)
+            return
+
+        future = asyncio.get_event_loop().create_future()
+        waiter = (future, nbytes)
+        self._waiters.append(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(nbytes) # Granted, but cancelled since
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+                self._wake()
+            raise
+
+    def release(self, nbytes):
+        self.running -= 1
+        self.memory -= nbytes
+        self._wake()
+
+class _Cancellation(Recorder):
+    """
+    Pseudo recorder interrupting a request at the start of its next stage,
+    once it is cancelled.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def check(self):
+        if self._event.is_set():
+            raise concurrent.futures.CancelledError
+
+    def start_stage(self, name):
+        self.check()
+
+    def add_duration(self, name, duration):
+        pass
+
+    def add_count(self, name, n=1):
+        pass
+
+def _execute(plot, datum, draw, cancellation):
+    """
+    Plots *datum* with a copy of *plot* and draws the figure with *draw*,
+    unless the request is cancelled (see :class:`_Cancellation`).
+    Runs in a thread of the renderer.
+    """
+    plot = copy.copy(plot)
+    with record(cancellation):
+        fig = plot._plot_export(datum)
+        if draw is None:
+            return fig
+
+        cancellation.check()
+        with _draw_lock:
+            cancellation.check()
+            return draw(plot, fig)
+
+class AsyncRenderer(object):
+    """
+    Renders plots in threads, from coroutines. The figures are drawn one
+    at a time in a process (see the module documentation).
+
+    :arg max_concurrency: maximum number of requests running at once
+        (default: number of processors)
+    :arg memory_budget: maximum estimated memory (in bytes) of the requests
+        running at once (see :func:`estimate_memory`), or ``None`` for no
+        limit
+    :arg executor: executor running the requests (default: a pool of
+        *max_concurrency* threads, shut down by :meth:`close`)
+    """
+
+    def __init__(self, max_concurrency=None, memory_budget=None,
+                 executor=None):
+        if max_concurrency is None:
+            max_concurrency = os.cpu_count() or 1
+        self._limiter = _Limiter(max_concurrency, memory_budget)
+        self._executor = executor
+        self._own_executor = executor is None
+        self._tasks = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self._limiter.max_concurrency)
+        return self._executor
+
+    def close(self):
+        """
+        Cancels the pending requests and shuts down the executor, if it was
+        created by the renderer.
+        """
+        for task in list(self._tasks.values()):
+            task.cancel()
+        if self._own_executor and self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def cancel(self, key):
+        """
+        Cancels the request with *key*, if any.
+        Returns whether a request was cancelled.
+        """
+        task = self._tasks.pop(key, None)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        count('aio.cancelled')
+        return True
+
+    async def _submit(self, plot, datum, draw, key, memory):
+        if memory is None:
+            memory = estimate_memory(datum)
+
+        if key is not None:
+            self.cancel(key) # Stale
+
+        task = asyncio.ensure_future(self._run(plot, datum, draw, memory))
+        if key is not None:
+            self._tasks[key] = task
+            task.add_done_callback(functools.partial(self._remove_task, key))
+        return await task
+
+    def _remove_task(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+    async def _run(self, plot, datum, draw, memory):
+        loop = asyncio.get_event_loop()
+        await self._limiter.acquire(memory)
+
+        release = True
+        try:
+            cancellation = _Cancellation()
+            future = self._get_executor().submit(
+                bind(_execute), plot, datum, draw, cancellation)
+            try:
+                return await asyncio.wrap_future(future, loop=loop)
+            except asyncio.CancelledError:
+                # A running request is interrupted at its next stage: its
+                # resources are released once it returns
+                cancellation.cancel()
+                if not future.cancel():
+                    release = False
+                    future.add_done_callback(lambda f: loop.call_soon_threadsafe(
+                        self._limiter.release, memory))
+                raise
+        finally:
+            if release:
+                self._limiter.release(memory)
+
+    async def plot(self, plot, datum, key=None, memory=None):
+        """
+        Plots *datum* with *plot* (see :meth:`_DatumPlot.plot
+        <pyhmsa_plot.spec.datum.datum._DatumPlot.plot>`) in a new figure and
+        returns it.
+
+        :arg key: key of the request; a pending request with the same key is
+            cancelled
+        :arg memory: estimated memory of the request in bytes (default: see
+            :func:`estimate_memory`)
+        """
+        return await self._submit(plot, datum, None, key, memory)
+
+    async def save(self, plot, filepath, datum, key=None, memory=None,
+                   **kwargs):
+        """
+        Plots and saves *datum* with *plot* to *filepath* (see
+        :meth:`_DatumPlot.save <pyhmsa_plot.spec.datum.datum._DatumPlot.save>`).
+        """
+        def draw(plot, fig):
+            plot._savefig(fig, filepath, **kwargs)
+        await self._submit(plot, datum, draw, key, memory)
+
+    async def render_bytes(self, plot, datum, format='png', key=None,
+                           memory=None, **kwargs):
+        """
+        Plots *datum* with *plot* and returns the content of the file in
+        *format* (see :meth:`_DatumPlot.render_bytes
+        <pyhmsa_plot.spec.datum.datum._DatumPlot.render_bytes>`).
+        """
+        def draw(plot, fig):
+            return plot._render_bytes(fig, format, **kwargs)
+        return await self._submit(plot, datum, draw, key, memory)
+
+    async def render_rgba(self, plot, datum, dpi=None, key=None, memory=None):
+        """
+        Plots *datum* with *plot* and returns the pixels of the figure (see
+        :meth:`_DatumPlot.render_rgba
+        <pyhmsa_plot.spec.datum.datum._DatumPlot.render_rgba>`).
+        """
+        def draw(plot, fig):
+            return plot._render_rgba(fig, dpi)
+        return await self._submit(plot, datum, draw, key, memory)
@@ -0,0 +1,404 @@
+"""
+Batch export of all the datums of HMSA data files::
+
+    results = export(['sample1.hmsa', 'sample2.hmsa'], 'figures',
+                     max_workers=4, callback=print)
+    failures = [result for result in results if result.error]
+
+Each datum is plotted by the plot registered for its class (see
+:data:`PLOT_CLASSES`). The datums are plotted in a pool of processes.
+Each process reads a data file once and reuses one figure per plot class.
+"""
+
+# Standard library modules.
+import os
+import re
+import sys
+import math
+import logging
+import argparse
+import hashlib
+import traceback
+import xml.etree.ElementTree as etree
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+# Third party modules.
+from pyhmsa.datafile import DataFile
+from pyhmsa.spec.datum.analysis import Analysis1D, Analysis2D
+from pyhmsa.spec.datum.analysislist import AnalysisList0D
+from pyhmsa.spec.datum.imageraster import ImageRaster2D
+
+# Local modules.
+from pyhmsa_plot.spec.datum.analysis import Analysis1DPlot, Analysis2DPlot
+from pyhmsa_plot.spec.datum.analysislist import AnalysisList0DPlot
+from pyhmsa_plot.spec.datum.imageraster import ImageRaster2DPlot
+
+# Globals and constants variables.
+logger = logging.getLogger(__name__)
+
+PLOT_CLASSES = OrderedDict([(ImageRaster2D, ImageRaster2DPlot),
+                            (Analysis1D, Analysis1DPlot),
+                            (Analysis2D, Analysis2DPlot),
+                            (AnalysisList0D, AnalysisList0DPlot)])
+MAX_CHUNKSIZE = 16
+
+ExportResult = namedtuple('ExportResult',
+                          ['source', 'identifier', 'filepath', 'error'])
+ExportResult.__doc__ = """
+Result of the export of a datum: the data file (*source*), the
+*identifier* of the datum, the exported *filepath* and the *error* message,
+or ``None`` if the export succeeded. If the data file could not be read,
+the identifier is ``None``. If the figure was not exported because its
+file is already used by another datum, *filepath* is this file.
+"""
+
+# State of a worker process, reused between chunks
+_datafile = None
+_plots = {}
+_figures = {}
+
+def get_plot_class(datum):
+    """
+    Returns the plot class registered in :data:`PLOT_CLASSES` for the
+    class of *datum* or, if none, for its closest base class.
+    Returns ``None`` if the datum cannot be plotted.
+    """
+    for clasz in type(datum).__mro__:
+        if clasz in PLOT_CLASSES:
+            return PLOT_CLASSES[clasz]
+    return None
+
+def read_identifiers(source):
+    """
+    Returns the identifiers of the datums of the data file *source*, in
+    order, from its XML file only.
+    """
+    filepath = os.path.splitext(source)[0] + '.xml'
+    root = etree.parse(filepath).getroot()
+    return [element.get('Name') for element in root.findall('Data/*')]
+
+def count_data(source):
+    """
+    Returns the number of datums of the data file *source*, from its XML
+    file only.
+    """
+    return len(read_identifiers(source))
+
+def create_filepath(outdir, source, identifier, format='png', name=None):
+    """
+    Returns the path of the exported figure of the datum *identifier* of
+    the data file *source*, ``<name>_<identifier>.<format>`` in *outdir*.
+    If the identifier contains characters which are not allowed in a file
+    name, they are replaced and a hash of the identifier is appended, so
+    that different identifiers give different file names.
+
+    :arg name: path of the data file relative to *outdir*, without
+        extension (default: base name of *source*)
+    """
+    if name is None:
+        name = os.path.splitext(os.path.basename(source))[0]
+    safe_identifier = re.sub(r'[^\w.-]+', '_', identifier)
+    if safe_identifier != identifier:
+        digest = hashlib.sha1(identifier.encode('utf8')).hexdigest()
+        safe_identifier += '-' + digest[:8]
+    return os.path.join(outdir, '%s_%s.%s' % (name, safe_identifier, format))
+
+def _read_datafile(source):
+    global _datafile
+    if _datafile is None or _datafile[0] != source:
+        _datafile = None # Release the previous data file first
+        _datafile = (source, list(DataFile.read(source).data.items()))
+    return _datafile[1]
+
+def _get_plot(plot_class, configure):
+    key = (plot_class, configure)
+    plot = _plots.get(key)
+    if plot is None:
+        plot = _plots[key] = plot_class()
+        if configure is not None:
+            configure(plot)
+    return plot
+
+def _save(plot, filepath, datum, savefig_kwargs):
+    # Reuse the figure of the plot class
+    plot_class = type(plot)
+    if plot_class in _figures:
+        fig, ax = _figures[plot_class]
+        plot._update_figure(fig, datum)
+    else:
+        fig, ax = _figures[plot_class] = plot._create_figure(datum)
+
+    plot.save(filepath, datum, ax, **savefig_kwargs)
+
+def _export_chunk(source, start, stop, name, outdir, format='png',
+                  configure=None, savefig_kwargs=None):
+    """
+    Exports the datums *start* to *stop* of the data file *source*.
+    Runs in a worker process.
+    """
+    if savefig_kwargs is None:
+        savefig_kwargs = {}
+
+    try:
+        items = _read_datafile(source)[start:stop]
+    except Exception as ex:
+        logger.debug('Cannot read %s', source, exc_info=True)
+        return [ExportResult(source, None, None, _format_error(ex))]
+
+    results = []
+    for identifier, datum in items:
+        plot_class = get_plot_class(datum)
+        if plot_class is None:
+            error = 'No plot for %s' % type(datum).__name__
+            results.append(ExportResult(source, identifier, None, error))
+            continue
+
+        filepath = create_filepath(outdir, source, identifier, format, name)
+        try:
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            plot = _get_plot(plot_class, configure)
+            _save(plot, filepath, datum, savefig_kwargs)
+        except Exception as ex:
+            logger.debug('Cannot export %s of %s', identifier, source,
+                         exc_info=True)
+            _figures.pop(plot_class, None) # May be in an invalid state
+            results.append(ExportResult(source, identifier, None,
+                                        _format_error(ex)))
+        else:
+            results.append(ExportResult(source, identifier, filepath, None))
+
+    return results
+
+def _format_error(ex):
+    return ''.join(traceback.format_exception_only(type(ex), ex)).strip()
+
+def _create_errors(chunk, error):
+    """
+    Returns an :class:`ExportResult` with *error* for each datum of the
+    *chunk*, which could not be exported by a worker.
+    """
+    source, start, stop, _name = chunk
+    try:
+        identifiers = read_identifiers(source)[start:stop]
+    except Exception:
+        identifiers = [None]
+    return [ExportResult(source, identifier, None, error)
+            for identifier in identifiers]
+
+def _split_chunks(chunks):
+    return [(source, index, index + 1, name)
+            for source, start, stop, name in chunks
+            for index in range(start, stop)]
+
+def _run_pool(chunks, max_workers, args, report):
+    """
+    Exports the *chunks* in a pool of *max_workers* processes and reports
+    the results of each chunk.
+    Returns the chunks which were not exported because a worker terminated
+    abruptly (e.g. killed when out of memory), breaking the pool.
+    """
+    broken = []
+    with ProcessPoolExecutor(max_workers) as executor:
+        futures = {executor.submit(_export_chunk, *chunk, *args): chunk
+                   for chunk in chunks}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                chunk_results = future.result()
+            except BrokenProcessPool:
+                broken.append(chunk)
+                continue
+            except Exception as ex:
+                logger.debug('Cannot export chunk %r', chunk, exc_info=True)
+                chunk_results = _create_errors(chunk, _format_error(ex))
+            report(chunk_results)
+
+    return broken
+
+def _claim_filepaths(filepaths, filepath_list, source):
+    """
+    Adds the *filepath_list* of *source* to *filepaths* (file path: data
+    file), unless one of them is already used by another data file.
+    Returns the error, if any.
+    """
+    for filepath in filepath_list:
+        other = filepaths.get(filepath, source)
+        if other != source:
+            return 'Output file %s already used by %s' % (filepath, other)
+    if len(set(filepath_list)) != len(filepath_list):
+        return 'Same output file for several datums'
+
+    for filepath in filepath_list:
+        filepaths[filepath] = source
+
+def _create_chunks(sources, outdir, format, max_workers, chunksize,
+                   names=None, identifiers=None, reserved=None):
+    """
+    Splits the datums of each data file in chunks, so that the chunks of a
+    data file are spread over the workers.
+    Returns the chunks as ``(source, start, stop, name)``, the results of
+    the data files which cannot be exported because their output files
+    would overwrite others, and the number of datums.
+    """
+    if names is None:
+        names = {}
+    if identifiers is None:
+        identifiers = {}
+    filepaths = dict(reserved or {})
+
+    chunks = []
+    errors = []
+    total = 0
+    for source in sources:
+        name = names.get(source)
+        source_identifiers = identifiers.get(source)
+        if source_identifiers is None:
+            try:
+                source_identifiers = read_identifiers(source)
+            except Exception:
+                logger.debug('Cannot read identifiers of %s', source,
+                             exc_info=True)
+
+        if source_identifiers is None:
+            count = 1 # The error is reported when reading the file
+        else:
+            count = len(source_identifiers)
+            filepath_list = [create_filepath(outdir, source, identifier,
+                                             format, name)
+                             for identifier in source_identifiers]
+            error = _claim_filepaths(filepaths, filepath_list, source)
+            if error:
+                errors.extend(ExportResult(source, identifier, filepath, error)
+                              for identifier, filepath
+                              in zip(source_identifiers, filepath_list))
+                total += count
+                continue
+
+        size = chunksize
+        if size is None:
+            size = int(math.ceil(count / max_workers))
+            size = max(1, min(MAX_CHUNKSIZE, size))
+        for start in range(0, count, size):
+            chunks.append((source, start, min(start + size, count), name))
+        total += count
+
+    return chunks, errors, total
+
+def export(sources, outdir, format='png', max_workers=None, chunksize=None,
+           configure=None, savefig_kwargs=None, callback=None, names=None,
+           identifiers=None, reserved=None):
+    """
+    Exports all the datums of the data files *sources* to *outdir* and
+    returns the :class:`ExportResult` of each datum.
+    A datum which cannot be exported is reported with its error, without
+    stopping the export of the others, even if it terminates its worker
+    process (e.g. out of memory).
+
+    :arg format: file format of the figures, e.g. ``'png'`` or ``'pdf'``
+    :arg max_workers: number of worker processes (default: number of
+        processors). With 1, the datums are exported in this process.
+    :arg chunksize: number of datums exported by a worker at once
+        (default: the datums of a data file split between the workers, at
+        most :data:`MAX_CHUNKSIZE`)
+    :arg configure: function called with each new plot, e.g. to add a
+        scalebar. It must be picklable (i.e. defined at module level).
+    :arg savefig_kwargs: keyword arguments passed to
+        :meth:`savefig <matplotlib.figure.Figure.savefig>`
+        (e.g. ``{'dpi': 150}``)
+    :arg callback: function called with each :class:`ExportResult`, the
+        number of datums exported so far and the total number of datums,
+        to report progress
+    :arg names: dictionary of the paths, relative to *outdir* and without
+        extension, used to name the figures of the data files (see
+        :func:`create_filepath`)
+    :arg identifiers: dictionary of the identifiers of the datums of the
+        data files, if already read (see :func:`read_identifiers`)
+    :arg reserved: dictionary of the existing output files of other data
+        files (file path: data file), which must not be overwritten
+
+    The datums of a data file whose figures would overwrite the figures of
+    another data file, or of another of its datums, are not exported and
+    are reported with an error.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    os.makedirs(outdir, exist_ok=True)
+
+    chunks, errors, total = \
+        _create_chunks(sources, outdir, format, max_workers, chunksize,
+                       names, identifiers, reserved)
+    args = (outdir, format, configure, savefig_kwargs)
+
+    results = []
+    def _report(chunk_results):
+        for result in chunk_results:
+            results.append(result)
+            if callback is not None:
+                callback(result, len(results), total)
+
+    _report(errors)
+
+    if max_workers == 1:
+        for chunk in chunks:
+            _report(_export_chunk(*chunk, *args))
+        return results
+
+    broken = _run_pool(chunks, max_workers, args, _report)
+    if not broken:
+        return results
+
+    # The chunks in the broken pool are exported again, one datum at a time.
+    # A datum which breaks the pool again is exported alone to know whether
+    # it is the cause.
+    logger.warning('Worker process terminated abruptly, '
+                   'exporting %i chunks again', len(broken))
+    broken = _run_pool(_split_chunks(broken), max_workers, args, _report)
+    for chunk in broken:
+        for chunk in _run_pool([chunk], 1, args, _report):
+            _report(_create_errors(chunk, 'Worker process terminated '
+                                          'abruptly (e.g. out of memory)'))
+
+    return results
+
+def _print_progress(result, done, total):
+    name = result.source
+    if result.identifier is not None:
+        name += ':' + result.identifier
+
+    if result.error:
+        print('[%i/%i] FAILED %s: %s' % (done, total, name, result.error),
+              file=sys.stderr)
+    else:
+        print('[%i/%i] %s -> %s' % (done, total, name, result.filepath))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Export all the datums of HMSA data files')
+    parser.add_argument('sources', nargs='+', metavar='FILE',
+                        help='HMSA data files')
+    parser.add_argument('-o', '--outdir', default='.',
+                        help='output directory (default: current directory)')
+    parser.add_argument('-f', '--format', default='png',
+                        help='file format of the figures (default: png)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes '
+                             '(default: number of processors)')
+    parser.add_argument('--dpi', type=float, default=None,
+                        help='resolution of the figures')
+    args = parser.parse_args(argv)
+
+    savefig_kwargs = {}
+    if args.dpi is not None:
+        savefig_kwargs['dpi'] = args.dpi
+
+    results = export(args.sources, args.outdir, args.format, args.jobs,
+                     savefig_kwargs=savefig_kwargs, callback=_print_progress)
+
+    failures = sum(1 for result in results if result.error)
+    print('%i exported, %i failed' % (len(results) - failures, failures))
+    return 1 if failures else 0
+
+if __name__ == '__main__': #pragma: no cover
+    sys.exit(main())
@@ -0,0 +1,384 @@
+"""
+Command-line renderer of HMSA data files, installed as ``pyhmsa-plot``::
+
+    pyhmsa-plot archive/ 'other/**/*.hmsa' -o figures -j 8
+
+Each datum is exported with the plot registered for its class (see
+:func:`export <pyhmsa_plot.batch.export>`). The directories of the data
+files, relative to the directory or glob pattern where they were found,
+are mirrored in the output directory.
+Runs are incremental: a manifest in the output directory records the size,
+modification time and content hash of each rendered data file, as well as
+its figures. A data file is rendered again only if its figures are missing
+or older than the data file and its content has changed. Each data file
+is recorded as soon as its figures are exported, so that an interrupted
+run resumes where it stopped.
+"""
+
+# Standard library modules.
+import os
+import sys
+import glob
+import json
+import hashlib
+import logging
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Third party modules.
+
+# Local modules.
+from pyhmsa_plot.batch import \
+    export, create_filepath, read_identifiers, _print_progress
+
+# Globals and constants variables.
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = '.pyhmsa-plot-manifest.jsonl'
+HASH_BLOCKSIZE = 2 ** 20
+
+def find_sources(paths):
+    """
+    Returns the HMSA data files of *paths*: files, directories (searched
+    recursively) or glob patterns (``**`` matches any subdirectory).
+    Each data file is returned once, with the extension ``.hmsa``, in a
+    dictionary with its path relative to the directory where it was found
+    (the directory itself, the directory of the file, or the directory
+    before the first wildcard of the pattern), without extension.
+    """
+    sources = OrderedDict()
+
+    def _add(filepath, rootdir):
+        root, ext = os.path.splitext(filepath)
+        if ext.lower() not in ('.hmsa', '.xml'):
+            return
+        source = os.path.abspath(root + '.hmsa')
+        if source not in sources:
+            sources[source] = os.path.relpath(os.path.abspath(root),
+                                              os.path.abspath(rootdir))
+
+    for path in paths:
+        rootdir = None
+        if glob.has_magic(path):
+            matches = sorted(glob.glob(path, recursive=True))
+            rootdir = path
+            while glob.has_magic(rootdir):
+                rootdir = os.path.dirname(rootdir)
+        else:
+            matches = [path]
+
+        for match in matches:
+            if not os.path.isdir(match):
+                _add(match, rootdir if rootdir is not None
+                     else os.path.dirname(match))
+                continue
+            for dirpath, dirnames, filenames in os.walk(match):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    _add(os.path.join(dirpath, filename),
+                         rootdir if rootdir is not None else match)
+
+    return sources
+
+def _get_filepaths(source):
+    root = os.path.splitext(source)[0]
+    return [root + '.xml', root + '.hmsa']
+
+def stat_source(source):
+    """
+    Returns the latest modification time (in nanoseconds) and the total
+    size of the XML and binary files of *source*.
+    """
+    mtime = 0
+    size = 0
+    for filepath in _get_filepaths(source):
+        st = os.stat(filepath)
+        mtime = max(mtime, st.st_mtime_ns)
+        size += st.st_size
+    return mtime, size
+
+def hash_source(source):
+    """
+    Returns the SHA-1 hash of the content of the XML and binary files of
+    *source*.
+    """
+    sha1 = hashlib.sha1()
+    for filepath in _get_filepaths(source):
+        with open(filepath, 'rb') as fp:
+            for block in iter(lambda: fp.read(HASH_BLOCKSIZE), b''):
+                sha1.update(block)
+    return sha1.hexdigest()
+
+class Manifest(object):
+    """
+    Journal of the rendered data files, stored as one JSON entry per line.
+    Entries are appended as data files are rendered; the last entry of a
+    data file replaces the previous ones.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._entries = {}
+        self._fp = None
+
+        if os.path.exists(filepath):
+            with open(filepath, 'r') as fp:
+                for line in fp:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError: # Truncated by an interruption
+                        logger.debug('Invalid manifest entry: %r', line)
+                        continue
+                    self._entries[entry['source']] = entry
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(list(self._entries.values()))
+
+    def get(self, source):
+        return self._entries.get(source)
+
+    def record(self, entry):
+        """
+        Adds the *entry* of a data file and appends it to the journal.
+        """
+        self._entries[entry['source']] = entry
+        if self._fp is None:
+            self._fp = open(self.filepath, 'a')
+        self._fp.write(json.dumps(entry) + '\n')
+        self._fp.flush()
+
+    def compact(self):
+        """
+        Rewrites the journal with only the last entry of each data file.
+        """
+        self.close()
+        tmpfilepath = self.filepath + '.tmp'
+        with open(tmpfilepath, 'w') as fp:
+            for entry in self._entries.values():
+                fp.write(json.dumps(entry) + '\n')
+        os.replace(tmpfilepath, self.filepath)
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+def _outputs_newer(outputs, mtime):
+    try:
+        return all(os.stat(output).st_mtime_ns >= mtime for output in outputs)
+    except OSError: # Missing output
+        return False
+
+def _stat_and_hash(source):
+    # Before hashing, so that a modification during the hash is detected
+    mtime, size = stat_source(source)
+    return mtime, size, hash_source(source)
+
+def _read_identifiers(source):
+    try:
+        return read_identifiers(source)
+    except Exception:
+        logger.debug('Cannot read identifiers of %s', source, exc_info=True)
+        return None # The error is reported by the export
+
+def is_current(source, entry, options, outdir, format, retry=False,
+               name=None, owners=None, identifiers=None):
+    """
+    Returns whether the figures of *source* are up to date, given its
+    manifest *entry* (or ``None``), and the updated entry, if any.
+    The figures are named after *name* (see
+    :func:`create_filepath <pyhmsa_plot.batch.create_filepath>`).
+    Figures recorded for another data file in *owners* (file path: data
+    file) are never considered as figures of *source*.
+
+    :arg identifiers: identifiers of the datums of *source*, if already
+        read (only required without *entry*)
+    """
+    try:
+        mtime, size = stat_source(source)
+    except OSError:
+        return False, None # The error is reported by the export
+
+    if entry is None:
+        # Figures from a previous export without manifest
+        if identifiers is None:
+            identifiers = _read_identifiers(source)
+        if not identifiers:
+            return False, None
+        outputs = [create_filepath(outdir, source, identifier, format, name)
+                   for identifier in identifiers]
+        if owners is not None and \
+                any(owners.get(output, source) != source for output in outputs):
+            return False, None
+        return _outputs_newer(outputs, mtime), None
+
+    if entry['options'] != options or (retry and entry['errors']):
+        return False, None
+
+    outputs = entry['outputs']
+    if entry['mtime'] == mtime and entry['size'] == size:
+        return all(os.path.exists(output) for output in outputs), None
+
+    # Touched or modified since the last run
+    if size == entry['size'] and \
+            (_outputs_newer(outputs, mtime) or hash_source(source) == entry['hash']):
+        return True, dict(entry, mtime=mtime)
+
+    return False, None
+
+def render(sources, outdir, format='png', max_workers=None, dpi=None,
+           force=False, retry=False, callback=None, names=None):
+    """
+    Exports the datums of the data files *sources* which are not up to date
+    in *outdir* (see :func:`is_current`), records them in the manifest
+    and returns the :class:`ExportResult <pyhmsa_plot.batch.ExportResult>`
+    of each exported datum and the number of up to date data files.
+    The XML file of each data file is read at most once. The data files
+    are hashed in threads, while they are exported.
+
+    :arg force: whether to export all data files
+    :arg retry: whether to export again the data files with errors
+    :arg names: dictionary of the relative paths used to name the figures
+        of the data files (see :func:`find_sources`)
+    """
+    if names is None:
+        names = {}
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    outdir = os.path.abspath(outdir)
+    os.makedirs(outdir, exist_ok=True)
+    manifest = Manifest(os.path.join(outdir, MANIFEST_FILENAME))
+    options = {'format': format, 'dpi': dpi}
+
+    # Figures of each data file, which must not be overwritten by another
+    owners = {}
+    for entry in manifest:
+        for output in entry['outputs']:
+            owners[output] = entry['source']
+
+    # Select the data files to export
+    identifiers = {}
+    pending = []
+    current = 0
+    for source in sources:
+        if not force:
+            entry = manifest.get(source)
+            if entry is None:
+                identifiers[source] = _read_identifiers(source)
+            uptodate, entry = is_current(source, entry, options, outdir,
+                                         format, retry, names.get(source),
+                                         owners, identifiers.get(source))
+            if entry is not None:
+                manifest.record(entry)
+            if uptodate:
+                current += 1
+                continue
+        pending.append(source)
+
+    states = {}
+    for source in pending:
+        if source not in identifiers:
+            identifiers[source] = _read_identifiers(source)
+        if identifiers[source] is not None:
+            states[source] = {'source': source, 'options': options,
+                              'outputs': [], 'errors': 0,
+                              'remaining': len(identifiers[source])}
+
+    def _record(state):
+        try:
+            mtime, size, digest = state['hash'].result()
+        except OSError:
+            logger.debug('Cannot hash %s', state['source'], exc_info=True)
+            return
+
+        entry = dict(state, mtime=mtime, size=size, hash=digest)
+        del entry['remaining']
+        manifest.record(entry)
+
+    def _callback(result, done, total):
+        state = states.get(result.source)
+        if state is not None:
+            if result.identifier is None or result.filepath is not None and \
+                    result.error:
+                # Data file cannot be read or its figures would overwrite
+                # others: reported again at the next run
+                del states[result.source]
+            else:
+                if result.error:
+                    state['errors'] += 1
+                else:
+                    state['outputs'].append(result.filepath)
+                state['remaining'] -= 1
+                if state['remaining'] == 0:
+                    _record(state)
+
+        if callback is not None:
+            callback(result, done, total)
+
+    savefig_kwargs = {}
+    if dpi is not None:
+        savefig_kwargs['dpi'] = dpi
+
+    try:
+        with ThreadPoolExecutor(max_workers) as hasher:
+            for source, state in states.items():
+                state['hash'] = hasher.submit(_stat_and_hash, source)
+                if state['remaining'] == 0:
+                    _record(state)
+
+            results = export(pending, outdir, format, max_workers,
+                             savefig_kwargs=savefig_kwargs, callback=_callback,
+                             names=names, identifiers=identifiers,
+                             reserved=owners)
+    finally:
+        manifest.compact()
+
+    return results, current
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='pyhmsa-plot',
+        description='Render the datums of HMSA data files. Only the data '
+                    'files changed since the last run are rendered.')
+    parser.add_argument('paths', nargs='+', metavar='PATH',
+                        help='HMSA data files, directories or glob patterns')
+    parser.add_argument('-o', '--outdir', default='.',
+                        help='output directory (default: current directory)')
+    parser.add_argument('-f', '--format', default='png',
+                        help='file format of the figures (default: png)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes '
+                             '(default: number of processors)')
+    parser.add_argument('--dpi', type=float, default=None,
+                        help='resolution of the figures')
+    parser.add_argument('--force', action='store_true',
+                        help='render all data files')
+    parser.add_argument('--retry', action='store_true',
+                        help='render again the data files with errors')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='only report errors')
+    args = parser.parse_args(argv)
+
+    sources = find_sources(args.paths)
+    if not sources:
+        parser.error('No HMSA data file found')
+
+    def _callback(result, done, total):
+        if result.error or not args.quiet:
+            _print_progress(result, done, total)
+
+    results, current = render(list(sources), args.outdir, args.format,
+                              args.jobs, args.dpi, args.force, args.retry,
+                              _callback, sources)
+
+    failures = sum(1 for result in results if result.error)
+    print('%i exported, %i failed, %i data files up to date' %
+          (len(results) - failures, failures, current))
+    return 1 if failures else 0
+
+if __name__ == '__main__': #pragma: no cover
+    sys.exit(main())
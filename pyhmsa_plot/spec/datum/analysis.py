@@ -12,6 +12,7 @@ from matplotlib_colorbar.colorbar import Colorbar
 # Local modules.
 from pyhmsa_plot.spec.datum.datum import _DatumPlot
 from pyhmsa_plot.util.modest_image import imshow
+from pyhmsa_plot.util.colormap import get_cmap
 
 # Globals and constants variables.
 
@@ -38,7 +39,7 @@ class Analysis1DPlot(_DatumPlot):
         # Draw
         colors = matplotlib.rcParams['axes.prop_cycle'].by_key()['color']
 
-        ax.plot(xy[:, 0], xy[:, 1], lw=2, color=colors[0], zorder=1)
+        line, = ax.plot(xy[:, 0], xy[:, 1], lw=2, color=colors[0], zorder=1)
 
         for x in self._selected_xs:
             ax.axvline(x, lw=3, color=colors[1], zorder=3)
@@ -50,6 +51,25 @@ class Analysis1DPlot(_DatumPlot):
         ax.set_xlabel(xlabel)
         ax.set_ylabel(ylabel)
 
+        return {'key': self._get_update_key(), 'line': line}
+
+    def _get_update_key(self):
+        return (tuple(self._selected_xs), tuple(self._selected_ranges))
+
+    def _update(self, datum, ax, state):
+        line = state['line']
+        if line not in ax.lines or self._get_update_key() != state['key']:
+            return False
+
+        xy = datum.get_xy()
+        line.set_data(xy[:, 0], xy[:, 1])
+        ax.relim()
+        ax.autoscale_view()
+
+        ax.set_xlabel(datum.get_xlabel())
+        ax.set_ylabel(datum.get_ylabel())
+        return True
+
 class Analysis2DPlot(_DatumPlot):
 
     def __init__(self):
@@ -63,14 +83,10 @@ class Analysis2DPlot(_DatumPlot):
     def _create_axes(self, fig, datum):
         return fig.add_axes([0.0, 0.0, 1.0, 1.0])
 
-    def _create_figure(self, datum):
-        fig, ax = _DatumPlot._create_figure(self, datum)
-
+    def _update_figure(self, fig, datum):
         width, height = datum.shape
         fig.set_figheight(fig.get_figwidth() * height / width)
 
-        return fig, ax
-
     def _plot(self, datum, ax):
         # Setup axes
         ax.xaxis.set_visible(False)
@@ -84,10 +100,40 @@ class Analysis2DPlot(_DatumPlot):
                          interpolation='none',
                          vmin=self.vmin, vmax=self.vmax)
 
+        colorbar = None
         if self._colorbar_kwargs is not None:
             colorbar = Colorbar(aximage, **self._colorbar_kwargs)
             ax.add_artist(colorbar)
 
+        artists = [colorbar] if colorbar is not None else []
+        return {'key': self._get_update_key(datum), 'image': aximage,
+                'colorbar': colorbar, 'artists': artists}
+
+    def _get_update_key(self, datum):
+        return (datum.shape, self._colorbar_kwargs)
+
+    def _update(self, datum, ax, state):
+        image = state['image']
+        if image not in ax.images or \
+                any(artist not in ax.artists for artist in state['artists']) or \
+                self._get_update_key(datum) != state['key']:
+            return False
+
+        image.set_data(np.flipud(datum.T))
+
+        # The observers of the image (e.g. colorbar) are notified once
+        image.cmap = get_cmap(self.cmap)
+        image.norm.vmin = self.vmin
+        image.norm.vmax = self.vmax
+        if self.vmin is None or self.vmax is None:
+            image.autoscale_None()
+        else:
+            image.changed()
+        if state['colorbar'] is not None:
+            state['colorbar'].set_mappable(image)
+
+        return True
+
     def add_colorbar(self, **kwargs):
         if self._colorbar_kwargs is not None:
             raise ValueError('Colorbar already defined')
@@ -19,8 +19,23 @@ class AnalysisList0DPlot(_DatumPlot):
         ylabel = datum.get_ylabel()
 
         # Draw
-        ax.plot(xs, ys, zorder=1)
+        line, = ax.plot(xs, ys, zorder=1)
 
         # Labels
         ax.set_xlabel(xlabel)
         ax.set_ylabel(ylabel)
+
+        return {'line': line}
+
+    def _update(self, datum, ax, state):
+        line = state['line']
+        if line not in ax.lines:
+            return False
+
+        line.set_data(np.arange(len(datum)), datum[:, 0])
+        ax.relim()
+        ax.autoscale_view()
+
+        ax.set_xlabel(datum.get_xlabel())
+        ax.set_ylabel(datum.get_ylabel())
+        return True
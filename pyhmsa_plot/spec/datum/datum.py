@@ -1,35 +1,72 @@
 """"""
 
 # Standard library modules.
+import io
 import os
 import abc
+import weakref
 
 # Third party modules.
+import numpy as np
 
 # Local modules.
 import matplotlib.backend_bases
 from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from pyhmsa_plot.util.instrument import stage, count
 
 # Globals and constants variables.
 
 class _DatumPlot(object, metaclass=abc.ABCMeta):
 
+    def __init__(self):
+        self._states = weakref.WeakKeyDictionary()
+
+    def __copy__(self):
+        # The copy shares the settings and caches, but not the plotted axes
+        other = self.__class__.__new__(self.__class__)
+        other.__dict__.update(self.__dict__)
+        other._states = weakref.WeakKeyDictionary()
+        return other
+
     def _create_axes(self, fig, datum):
         return fig.add_subplot("111")
 
     def _create_figure(self, datum):
         fig = Figure()
         ax = self._create_axes(fig, datum)
+        self._update_figure(fig, datum)
         return fig, ax
 
+    def _update_figure(self, fig, datum):
+        """
+        Adapts the figure *fig* (e.g. its size) to *datum*, so that a figure
+        created for another datum can be reused.
+        """
+        pass
+
     @abc.abstractmethod
     def _plot(self, datum, ax):
         """
         Performs the actual plotting of *datum* in *ax*.
+        Returns the state required by :meth:`_update` to update the plot
+        with another datum (e.g. the artists), or ``None``.
         """
         raise NotImplementedError
 
-    def plot(self, datum, ax=None):
+    def _update(self, datum, ax, state):
+        """
+        Updates the plot in *ax*, described by the *state* returned by
+        :meth:`_plot`, with *datum*, by changing the data of the existing
+        artists.
+        Returns ``False`` if the plot cannot be updated (e.g. the datum or
+        the settings are not compatible), in which case it is plotted
+        again from scratch.
+        """
+        return False
+
+    def plot(self, datum, ax=None, update=False):
         """
         Plots the datum in a matplotlib :class:`Axes <matplotlib.axes.Axes>`.
         If no *ax* is specified a figure and axes is created.
@@ -39,34 +76,122 @@ class _DatumPlot(object, metaclass=abc.ABCMeta):
         
         :arg ax: matplotlib's Axes (optional)
         :type ax: class:`Axes <matplotlib.axes.Axes>`
+
+        :arg update: if ``True`` and *ax* already shows a datum plotted by
+            this object, only the data of the artists is replaced, instead of
+            clearing the axes and creating new artists. The datum must be
+            compatible with the previous one (e.g. same shape for a map) and
+            the settings of the plot must not have changed, otherwise the
+            datum is plotted from scratch.
         
         :return: matplotlib's Figure
         :rtype: :class:`matplotlib.figure.Figure`
         """
         if ax is None:
-            fig, ax = self._create_figure(datum)
+            with stage('create_figure'):
+                fig, ax = self._create_figure(datum)
         else:
             fig = ax.get_figure()
 
-        ax.clear()
-        self._plot(datum, ax)
+            state = self._states.get(ax) if update else None
+            if state is not None:
+                with stage('update'):
+                    updated = self._update(datum, ax, state)
+                if updated:
+                    count('update.hit')
+                    return fig
+                count('update.miss')
+
+        with stage('clear'):
+            ax.clear()
+        with stage('plot'):
+            state = self._plot(datum, ax)
+
+        if state is None:
+            self._states.pop(ax, None)
+        else:
+            self._states[ax] = state
 
         return fig
 
+    def _plot_export(self, datum, ax=None):
+        """
+        Plots the *datum* to be saved or rendered to memory.
+        """
+        return self.plot(datum, ax)
+
     def save(self, filepath, datum, ax=None, canvas_class=None, *args, **kwargs):
         """
         Plots and saves the *datum* to the specified *filepath*.
         """
-        fig = self.plot(datum, ax)
+        fig = self._plot_export(datum, ax)
+        self._savefig(fig, filepath, canvas_class, *args, **kwargs)
+
+    def render_bytes(self, datum, format='png', ax=None, *args, **kwargs):
+        """
+        Plots the *datum* and returns the content of the file that
+        :meth:`save` would write, in *format* (e.g. ``'png'``, ``'svg'``
+        or ``'pdf'``), without writing to the file system.
+        Other arguments are passed to
+        :meth:`savefig <matplotlib.figure.Figure.savefig>`.
+        """
+        fig = self._plot_export(datum, ax)
+        return self._render_bytes(fig, format, *args, **kwargs)
+
+    def render_rgba(self, datum, ax=None, dpi=None):
+        """
+        Plots the *datum*, draws it on an Agg canvas at *dpi* (default: the
+        resolution of the figure) and returns the pixels as a
+        ``(height, width, 4)`` uint8 array.
+        The array is a view of the buffer of the canvas, without copy: it is
+        overwritten if the canvas of the figure is drawn again.
+        """
+        fig = self._plot_export(datum, ax)
+        return self._render_rgba(fig, dpi)
 
+    def _savefig(self, fig, filepath, canvas_class=None, *args, **kwargs):
+        """
+        Saves the figure *fig* to the specified *filepath*, with a canvas of
+        *canvas_class* or, if ``None``, of the class registered for the
+        extension of *filepath*.
+        """
         if canvas_class is None:
             ext = os.path.splitext(filepath)[1][1:]
             canvas_class = matplotlib.backend_bases.get_registered_canvas_class(ext)
 
         canvas_class(fig)
-        fig.savefig(filepath, *args, **kwargs)
+        with stage('savefig'):
+            fig.savefig(filepath, *args, **kwargs)
 
-        if ax is None:
-            del fig
-            del canvas_class
+    def _render_bytes(self, fig, format='png', *args, **kwargs):
+        """
+        Returns the content of the file of the figure *fig* in *format*.
+        """
+        canvas_class = \
+            matplotlib.backend_bases.get_registered_canvas_class(format)
+        if canvas_class is None:
+            raise ValueError('Unsupported format: %s' % format)
+
+        buffer = io.BytesIO()
+        self._savefig(fig, buffer, canvas_class, *args, format=format,
+                      **kwargs)
+        return buffer.getvalue()
+
+    def _render_rgba(self, fig, dpi=None):
+        """
+        Draws the figure *fig* on an Agg canvas at *dpi* and returns a view of
+        its buffer.
+        """
+        canvas = FigureCanvasAgg(fig)
+
+        original_dpi = fig.dpi
+        if dpi is not None:
+            fig.dpi = dpi
+        try:
+            with stage('draw'):
+                canvas.draw()
+        finally:
+            fig.dpi = original_dpi
+
+        return np.asarray(canvas.buffer_rgba())
 
@@ -1,6 +1,9 @@
 """"""
 
 # Standard library modules.
+import math
+import weakref
+import warnings
 
 # Third party modules.
 from matplotlib_colorbar.colorbar import Colorbar
@@ -8,15 +11,34 @@ from matplotlib_scalebar.scalebar import ScaleBar
 
 import numpy as np
 
-import scipy.ndimage as ndimage
+import matplotlib
+import matplotlib.cbook as cbook
+from matplotlib.figure import Figure
+from matplotlib.colors import Normalize, to_rgba
+from matplotlib.patches import Patch
 
 from pyhmsa.type.numerical import convert_unit
 
 # Local modules.
 from pyhmsa_plot.spec.datum.datum import _DatumPlot
-from pyhmsa_plot.util.modest_image import imshow
+from pyhmsa_plot.util.modest_image import \
+    imshow, downsample, has_invalid, reduction_dtype, REDUCTIONS, is_native
+from pyhmsa_plot.util.colormap import apply_colormap, get_cmap
+from pyhmsa_plot.util.scalebar import burn_scalebar
+from pyhmsa_plot.util.imagefile import write_image
+from pyhmsa_plot.util.memmap import is_memmap, create_memmap
+from pyhmsa_plot.util.filters import filter_tiled
+from pyhmsa_plot.util.instrument import stage, count
+from pyhmsa_plot.util.cache import LRUCache
+from pyhmsa_plot.util.autoscale import \
+    percentiles, lower_percentile, SAMPLE_SIZE
+from pyhmsa_plot.util.composite import composite, COLORS
+from pyhmsa_plot.util.pipeline import \
+    Pipeline, MedianFilter, MEDIAN_FILTER_ENGINES
 
 # Globals and constants variables.
+CACHE_SIZE = 4
+LIMITS_CACHE_SIZE = 128
 
 class ImageRaster2DPlot(_DatumPlot):
 
@@ -26,39 +48,355 @@ class ImageRaster2DPlot(_DatumPlot):
         self.cmap = None
         self.vmin = None
         self.vmax = None
+        self.percentiles = None
+        self.percentiles_method = 'sample'
+        self.reduction = 'stride'
+        self.dtype = None
+        self.tile_size = None
+        self.prefetch = False
+        self.filter_executor = None
+        self.pipeline = Pipeline()
+        self.lazy_pipeline = False
         self.unit = 'm'
         self._colorbar_kwargs = None
         self._scalebar_kwargs = None
         self._median_filter_kwargs = None
+        self._median_filter_engine = None
+        self._cache = LRUCache(CACHE_SIZE)
+        self._limits_cache = LRUCache(LIMITS_CACHE_SIZE)
+        self._exporting = False
 
     def _create_axes(self, fig, datum):
         return fig.add_axes([0.0, 0.0, 1.0, 1.0])
 
-    def _create_figure(self, datum):
-        fig, ax = _DatumPlot._create_figure(self, datum)
-
+    def _update_figure(self, fig, datum):
         width, height = datum.shape
         fig.set_figheight(fig.get_figwidth() * height / width)
 
-        return fig, ax
-
     def _plot(self, datum, ax):
         # Setup axes
         ax.xaxis.set_visible(False)
         ax.yaxis.set_visible(False)
 
         # Plot
-        datum, extent = self._calculate_extent(datum)
-        datum = self._apply_median(datum)
-
-        aximage = imshow(ax, datum, cmap=self.cmap, extent=extent,
-                         interpolation='none',
-                         vmin=self.vmin, vmax=self.vmax)
-
-        self._apply_scalebar(datum, ax, extent)
-        self._apply_colorbar(datum, ax, aximage)
+        median, eager, lazy = self._split_pipeline()
+        data, extent, flip = self._preprocess(datum, eager, median)
+
+        with stage('autoscale'):
+            vmin, vmax = self._calculate_limits(datum, data, eager, median)
+
+        with stage('imshow'):
+            aximage = imshow(ax, data, cmap=self.cmap, extent=extent,
+                             interpolation='none',
+                             vmin=vmin, vmax=vmax,
+                             reduction=self.reduction,
+                             dtype=self.dtype,
+                             tile_size=self.tile_size,
+                             prefetch=self.prefetch,
+                             flip=flip,
+                             pipeline=lazy)
+
+        with stage('scalebar'):
+            scalebar = self._apply_scalebar(data, ax, extent)
+        with stage('colorbar'):
+            colorbar = self._apply_colorbar(data, ax, aximage)
+
+        artists = [artist for artist in (scalebar, colorbar) if artist is not None]
+        return {'key': self._get_update_key(data, extent),
+                'image': aximage, 'colorbar': colorbar, 'artists': artists}
+
+    def _get_update_key(self, data, extent):
+        """
+        Returns the settings which must not change to update a plot with
+        another map.
+        """
+        return (data.shape, extent is None,
+                self.get_colorbar_kwargs() if self.has_colorbar() else None,
+                self.get_scalebar_kwargs() if self.has_scalebar() else None)
+
+    def _update(self, datum, ax, state):
+        image = state['image']
+        if image not in ax.images or \
+                any(artist not in ax.artists for artist in state['artists']):
+            return False
+
+        median, eager, lazy = self._split_pipeline()
+        data, extent, flip = self._preprocess(datum, eager, median)
+        if self._get_update_key(data, extent) != state['key']:
+            return False
+
+        with stage('autoscale'):
+            vmin, vmax = self._calculate_limits(datum, data, eager, median)
+
+        # Settings first, so that the pyramid is only rebuilt by set_data
+        with stage('set_data'):
+            image.set_reduction(self.reduction)
+            image.set_dtype(self.dtype)
+            image.set_tile_size(self.tile_size)
+            image.set_prefetch(self.prefetch)
+            image.set_flip(flip)
+            image.set_pipeline(lazy)
+            image.set_data(data)
+            if extent is not None:
+                image.set_extent(extent)
+
+            # The observers of the image (e.g. colorbar) are notified once
+            image.cmap = get_cmap(self.cmap)
+            image.norm.vmin = vmin
+            image.norm.vmax = vmax
+            if vmin is None or vmax is None:
+                image.autoscale_None()
+            else:
+                image.changed()
+            if state['colorbar'] is not None:
+                state['colorbar'].set_mappable(image)
+
+        return True
+
+    def save(self, filepath, datum, ax=None, canvas_class=None, *args, **kwargs):
+        """
+        Plots and saves the *datum* to the specified *filepath*.
+        The preprocessing pipeline is always applied at full resolution,
+        even if :attr:`lazy_pipeline` is set.
+        """
+        _DatumPlot.save(self, filepath, datum, ax, canvas_class,
+                        *args, **kwargs)
+
+    def _plot_export(self, datum, ax=None):
+        self._exporting = True
+        try:
+            return self.plot(datum, ax)
+        finally:
+            self._exporting = False
+
+    def render_thumbnail(self, datum, size=None):
+        """
+        Returns the map as displayed by :meth:`plot`, without axes nor
+        colorbar, as a RGB uint8 array, at most *size* pixels along its
+        longest side (default: full resolution).
+        The map is rendered directly from the array, without matplotlib's
+        figure: it is downsampled as by the image (see :attr:`reduction`
+        and :attr:`dtype`), colormapped through a lookup table and the
+        scalebar, if any, is drawn in its pixels (see
+        :func:`burn_scalebar <pyhmsa_plot.util.scalebar.burn_scalebar>`).
+        Transparent pixels (e.g. non-finite values) are composited over the
+        ``savefig.facecolor`` or, if it is ``'auto'``, the
+        ``figure.facecolor``.
+        """
+        median, eager, lazy = self._split_pipeline()
+        data, extent, flip = self._preprocess(datum, eager, median)
+
+        with stage('autoscale'):
+            vmin, vmax = self._calculate_limits(datum, data, eager, median)
+
+        # Downsample the map in the displayed orientation, as the image
+        with stage('thumbnail.downsample'):
+            flip_x, flip_y = flip
+            A = data[::-1 if flip_y else 1, ::-1 if flip_x else 1]
+
+            factor = 1
+            if size is not None:
+                factor = max(1, int(math.ceil(max(A.shape) / size)))
+
+            dtype = None
+            if self.dtype is not None:
+                dtype = A.dtype if is_native(self.dtype) else self.dtype
+                dtype = reduction_dtype(self.reduction, dtype)
+
+            if factor > 1 or dtype is not None:
+                A = downsample(A, factor, REDUCTIONS.get(self.reduction), dtype)
+            if self.reduction == 'sum' and factor > 1:
+                A = A / factor ** 2
+            if lazy:
+                A = lazy.apply(np.asarray(A), factor)
+
+        with stage('thumbnail.colormap'):
+            A = np.asarray(A)
+            if A.dtype.kind not in 'biu' and has_invalid(A):
+                A = cbook.safe_masked_invalid(A)
+
+            norm = Normalize(vmin, vmax)
+            if vmin is None or vmax is None:
+                norm.autoscale_None(A if lazy else data)
+
+            rgba = apply_colormap(A, get_cmap(self.cmap), norm)
+            rgb = self._flatten_alpha(rgba)
+
+        if self.has_scalebar() and extent is not None:
+            with stage('thumbnail.scalebar'):
+                dx = abs(extent[1] - extent[0]) / rgb.shape[1]
+                burn_scalebar(rgb, ScaleBar(dx, **self._scalebar_kwargs))
+
+        return rgb
+
+    def _flatten_alpha(self, rgba):
+        alpha = rgba[..., 3]
+        if (alpha == 255).all():
+            return np.ascontiguousarray(rgba[..., :3])
+
+        facecolor = matplotlib.rcParams['savefig.facecolor']
+        if isinstance(facecolor, str) and facecolor == 'auto': # mpl >= 3.3
+            facecolor = matplotlib.rcParams['figure.facecolor']
+        background = np.array(to_rgba(facecolor)[:3])
+        alpha = alpha[..., np.newaxis] / 255.0
+        rgb = rgba[..., :3] * alpha + background * 255.0 * (1.0 - alpha)
+        return np.round(rgb).astype(np.uint8)
+
+    def save_thumbnail(self, filepath, datum, size=None, format=None, **kwargs):
+        """
+        Renders the *datum* with :meth:`render_thumbnail` and writes it to
+        the specified *filepath*, as PNG or, if Pillow is installed, JPEG.
+        The *format* is guessed from the extension of *filepath* if not
+        specified. Other keyword arguments are passed to the encoder (see
+        :func:`encode_image <pyhmsa_plot.util.imagefile.encode_image>`).
+        """
+        rgb = self.render_thumbnail(datum, size)
+        with stage('thumbnail.write'):
+            write_image(filepath, rgb, format, **kwargs)
+
+    def _split_pipeline(self):
+        """
+        Returns whether the median filter is applied to the full resolution
+        map before plotting, the part of the pipeline applied to the full
+        resolution map and the part evaluated lazily by the image, on the
+        visible region only.
+        With :attr:`lazy_pipeline`, the median filter is also evaluated
+        lazily.
+        """
+        if not self.lazy_pipeline or self._exporting:
+            return True, self.pipeline, Pipeline()
+
+        stages = []
+        if self.has_median_filter():
+            stages.append(self._get_median_filter())
+        stages.extend(self.pipeline)
+
+        eager, lazy = Pipeline(stages).split()
+        return False, eager, lazy
+
+    def _preprocess(self, datum, pipeline=None, median=True):
+        """
+        Returns the map to display, its extent and flip (see
+        :meth:`_calculate_extent`), after the median filter (if *median*)
+        and the *pipeline* are applied.
+        Filtered maps are cached per datum and filter parameters, so that
+        plotting the same datum again with other display settings (e.g.
+        colormap, limits, colorbar) does not filter it again.
+        """
+        if pipeline is None:
+            pipeline = Pipeline()
+
+        with stage('calculate_extent'):
+            data, extent, flip = self._calculate_extent(datum)
+
+        median = median and self.has_median_filter()
+        if not median and not pipeline:
+            return data, extent, flip
+
+        key = self._get_cache_key(datum, flip) + (median, pipeline.get_key())
+        entry = self._cache.get(key)
+        if entry is not None and entry[0]() is datum:
+            count('imageraster.cache_hit')
+            return entry[1], extent, flip
+        count('imageraster.cache_miss')
+
+        if median:
+            with stage('apply_median'):
+                data = self._apply_median(data, flip)
+        with stage('apply_pipeline'):
+            data = pipeline.apply(data, flip=flip,
+                                  executor=self.filter_executor)
+
+        # Discard the filtered map as soon as the datum is deleted
+        cache = self._cache
+        ref = weakref.ref(datum, lambda _ref: cache.pop(key))
+        cache.put(key, (ref, data))
+
+        return data, extent, flip
+
+    def _calculate_limits(self, datum, data, pipeline, median):
+        """
+        Returns the color limits. Unless specified by :attr:`vmin` and
+        :attr:`vmax`, they are the :attr:`percentiles` (low, high) of the
+        preprocessed map *data*, calculated with the
+        :attr:`percentiles_method` (see
+        :func:`percentiles <pyhmsa_plot.util.autoscale.percentiles>`).
+        Limits are cached per datum and preprocessing, like the filtered
+        maps.
+        If no percentiles are specified, the limits are left to the image
+        (minimum and maximum).
+        """
+        vmin, vmax = self.vmin, self.vmax
+        if self.percentiles is None or (vmin is not None and vmax is not None):
+            return vmin, vmax
+
+        low, high = self.percentiles
+        key = self._get_cache_key(datum, None) + \
+            (median and self.has_median_filter(), pipeline.get_key(),
+             low, high, self.percentiles_method)
+
+        entry = self._limits_cache.get(key)
+        if entry is not None and entry[0]() is datum:
+            count('imageraster.limits_hit')
+            limits = entry[1]
+        else:
+            count('imageraster.limits_miss')
+            limits = percentiles(data, [low, high], self.percentiles_method)
+
+            cache = self._limits_cache
+            ref = weakref.ref(datum, lambda _ref: cache.pop(key))
+            cache.put(key, (ref, limits))
+
+        if vmin is None:
+            vmin = limits[0]
+        if vmax is None:
+            vmax = limits[1]
+        return vmin, vmax
+
+    def _get_cache_key(self, datum, flip):
+        size = None
+        if self.has_median_filter():
+            size = self._median_filter_kwargs['size']
+            size = tuple(np.atleast_1d(size).tolist())
+        return (id(datum), datum.__array_interface__['data'][0],
+                datum.shape, datum.strides, datum.dtype.str, flip,
+                size, self._median_filter_engine)
+
+    def invalidate_cache(self, datum=None):
+        """
+        Discards the cached filtered maps and color limits of *datum*, or
+        of all datums if *datum* is ``None``.
+        Cached maps are only discarded automatically when their datum is
+        deleted, so this must be called after modifying a datum in place.
+        """
+        for cache in (self._cache, self._limits_cache):
+            if datum is None:
+                cache.clear()
+                continue
+
+            for key in cache.keys():
+                if key[0] == id(datum):
+                    cache.pop(key)
+
+    def set_cache_size(self, size):
+        """
+        Sets the maximum number of filtered maps kept in the cache.
+        A size of 0 disables the cache.
+        """
+        self._cache.maxsize = size
+
+    def get_cache_size(self):
+        return self._cache.maxsize
 
     def _calculate_extent(self, datum):
+        """
+        Returns the map as a (row, column) array, its extent and whether it
+        must be displayed flipped horizontally and vertically, as a tuple
+        ``(flip_x, flip_y)``.
+        The array is only transposed, so that the data of a map read from
+        a file (stored in Fortran order) stays a C-contiguous buffer.
+        Flipping is left to the image.
+        """
         unit = self.unit
         try:
             p0 = datum.get_position(0, 0)
@@ -69,20 +407,19 @@ class ImageRaster2DPlot(_DatumPlot):
             p1x = float(convert_unit(unit, p1.x))
             p1y = float(convert_unit(unit, p1.y))
 
-            datum = np.flipud(datum.T)
-            if p0x > p1x:
-                datum = np.fliplr(datum)
+            flip_x = p0x > p1x
+            if flip_x:
                 p0x, p1x = p1x, p0x
-            if p0y > p1y:
-                datum = np.flipud(datum)
+            flip_y = not p0y > p1y
+            if not flip_y:
                 p0y, p1y = p1y, p0y
 
-            return datum, [p0x, p1x, p0y, p1y]
+            return datum.T, [p0x, p1x, p0y, p1y], (flip_x, flip_y)
 
         except:
             pass
 
-        return datum, None
+        return datum, None, (False, False)
 
     def add_colorbar(self, **kwargs):
         if self._colorbar_kwargs is not None:
@@ -105,6 +442,7 @@ class ImageRaster2DPlot(_DatumPlot):
             return
         colorbar = Colorbar(aximage, **self._colorbar_kwargs)
         ax.add_artist(colorbar)
+        return colorbar
 
     def add_scalebar(self, **kwargs):
         if self._scalebar_kwargs is not None:
@@ -129,19 +467,378 @@ class ImageRaster2DPlot(_DatumPlot):
             return
         scalebar = ScaleBar(1, **self._scalebar_kwargs)
         ax.add_artist(scalebar)
-
-    def add_median_filter(self, size=3):
+        return scalebar
+
+    def add_median_filter(self, size=3, engine='scipy'):
+        """
+        Adds a median filter of *size* applied to the map before plotting.
+
+        :arg engine: ``'scipy'`` to use :func:`scipy.ndimage.median_filter`
+            or ``'histogram'`` to use the histogram-based filter
+            (:func:`pyhmsa_plot.util.median.median_filter`) for integer
+            maps. Its cost grows with the number of distinct values rather
+            than with the size, so it is faster for large kernels on maps
+            with few levels (e.g. counts); it falls back to scipy otherwise.
+            Both give the same result. Other maps are always filtered with
+            scipy.
+        """
         if self.has_median_filter():
             raise ValueError('Median filter already defined')
+        if engine not in MEDIAN_FILTER_ENGINES:
+            raise ValueError('Unknown median filter engine: %s' % engine)
         self._median_filter_kwargs = {'size': size}
+        self._median_filter_engine = engine
 
     def remove_median_filter(self):
         self._median_filter_kwargs = None
+        self._median_filter_engine = None
 
     def has_median_filter(self):
         return self._median_filter_kwargs is not None
 
-    def _apply_median(self, datum):
+    def _get_median_filter(self):
+        return MedianFilter(self._median_filter_kwargs['size'],
+                            self._median_filter_engine)
+
+    def _apply_median(self, datum, flip=(False, False)):
         if not self.has_median_filter():
             return datum
-        return ndimage.median_filter(datum, **self._median_filter_kwargs)
+
+        median = self._get_median_filter().oriented(flip)
+
+        # Filter memory-mapped data tile by tile in a temporary memory-mapped
+        # array, so that the map is never loaded in memory at once.
+        # With an executor, the tiles are filtered in parallel.
+        if is_memmap(datum):
+            out = create_memmap(datum.shape, datum.dtype)
+        elif self.filter_executor is not None:
+            out = np.empty(datum.shape, datum.dtype)
+        else:
+            return median(datum)
+
+        return filter_tiled(median, datum, median.get_halo(), out,
+                            executor=self.filter_executor)
+
+class ImageRaster2DMontagePlot(ImageRaster2DPlot):
+    """
+    Plots several maps of the same acquisition (e.g. element maps) in a
+    grid on a single figure.
+    The maps must have the same shape; the geometry (extent, orientation)
+    of the first map is used for all of them.
+    Each map is drawn in its own type with a norm between its own limits
+    (see :meth:`_calculate_montage_limits`), so the maps are never copied
+    into a common array. The options of :class:`ImageRaster2DPlot`
+    (colormap, limits, filters, colorbar, scalebar) apply to each map; the
+    preprocessing pipeline is always applied at full resolution:
+    :attr:`lazy_pipeline` is ignored, with a warning.
+    """
+
+    def __init__(self):
+        super().__init__()
+
+        self.ncols = None
+
+    def _get_grid(self, n):
+        """
+        Returns the number of rows and columns of the grid for *n* maps.
+        """
+        ncols = self.ncols or int(math.ceil(math.sqrt(n)))
+        ncols = max(1, min(ncols, n))
+        nrows = int(math.ceil(n / ncols))
+        return nrows, ncols
+
+    def _create_figure(self, datums):
+        fig = Figure()
+
+        nrows, ncols = self._get_grid(len(datums))
+        width, height = datums[0].shape
+        fig.set_figheight(fig.get_figwidth() * nrows * height / (ncols * width))
+
+        axes = []
+        for index in range(len(datums)):
+            row, col = divmod(index, ncols)
+            rect = [col / ncols, 1.0 - (row + 1) / nrows, 1.0 / ncols, 1.0 / nrows]
+            axes.append(fig.add_axes(rect))
+
+        return fig, axes
+
+    def plot(self, datums, ax=None, update=False, *, labels=None):
+        """
+        Plots the *datums* in a grid and returns the figure.
+
+        :arg datums: sequence of :class:`ImageRaster2D <pyhmsa.spec.datum.imageraster.ImageRaster2D>`
+        :arg ax: sequence of matplotlib's Axes, one per datum (optional)
+        :arg update: not supported, the maps are always plotted from scratch
+        :arg labels: optional sequence of labels written in the top left
+            corner of each map
+        """
+        if not datums:
+            raise ValueError('No datum to plot')
+        if labels is not None and len(labels) != len(datums):
+            raise ValueError('There must be one label per datum')
+        if self.lazy_pipeline:
+            warnings.warn('The pipeline of a montage is applied at full '
+                          'resolution, lazy_pipeline is ignored')
+
+        if ax is None:
+            with stage('create_figure'):
+                fig, axes = self._create_figure(datums)
+        else:
+            if len(ax) != len(datums):
+                raise ValueError('There must be one axes per datum')
+            axes = ax
+            fig = axes[0].get_figure()
+            with stage('clear'):
+                for ax in axes:
+                    ax.clear()
+
+        with stage('plot'):
+            self._plot(datums, axes, labels)
+
+        return fig
+
+    def _plot(self, datums, axes, labels=None):
+        # Preprocess the maps, with the geometry of the first map
+        datum = datums[0]
+        data, extent, flip = self._preprocess(datum, self.pipeline)
+
+        maps = [data]
+        for datum in datums[1:]:
+            data = self._preprocess(datum, self.pipeline)[0]
+            if data.shape != maps[0].shape:
+                raise ValueError('All maps must have the same shape')
+            maps.append(data)
+
+        with stage('autoscale'):
+            vmins, vmaxs = self._calculate_montage_limits(maps)
+
+        for index, (data, ax) in enumerate(zip(maps, axes)):
+            ax.xaxis.set_visible(False)
+            ax.yaxis.set_visible(False)
+
+            with stage('imshow'):
+                aximage = imshow(ax, data, cmap=self.cmap, extent=extent,
+                                 interpolation='none',
+                                 vmin=float(vmins[index]),
+                                 vmax=float(vmaxs[index]),
+                                 reduction=self.reduction,
+                                 dtype=self.dtype,
+                                 tile_size=self.tile_size,
+                                 prefetch=self.prefetch,
+                                 flip=flip)
+
+            if labels is not None:
+                ax.text(0.02, 0.98, labels[index], transform=ax.transAxes,
+                        ha='left', va='top', color='w',
+                        bbox={'facecolor': 'k', 'alpha': 0.5, 'lw': 0})
+
+            with stage('scalebar'):
+                self._apply_scalebar(data, ax, extent)
+            with stage('colorbar'):
+                self._apply_colorbar(data, ax, aximage)
+
+    def _calculate_montage_limits(self, maps):
+        """
+        Returns the lower and upper limits of each of the *maps*:
+        :attr:`vmin` and :attr:`vmax` if specified, otherwise the
+        :attr:`percentiles` of each map, or its minimum and maximum.
+        With the ``'sample'`` method, the percentiles of all maps are
+        calculated at once from a strided sample of each map.
+        With the ``'stream'`` method, they are calculated from each map in
+        its own type.
+        """
+        n = len(maps)
+        if self.percentiles is None:
+            vmins = np.array([np.nanmin(data) for data in maps], np.float64)
+            vmaxs = np.array([np.nanmax(data) for data in maps], np.float64)
+        elif self.percentiles_method == 'sample':
+            step = max(1, int(math.ceil(math.sqrt(maps[0].size / SAMPLE_SIZE))))
+            sample = np.array([np.ravel(data[::step, ::step]) for data in maps],
+                              np.float64)
+            vmins, vmaxs = lower_percentile(sample, self.percentiles, axis=1,
+                                            ignore_nan=True)
+        else:
+            limits = [percentiles(data, self.percentiles, self.percentiles_method)
+                      for data in maps]
+            limits = np.array(limits, dtype=np.float64)
+            vmins, vmaxs = limits[:, 0], limits[:, 1]
+
+        vmins = np.where(np.isfinite(vmins), vmins, 0.0)
+        vmaxs = np.where(np.isfinite(vmaxs), vmaxs, 1.0)
+        if self.vmin is not None:
+            vmins = np.full(n, self.vmin, np.float64)
+        if self.vmax is not None:
+            vmaxs = np.full(n, self.vmax, np.float64)
+
+        return vmins, vmaxs
+
+    def _plot_export(self, datums, ax=None, labels=None):
+        return self.plot(datums, ax, labels=labels)
+
+    def save(self, filepath, datums, ax=None, canvas_class=None, *args,
+             labels=None, **kwargs):
+        """
+        Plots the *datums* in a grid and saves the figure to the specified
+        *filepath*.
+        """
+        fig = self._plot_export(datums, ax, labels)
+        self._savefig(fig, filepath, canvas_class, *args, **kwargs)
+
+    def render_bytes(self, datums, format='png', ax=None, *args,
+                     labels=None, **kwargs):
+        """
+        Plots the *datums* in a grid and returns the content of the file in
+        *format*.
+        """
+        fig = self._plot_export(datums, ax, labels)
+        return self._render_bytes(fig, format, *args, **kwargs)
+
+    def render_rgba(self, datums, ax=None, dpi=None, *, labels=None):
+        """
+        Plots the *datums* in a grid and returns the pixels of the figure
+        (see :meth:`_DatumPlot.render_rgba`).
+        """
+        fig = self._plot_export(datums, ax, labels)
+        return self._render_rgba(fig, dpi)
+
+class ImageRaster2DCompositePlot(ImageRaster2DPlot):
+    """
+    Plots several maps of the same acquisition (e.g. element maps) as an
+    additive color composite (see
+    :func:`composite <pyhmsa_plot.util.composite.composite>`), with the
+    extent and scalebar of a single map.
+    Each map is normalized between :attr:`vmin` and :attr:`vmax`, its
+    :attr:`percentiles` or its own limits given to :meth:`plot`.
+    The filters and the preprocessing pipeline are applied to each map at
+    full resolution: :attr:`lazy_pipeline` is ignored, with a warning.
+    The colormap does not apply and a composite has no colorbar:
+    :meth:`add_colorbar` raises a :exc:`ValueError`.
+    """
+
+    def add_colorbar(self, **kwargs):
+        raise ValueError('A composite has no colorbar')
+
+    def _create_figure(self, datums):
+        return ImageRaster2DPlot._create_figure(self, datums[0])
+
+    def plot(self, datums, ax=None, update=False, *, colors=None, limits=None,
+             labels=None):
+        """
+        Plots the composite of the *datums* and returns the figure.
+
+        :arg datums: sequence of :class:`ImageRaster2D <pyhmsa.spec.datum.imageraster.ImageRaster2D>`
+        :arg ax: matplotlib's Axes (optional)
+        :arg update: not supported, the composite is always plotted from
+            scratch
+        :arg colors: color of each map (default: red, green, blue, cyan,
+            magenta, yellow), required for more than six datums
+        :arg limits: ``(vmin, vmax)`` of each map. Either limit can be
+            ``None`` to use the limits of the plot.
+        :arg labels: optional labels of the maps, shown in a legend
+        """
+        if not datums:
+            raise ValueError('No datum to plot')
+        if labels is not None and len(labels) != len(datums):
+            raise ValueError('There must be one label per datum')
+        if limits is not None and len(limits) != len(datums):
+            raise ValueError('There must be one limit per datum')
+        if colors is None and len(datums) > len(COLORS):
+            raise ValueError('Specify the colors of more than %i datums'
+                             % len(COLORS))
+        if colors is not None and len(colors) != len(datums):
+            raise ValueError('There must be one color per datum')
+        if self.lazy_pipeline:
+            warnings.warn('The pipeline of a composite is applied at full '
+                          'resolution, lazy_pipeline is ignored')
+
+        if ax is None:
+            with stage('create_figure'):
+                fig, ax = self._create_figure(datums)
+        else:
+            fig = ax.get_figure()
+
+        with stage('clear'):
+            ax.clear()
+        with stage('plot'):
+            self._plot(datums, ax, colors, limits, labels)
+
+        return fig
+
+    def _plot(self, datums, ax, colors=None, limits=None, labels=None):
+        # Setup axes
+        ax.xaxis.set_visible(False)
+        ax.yaxis.set_visible(False)
+
+        # Preprocess each map, with the geometry of the first map
+        geometry = None
+        maps = []
+        vmins = []
+        vmaxs = []
+        for index, datum in enumerate(datums):
+            data, extent, flip = self._preprocess(datum, self.pipeline)
+            if geometry is None:
+                geometry = extent, flip
+
+            with stage('autoscale'):
+                vmin, vmax = self._calculate_limits(datum, data,
+                                                    self.pipeline, True)
+            if limits is not None:
+                vmin = vmin if limits[index][0] is None else limits[index][0]
+                vmax = vmax if limits[index][1] is None else limits[index][1]
+
+            maps.append(data)
+            vmins.append(vmin)
+            vmaxs.append(vmax)
+
+        if colors is None:
+            colors = COLORS[:len(datums)]
+
+        with stage('composite'):
+            rgb = composite(maps, colors, vmins, vmaxs)
+        extent, flip = geometry
+
+        with stage('imshow'):
+            imshow(ax, rgb, extent=extent, interpolation='none',
+                   tile_size=self.tile_size,
+                   prefetch=self.prefetch,
+                   flip=flip)
+
+        if labels is not None:
+            handles = [Patch(color=color, label=label)
+                       for color, label in zip(colors, labels)]
+            ax.legend(handles=handles, loc='upper right')
+
+        with stage('scalebar'):
+            self._apply_scalebar(rgb, ax, extent)
+
+    def _plot_export(self, datums, ax=None, colors=None, limits=None,
+                     labels=None):
+        return self.plot(datums, ax, colors=colors, limits=limits,
+                         labels=labels)
+
+    def save(self, filepath, datums, ax=None, canvas_class=None, *args,
+             colors=None, limits=None, labels=None, **kwargs):
+        """
+        Plots the composite of the *datums* and saves it to the specified
+        *filepath*.
+        """
+        fig = self._plot_export(datums, ax, colors, limits, labels)
+        self._savefig(fig, filepath, canvas_class, *args, **kwargs)
+
+    def render_bytes(self, datums, format='png', ax=None, *args,
+                     colors=None, limits=None, labels=None, **kwargs):
+        """
+        Plots the composite of the *datums* and returns the content of the
+        file in *format*.
+        """
+        fig = self._plot_export(datums, ax, colors, limits, labels)
+        return self._render_bytes(fig, format, *args, **kwargs)
+
+    def render_rgba(self, datums, ax=None, dpi=None, *, colors=None,
+                    limits=None, labels=None):
+        """
+        Plots the composite of the *datums* and returns the pixels of the
+        figure (see :meth:`_DatumPlot.render_rgba`).
+        """
+        fig = self._plot_export(datums, ax, colors, limits, labels)
+        return self._render_rgba(fig, dpi)
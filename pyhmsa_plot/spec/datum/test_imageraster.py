@@ -4,15 +4,34 @@
 # Standard library modules.
 import unittest
 import logging
+import gc
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 # Third party modules.
+import numpy as np
+
+import scipy.ndimage as ndimage
+
+import matplotlib
+import matplotlib.image
+from matplotlib.colors import LogNorm
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib_colorbar.colorbar import Colorbar
+
 from pyhmsa.spec.datum.imageraster import ImageRaster2D
 from pyhmsa.spec.condition.acquisition import \
     AcquisitionRasterXY, POSITION_LOCATION_CENTER, POSITION_LOCATION_START
 from pyhmsa.spec.condition.specimenposition import SpecimenPosition
 
 # Local modules.
-from pyhmsa_plot.spec.datum.imageraster import ImageRaster2DPlot
+from pyhmsa_plot.spec.datum.imageraster import \
+    ImageRaster2DPlot, ImageRaster2DMontagePlot, ImageRaster2DCompositePlot
+from pyhmsa_plot.util.pipeline import Pipeline, GaussianFilter, MedianFilter
+from pyhmsa_plot.util.instrument import record
+from pyhmsa_plot.util.autoscale import lower_percentile
 
 # Globals and constants variables.
 
@@ -45,6 +64,460 @@ class TestImageRaster2DPlot(unittest.TestCase):
         h = fig.get_figheight()
         self.assertAlmostEqual(w / h, 11 / 7)
 
+    def testcalculate_extent(self):
+        datum = ImageRaster2D(11, 7, order='F')
+        datum.conditions.update(self.datum.conditions)
+
+        data, extent, flip = self.plot._calculate_extent(datum)
+        self.assertTrue(data.flags['C_CONTIGUOUS'])
+        self.assertTrue(np.shares_memory(datum, data))
+        self.assertEqual((7, 11), data.shape)
+        self.assertEqual((False, False), flip)
+        self.assertAlmostEqual(-2.5, extent[0])
+        self.assertAlmostEqual(2.5, extent[1])
+
+    def testapply_median(self):
+        datum = ImageRaster2D(11, 7, dtype=np.uint16)
+        datum[:] = np.random.RandomState(0).poisson(20, datum.shape)
+
+        for flip in [(False, False), (True, False), (False, True)]:
+            self.plot.add_median_filter(4)
+            expected = self.plot._apply_median(datum, flip)
+            self.plot.remove_median_filter()
+
+            self.plot.add_median_filter(4, engine='histogram')
+            actual = self.plot._apply_median(datum, flip)
+            self.plot.remove_median_filter()
+
+            self.assertTrue(np.array_equal(expected, actual))
+
+        self.assertRaises(ValueError, self.plot.add_median_filter, 3, 'abc')
+
+    def testapply_median_executor(self):
+        datum = ImageRaster2D(11, 7, dtype=np.uint16)
+        datum[:] = np.random.RandomState(0).poisson(20, datum.shape)
+        self.plot.add_median_filter(3)
+        expected = self.plot._apply_median(datum)
+
+        with ThreadPoolExecutor(2) as executor:
+            self.plot.filter_executor = executor
+            actual = self.plot._apply_median(datum)
+
+        self.assertTrue(np.array_equal(expected, actual))
+
+    def testpreprocess_cache(self):
+        datum = ImageRaster2D(11, 7, dtype=np.uint16)
+        datum[:] = np.random.RandomState(0).poisson(20, datum.shape)
+        datum.conditions.update(self.datum.conditions)
+        self.plot.add_median_filter(3)
+
+        data, extent, _flip = self.plot._preprocess(datum)
+        self.assertIs(data, self.plot._preprocess(datum)[0])
+        self.assertEqual(extent, self.plot._preprocess(datum)[1])
+
+        # Other filter parameters
+        self.plot.remove_median_filter()
+        self.plot.add_median_filter(5)
+        self.assertIsNot(data, self.plot._preprocess(datum)[0])
+        self.assertEqual(2, len(self.plot._cache))
+
+        # Invalidation
+        datum[0, 0] = 1000
+        self.plot.invalidate_cache(datum)
+        self.assertEqual(0, len(self.plot._cache))
+        data = self.plot._preprocess(datum)[0]
+        self.assertTrue(np.array_equal(ndimage.median_filter(datum.T, 5),
+                                       data))
+
+        # Deleted datum
+        del datum
+        gc.collect()
+        self.assertEqual(0, len(self.plot._cache))
+
+    def testplot_pipeline(self):
+        datum = ImageRaster2D(11, 7, dtype=np.uint16)
+        datum.conditions.update(self.datum.conditions)
+        self.plot.pipeline.append(GaussianFilter(1.0))
+
+        fig = self.plot.plot(datum)
+        image = fig.axes[0].images[0]
+        self.assertIsNone(image.get_pipeline())
+
+        self.plot.lazy_pipeline = True
+        fig = self.plot.plot(datum)
+        image = fig.axes[0].images[0]
+        self.assertEqual(self.plot.pipeline, image.get_pipeline())
+
+        self.assertEqual((False, Pipeline(), self.plot.pipeline),
+                         self.plot._split_pipeline())
+        self.plot._exporting = True
+        self.assertEqual((True, self.plot.pipeline, Pipeline()),
+                         self.plot._split_pipeline())
+        self.plot._exporting = False
+
+        # Median filter is deferred to the image
+        self.plot.add_median_filter(4, engine='histogram')
+        fig = self.plot.plot(datum)
+        image = fig.axes[0].images[0]
+        expected = Pipeline([MedianFilter(4, 'histogram'), GaussianFilter(1.0)])
+        self.assertEqual(expected, image.get_pipeline())
+        self.assertIs(datum.T.base, image.get_array().base)
+
+    def testplot_percentiles(self):
+        datum = ImageRaster2D(11, 7, dtype=np.uint16)
+        datum[:] = np.random.RandomState(0).poisson(20, datum.shape)
+        datum[3, 4] = 60000 # Hot pixel
+        datum.conditions.update(self.datum.conditions)
+
+        self.plot.percentiles = (0.0, 98.0)
+        self.plot.vmin = 5
+        fig = self.plot.plot(datum)
+        vmin, vmax = fig.axes[0].images[0].get_clim()
+        self.assertEqual(5, vmin)
+        self.assertEqual(lower_percentile(datum, 98), vmax)
+        self.assertLess(vmax, 60000)
+        self.assertEqual(1, len(self.plot._limits_cache))
+
+        # Cached limits
+        with record() as recorder:
+            self.plot.plot(datum)
+        self.assertEqual(1, recorder.get_count('imageraster.limits_hit'))
+
+        self.plot.percentiles_method = 'stream'
+        self.plot.plot(datum)
+        self.assertEqual(2, len(self.plot._limits_cache))
+
+        self.plot.invalidate_cache(datum)
+        self.assertEqual(0, len(self.plot._limits_cache))
+
+    def testrender_thumbnail(self):
+        datum = ImageRaster2D(110, 70, dtype=np.uint16)
+        datum[:] = np.random.RandomState(0).poisson(20, datum.shape)
+        acq = AcquisitionRasterXY(110, 70, (0.5, 'm'), (0.5, 'm'))
+        acq.positions[POSITION_LOCATION_START] = SpecimenPosition((2.5, 'm'), (-1.5, 'm'), 0.0)
+        datum.conditions.add('Acq0', acq)
+
+        self.plot.cmap = 'viridis'
+        self.plot.remove_scalebar()
+        self.plot.remove_colorbar()
+        rgb = self.plot.render_thumbnail(datum)
+        self.assertEqual((70, 110, 3), rgb.shape)
+
+        # Same pixels as the figure at full resolution
+        fig = self.plot.plot(datum)
+        fig.axes[0].set_frame_on(False)
+        fig.set_size_inches(1.1, 0.7)
+        fig.set_dpi(400)
+        canvas = FigureCanvasAgg(fig)
+        canvas.draw()
+        expected = np.asarray(canvas.buffer_rgba())[2::4, 2::4, :3]
+        self.assertTrue(np.array_equal(expected, rgb))
+
+        # Downsampled
+        self.plot.reduction = 'mean'
+        self.plot.vmin = 0
+        self.plot.vmax = 40
+        rgb = self.plot.render_thumbnail(datum, 32)
+        self.assertEqual((17, 27, 3), rgb.shape)
+
+        # Sums drawn as the means of their blocks
+        self.plot.reduction = 'sum'
+        self.plot.dtype = 'native'
+        self.assertTrue(np.array_equal(rgb,
+                                       self.plot.render_thumbnail(datum, 32)))
+        self.plot.reduction = 'mean'
+        self.plot.dtype = None
+
+        # Burned-in scalebar
+        self.plot.add_scalebar(location='lower right')
+        self.plot.cmap = 'gray'
+        self.plot.vmax = 1e6
+        rgb = self.plot.render_thumbnail(datum, 32)
+        self.assertTrue((rgb == 255).any())
+
+    def testrender_thumbnail_nan(self):
+        datum = ImageRaster2D(11, 7, dtype=np.float64)
+        datum[:] = 1.0
+        datum[0, 0] = np.nan
+        self.plot.remove_scalebar()
+
+        with matplotlib.rc_context():
+            matplotlib.rcdefaults()
+            rgb = self.plot.render_thumbnail(datum)
+            self.assertEqual(77, rgb.shape[0] * rgb.shape[1])
+
+            # Default of matplotlib >= 3.3, not a color
+            dict.__setitem__(matplotlib.rcParams, 'savefig.facecolor', 'auto')
+            matplotlib.rcParams['figure.facecolor'] = 'r'
+            rgb = self.plot.render_thumbnail(datum)
+            self.assertEqual(1, (rgb == [255, 0, 0]).all(axis=-1).sum())
+
+    def testsave_thumbnail(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filepath = os.path.join(tmpdir, 'thumbnail.png')
+            self.plot.save_thumbnail(filepath, self.datum, 4)
+            A = matplotlib.image.imread(filepath)
+            self.assertEqual((3, 4, 3), A.shape)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def testrender_bytes(self):
+        data = self.plot.render_bytes(self.datum)
+        self.assertTrue(data.startswith(b'\x89PNG'))
+
+        data = self.plot.render_bytes(self.datum, 'svg')
+        self.assertIn(b'<svg', data)
+
+        self.assertRaises(ValueError, self.plot.render_bytes, self.datum, 'abc')
+
+    def testrender_rgba(self):
+        rgba = self.plot.render_rgba(self.datum, dpi=50)
+        self.assertEqual(320, rgba.shape[1])
+        self.assertEqual(np.uint8, rgba.dtype)
+        self.assertFalse(rgba.flags['OWNDATA'])
+
+        # Same pixels as saved
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filepath = os.path.join(tmpdir, 'plot.png')
+            self.plot.save(filepath, self.datum, dpi=50)
+            A = matplotlib.image.imread(filepath)
+            self.assertTrue(np.array_equal(np.round(A * 255), rgba))
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def testplot_dtype(self):
+        datum = ImageRaster2D(11, 7, dtype=np.uint16)
+        datum.conditions.update(self.datum.conditions)
+
+        self.plot.dtype = 'native'
+        self.plot.reduction = 'mean'
+        self.plot.add_median_filter()
+        fig = self.plot.plot(datum)
+        FigureCanvasAgg(fig).draw()
+
+        image = fig.axes[0].images[0]
+        self.assertEqual(np.uint16, image.get_array().dtype)
+        self.assertEqual(np.uint16, image._A.dtype)
+
+    def testplot_update(self):
+        fig = self.plot.plot(self.datum)
+        ax = fig.axes[0]
+        image = ax.images[0]
+        artists = list(ax.artists)
+
+        datum = ImageRaster2D(11, 7)
+        datum[:] = 3.0
+        datum[1, 1] = 9.0
+        datum.conditions.update(self.datum.conditions)
+
+        with record() as recorder:
+            self.plot.plot(datum, ax, update=True)
+            FigureCanvasAgg(fig).draw()
+        self.assertEqual(1, recorder.get_count('update.hit'))
+        self.assertIs(image, ax.images[0])
+        self.assertEqual(artists, list(ax.artists))
+        self.assertEqual((3.0, 9.0), image.get_clim())
+        self.assertIs(datum.T.base, image.get_array().base)
+
+        # The colorbar follows the colormap and norm of the image
+        colorbar = [artist for artist in ax.artists
+                    if isinstance(artist, Colorbar)][0]
+        self.assertIs(image, colorbar.mappable)
+        self.plot.cmap = 'viridis'
+        self.plot.plot(datum, ax, update=True)
+        self.assertEqual('viridis', colorbar.mappable.get_cmap().name)
+        image.set_norm(LogNorm(1.0, 9.0))
+        self.assertIs(image.norm, colorbar.mappable.norm)
+
+        # Different settings
+        self.plot.vmax = 20.0
+        self.plot.plot(datum, ax, update=True)
+        self.assertEqual((3.0, 20.0), ax.images[0].get_clim())
+        self.plot.remove_colorbar()
+        with record() as recorder:
+            self.plot.plot(datum, ax, update=True)
+        self.assertEqual(1, recorder.get_count('update.miss'))
+        self.assertIsNot(image, ax.images[0])
+        self.assertEqual(1, len(ax.artists))
+
+        # Different shape
+        datum = ImageRaster2D(5, 7)
+        image = ax.images[0]
+        with record() as recorder:
+            self.plot.plot(datum, ax, update=True)
+        self.assertEqual(1, recorder.get_count('update.miss'))
+        self.assertIsNot(image, ax.images[0])
+
+class TestImageRaster2DMontagePlot(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        acq = AcquisitionRasterXY(11, 7, (0.5, 'm'), (0.5, 'm'))
+        acq.positions[POSITION_LOCATION_CENTER] = SpecimenPosition(0.0, 0.0, 0.0)
+        acq.positions[POSITION_LOCATION_START] = SpecimenPosition((-2.5, 'm'), (1.5, 'm'), 0.0)
+
+        random = np.random.RandomState(0)
+        self.datums = []
+        for lam in (5, 20, 100, 1000, 50):
+            datum = ImageRaster2D(11, 7, dtype=np.uint16)
+            datum[:] = random.poisson(lam, datum.shape)
+            datum.conditions.add('Acq0', acq)
+            self.datums.append(datum)
+
+        self.plot = ImageRaster2DMontagePlot()
+        self.plot.add_scalebar(location='lower center')
+        self.plot.add_colorbar(width_fraction=0.02)
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+
+    def testplot(self):
+        labels = ['Fe', 'Ni', 'Cr', 'O', 'C']
+        fig = self.plot.plot(self.datums, labels=labels)
+        FigureCanvasAgg(fig).draw()
+
+        self.assertEqual(5, len(fig.axes))
+        self.assertAlmostEqual(3 * 11 / (2 * 7),
+                               fig.get_figwidth() / fig.get_figheight())
+
+        # Each map is drawn in its own type with its own limits
+        for datum, ax in zip(self.datums, fig.axes):
+            image = ax.images[0]
+            self.assertEqual(np.uint16, image._full_res.dtype)
+            self.assertTrue(np.array_equal(datum.T, image._full_res))
+            self.assertEqual((datum.min(), datum.max()),
+                             (image.norm.vmin, image.norm.vmax))
+            self.assertEqual((False, False), image.get_flip())
+
+            colorbar = ax.artists[-1]
+            self.assertIs(image, colorbar.mappable)
+
+        # In existing axes
+        axes = fig.axes
+        self.assertIs(fig, self.plot.plot(self.datums[::-1], axes))
+        self.assertEqual(self.datums[-1].max(), axes[0].images[0].norm.vmax)
+        self.assertRaises(ValueError, self.plot.plot, self.datums, axes[:2])
+
+    def testplot_grid(self):
+        self.plot.ncols = 5
+        self.assertEqual((1, 5), self.plot._get_grid(5))
+        self.plot.ncols = 8
+        self.assertEqual((1, 5), self.plot._get_grid(5))
+        self.plot.ncols = None
+        self.assertEqual((2, 3), self.plot._get_grid(5))
+        self.assertEqual((1, 1), self.plot._get_grid(1))
+
+    def testplot_percentiles(self):
+        self.plot.percentiles = (1.0, 99.0)
+        self.plot.vmin = 0
+        for method in ('sample', 'stream'):
+            self.plot.percentiles_method = method
+            maps = [datum.T for datum in self.datums]
+            vmins, vmaxs = self.plot._calculate_montage_limits(maps)
+
+            self.assertEqual([0] * 5, vmins.tolist())
+            expected = [lower_percentile(datum, 99)
+                        for datum in self.datums]
+            self.assertEqual(expected, vmaxs.tolist())
+
+    def testplot_lazy_pipeline(self):
+        self.plot.lazy_pipeline = True
+        with self.assertWarns(UserWarning):
+            fig = self.plot.plot(self.datums)
+        self.assertEqual(5, len(fig.axes))
+
+    def testrender_rgba(self):
+        rgba = self.plot.render_rgba(self.datums, dpi=20)
+        self.assertEqual(4, rgba.shape[2])
+        self.assertTrue(self.plot.render_bytes(self.datums).startswith(b'\x89PNG'))
+
+        # Same positional arguments as ImageRaster2DPlot
+        data = self.plot.render_bytes(self.datums, 'svg', labels=['Fe'] * 5)
+        self.assertIn(b'<svg', data)
+
+    def testplot_invalid(self):
+        datum = ImageRaster2D(5, 5)
+        self.assertRaises(ValueError, self.plot.plot, self.datums + [datum])
+        self.assertRaises(ValueError, self.plot.plot, [])
+        self.assertRaises(ValueError, self.plot.plot, self.datums,
+                          labels=['Fe'])
+class TestImageRaster2DCompositePlot(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        acq = AcquisitionRasterXY(11, 7, (0.5, 'm'), (0.5, 'm'))
+        acq.positions[POSITION_LOCATION_CENTER] = SpecimenPosition(0.0, 0.0, 0.0)
+        acq.positions[POSITION_LOCATION_START] = SpecimenPosition((-2.5, 'm'), (1.5, 'm'), 0.0)
+
+        random = np.random.RandomState(0)
+        self.datums = []
+        for lam in (5, 20, 100):
+            datum = ImageRaster2D(11, 7, dtype=np.uint16)
+            datum[:] = random.poisson(lam, datum.shape)
+            datum.conditions.add('Acq0', acq)
+            self.datums.append(datum)
+
+        self.plot = ImageRaster2DCompositePlot()
+        self.plot.add_scalebar(location='lower center')
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+
+    def testplot(self):
+        fig = self.plot.plot(self.datums, labels=['Fe', 'Ni', 'Cr'])
+        FigureCanvasAgg(fig).draw()
+
+        self.assertAlmostEqual(11 / 7, fig.get_figwidth() / fig.get_figheight())
+
+        image = fig.axes[0].images[0]
+        rgb = image.get_array()
+        self.assertEqual((7, 11, 3), rgb.shape)
+        self.assertEqual((False, False), image.get_flip())
+
+        datum = self.datums[1]
+        expected = (datum.T - datum.min()) / float(datum.max() - datum.min())
+        np.testing.assert_allclose(expected * 255, rgb[..., 1], atol=1)
+
+    def testplot_limits(self):
+        self.plot.percentiles = (0.0, 50.0)
+        limits = [(None, None), (0, None), (0, 1)]
+        fig = self.plot.plot(self.datums, colors=['cyan', 'magenta', 'yellow'],
+                             limits=limits)
+        rgb = fig.axes[0].images[0].get_array()
+
+        # Third map saturates yellow
+        self.assertTrue((rgb[..., 0] == 255).all())
+        self.assertTrue((rgb[..., 1] == 255).all())
+
+    def testrender_bytes(self):
+        data = self.plot.render_bytes(self.datums, 'svg', labels=['Fe'] * 3)
+        self.assertIn(b'<svg', data)
+        rgba = self.plot.render_rgba(self.datums, None, 20, colors=['w'] * 3)
+        self.assertEqual(4, rgba.shape[2])
+
+    def testplot_invalid(self):
+        self.assertRaises(ValueError, self.plot.plot, [])
+        self.assertRaises(ValueError, self.plot.plot, self.datums,
+                          labels=['Fe'])
+        self.assertRaises(ValueError, self.plot.plot, self.datums,
+                          limits=[(0, 1)])
+        self.assertRaises(ValueError, self.plot.add_colorbar)
+        self.assertRaises(ValueError, self.plot.plot, self.datums,
+                          colors=['r'])
+
+        # Default colors of at most six datums
+        with self.assertRaisesRegex(ValueError, 'colors of more than 6'):
+            self.plot.plot(self.datums * 3)
+
+    def testplot_lazy_pipeline(self):
+        self.plot.lazy_pipeline = True
+        with self.assertWarns(UserWarning):
+            fig = self.plot.plot(self.datums)
+        self.assertEqual(1, len(fig.axes[0].images))
 
 if __name__ == '__main__': #pragma: no cover
     logging.getLogger().setLevel(logging.DEBUG)
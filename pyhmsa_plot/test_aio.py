@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import time
+import asyncio
+import tempfile
+import shutil
+import threading
+
+# Third party modules.
+import numpy as np
+
+from matplotlib.figure import Figure
+
+from pyhmsa.spec.datum.analysis import Analysis1D
+from pyhmsa.spec.datum.imageraster import ImageRaster2D
+
+# Local modules.
+from pyhmsa_plot.aio import AsyncRenderer, _Limiter, estimate_memory
+from pyhmsa_plot.spec.datum.analysis import Analysis1DPlot
+from pyhmsa_plot.spec.datum.imageraster import ImageRaster2DPlot
+from pyhmsa_plot.util.instrument import stage
+
+# Globals and constants variables.
+
+class SlowPlot(Analysis1DPlot):
+
+    def __init__(self, delay=0.05):
+        super().__init__()
+        self.delay = delay
+        self.counters = {'active': 0, 'max_active': 0} # Shared by the copies
+        self.lock = threading.Lock()
+
+    def _plot(self, datum, ax):
+        with self.lock:
+            self.counters['active'] += 1
+            self.counters['max_active'] = \
+                max(self.counters['max_active'], self.counters['active'])
+        try:
+            time.sleep(self.delay)
+            return super()._plot(datum, ax)
+        finally:
+            with self.lock:
+                self.counters['active'] -= 1
+
+class StagedPlot(Analysis1DPlot):
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.stages = []
+
+    def _plot(self, datum, ax):
+        with stage('first'):
+            self.started.set()
+            time.sleep(0.2)
+        with stage('second'):
+            self.stages.append('second')
+        return super()._plot(datum, ax)
+
+class TestAsyncRenderer(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.loop = asyncio.new_event_loop()
+        self.datum = ImageRaster2D(11, 7, dtype=np.uint16)
+        self.plot = ImageRaster2DPlot()
+        self.plot.add_colorbar()
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        self.loop.close()
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def testestimate_memory(self):
+        self.assertEqual(11 * 7 * 2 * 4, estimate_memory(self.datum))
+        self.assertEqual(2 * 11 * 7 * 2 * 4,
+                         estimate_memory([self.datum, self.datum]))
+
+    def testrender(self):
+        async def render():
+            async with AsyncRenderer(2) as renderer:
+                fig = await renderer.plot(self.plot, self.datum)
+                data = await renderer.render_bytes(self.plot, self.datum)
+                rgba = await renderer.render_rgba(self.plot, self.datum, dpi=20)
+            return fig, data, rgba
+
+        fig, data, rgba = self.run_async(render())
+        self.assertIsInstance(fig, Figure)
+        self.assertTrue(data.startswith(b'\x89PNG'))
+        self.assertEqual(4, rgba.shape[2])
+
+    def testsave(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filepath = os.path.join(tmpdir, 'plot.png')
+            renderer = AsyncRenderer(1)
+            self.run_async(renderer.save(self.plot, filepath, self.datum, dpi=20))
+            renderer.close()
+            self.assertTrue(os.path.exists(filepath))
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def testmax_concurrency(self):
+        plot = SlowPlot()
+        renderer = AsyncRenderer(2)
+
+        async def render():
+            coroutines = [renderer.render_bytes(plot, Analysis1D(10))
+                          for _ in range(5)]
+            return await asyncio.gather(*coroutines)
+
+        results = self.run_async(render())
+        renderer.close()
+        self.assertEqual(5, len(results))
+        self.assertEqual(2, plot.counters['max_active'])
+        self.assertEqual(0, renderer._limiter.running)
+
+    def testcancel_stale(self):
+        plot = SlowPlot(0.2)
+        renderer = AsyncRenderer(1)
+
+        async def render():
+            first = asyncio.ensure_future(
+                renderer.render_bytes(plot, Analysis1D(10), key='view'))
+            pending = asyncio.ensure_future(
+                renderer.render_bytes(plot, Analysis1D(10), key='other'))
+            await asyncio.sleep(0.05)
+            self.assertTrue(renderer.cancel('other')) # Not started
+            second = await renderer.render_bytes(plot, Analysis1D(10),
+                                                 key='view')
+
+            with self.assertRaises(asyncio.CancelledError):
+                await first
+            with self.assertRaises(asyncio.CancelledError):
+                await pending
+            return second
+
+        data = self.run_async(render())
+        renderer.close()
+        self.assertTrue(data.startswith(b'\x89PNG'))
+        self.assertFalse(renderer.cancel('view'))
+        self.assertEqual(0, renderer._limiter.running)
+        self.assertEqual(0, renderer._limiter.memory)
+
+    def testcancel_running(self):
+        plot = StagedPlot()
+        renderer = AsyncRenderer(1)
+
+        async def render():
+            task = asyncio.ensure_future(
+                renderer.render_bytes(plot, Analysis1D(10), key='view'))
+            while not plot.started.is_set():
+                await asyncio.sleep(0.01)
+            self.assertTrue(renderer.cancel('view'))
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+            # Released once interrupted
+            while renderer._limiter.running:
+                await asyncio.sleep(0.01)
+
+        self.run_async(render())
+        renderer.close()
+        self.assertEqual([], plot.stages)
+        self.assertEqual(0, renderer._limiter.memory)
+
+class Test_Limiter(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        self.loop.close()
+
+    def testmemory_budget(self):
+        limiter = _Limiter(None, 100)
+
+        async def run():
+            await limiter.acquire(60)
+            waiter = asyncio.ensure_future(limiter.acquire(60))
+            await asyncio.sleep(0)
+            self.assertFalse(waiter.done())
+
+            limiter.release(60)
+            await waiter
+            self.assertEqual(60, limiter.memory)
+            limiter.release(60)
+
+            # Larger than the budget, but alone
+            await limiter.acquire(200)
+            limiter.release(200)
+
+        self.loop.run_until_complete(run())
+        self.assertEqual(0, limiter.running)
+        self.assertEqual(0, limiter.memory)
+
+    def testcancel_waiter(self):
+        limiter = _Limiter(1)
+
+        async def run():
+            await limiter.acquire(0)
+            waiter = asyncio.ensure_future(limiter.acquire(0))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.sleep(0)
+            limiter.release(0)
+
+        self.loop.run_until_complete(run())
+        self.assertEqual(0, limiter.running)
+        self.assertEqual(0, len(limiter._waiters))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
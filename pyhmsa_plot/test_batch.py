@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import tempfile
+import shutil
+
+# Third party modules.
+import numpy as np
+
+from pyhmsa.datafile import DataFile
+from pyhmsa.spec.datum.analysis import Analysis0D, Analysis1D
+from pyhmsa.spec.datum.imageraster import ImageRaster2D
+
+# Local modules.
+from pyhmsa_plot.batch import \
+    export, count_data, get_plot_class, create_filepath, main
+from pyhmsa_plot.spec.datum.imageraster import ImageRaster2DPlot
+from pyhmsa_plot.spec.datum.analysis import Analysis1DPlot
+
+# Globals and constants variables.
+
+def _configure(plot):
+    plot.configured = True
+
+def _configure_crash(plot):
+    save = plot.save
+    def _save(filepath, *args, **kwargs):
+        if 'Map_2' in filepath:
+            os._exit(1) # As if killed
+        return save(filepath, *args, **kwargs)
+    plot.save = _save
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.outdir = os.path.join(self.tmpdir, 'out')
+
+        datafile = DataFile()
+        for i in range(5):
+            datum = ImageRaster2D(11, 7 + i, dtype=np.uint16)
+            datum[:] = i
+            datafile.data['Map %i' % i] = datum
+        datafile.data['Spectrum'] = Analysis1D(20)
+        datafile.data['Value'] = Analysis0D(1.0)
+
+        self.source = os.path.join(self.tmpdir, 'sample.hmsa')
+        datafile.write(self.source)
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def testget_plot_class(self):
+        self.assertIs(ImageRaster2DPlot, get_plot_class(ImageRaster2D(3, 3)))
+        self.assertIs(Analysis1DPlot, get_plot_class(Analysis1D(3)))
+        self.assertIsNone(get_plot_class(Analysis0D(1.0)))
+
+    def testcount_data(self):
+        self.assertEqual(7, count_data(self.source))
+
+    def testcreate_filepath(self):
+        filepath = create_filepath('out', '/data/sample.hmsa', 'Fe_Ka', 'pdf')
+        self.assertEqual(os.path.join('out', 'sample_Fe_Ka.pdf'), filepath)
+
+        filepath = create_filepath('out', '/data/sample.hmsa', 'Fe Ka', 'pdf',
+                                   os.path.join('2019', 'sample'))
+        self.assertTrue(filepath.startswith(os.path.join('out', '2019', 'sample_Fe_Ka-')))
+
+        # Different identifiers, different file names
+        filepaths = set(create_filepath('out', 'sample.hmsa', identifier)
+                        for identifier in ['Map/1', 'Map 1', 'Map_1'])
+        self.assertEqual(3, len(filepaths))
+
+    def _test_export(self, max_workers, chunksize=None):
+        progress = []
+        callback = lambda result, done, total: progress.append((done, total))
+        results = export([self.source], self.outdir, max_workers=max_workers,
+                         chunksize=chunksize, callback=callback)
+
+        self.assertEqual(7, len(results))
+        self.assertEqual([(i, 7) for i in range(1, 8)], progress)
+
+        failures = [result for result in results if result.error]
+        self.assertEqual(1, len(failures))
+        self.assertEqual('Value', failures[0].identifier)
+
+        for result in results:
+            if not result.error:
+                self.assertTrue(os.path.exists(result.filepath))
+
+    def testexport(self):
+        self._test_export(1, chunksize=2)
+
+    def testexport_parallel(self):
+        self._test_export(2)
+
+    def testexport_missing(self):
+        missing = os.path.join(self.tmpdir, 'missing.hmsa')
+        results = export([missing, self.source], self.outdir, max_workers=1,
+                         configure=_configure)
+
+        self.assertEqual(8, len(results))
+        self.assertIsNone(results[0].identifier)
+        self.assertIsNotNone(results[0].error)
+
+    def testexport_crash(self):
+        results = export([self.source], self.outdir, max_workers=2,
+                         configure=_configure_crash)
+
+        self.assertEqual(7, len(results))
+        failures = sorted(result.identifier for result in results
+                          if result.error)
+        self.assertEqual(['Map 2', 'Value'], failures)
+        self.assertEqual(5, len(os.listdir(self.outdir)))
+
+    def testexport_collision(self):
+        other = os.path.join(self.tmpdir, 'other', 'sample.hmsa')
+        os.makedirs(os.path.dirname(other))
+        shutil.copy(self.source, other)
+        shutil.copy(os.path.splitext(self.source)[0] + '.xml',
+                    os.path.splitext(other)[0] + '.xml')
+
+        results = export([self.source, other], self.outdir, max_workers=1)
+        self.assertEqual(14, len(results))
+        failures = [result for result in results
+                    if result.error and result.source == other]
+        self.assertEqual(7, len(failures))
+        self.assertIn('already used by %s' % self.source, failures[0].error)
+
+        # Reserved by another data file
+        results = export([other], self.outdir, max_workers=1,
+                         names={other: 'other'},
+                         reserved={create_filepath(self.outdir, other, 'Map 0',
+                                                   name='other'): self.source})
+        self.assertTrue(all(result.error for result in results))
+
+    def testmain(self):
+        self.assertEqual(1, main([self.source, '-o', self.outdir, '-j', '1']))
+        self.assertEqual(6, len(os.listdir(self.outdir)))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
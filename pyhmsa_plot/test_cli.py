@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import tempfile
+import shutil
+from unittest import mock
+
+# Third party modules.
+import numpy as np
+
+from pyhmsa.datafile import DataFile
+from pyhmsa.spec.datum.analysis import Analysis0D, Analysis1D
+from pyhmsa.spec.datum.imageraster import ImageRaster2D
+
+# Local modules.
+from pyhmsa_plot.cli import \
+    find_sources, render, main, hash_source, Manifest, MANIFEST_FILENAME
+from pyhmsa_plot.batch import read_identifiers
+
+# Globals and constants variables.
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.indir = os.path.join(self.tmpdir, 'archive')
+        self.outdir = os.path.join(self.tmpdir, 'out')
+        os.makedirs(os.path.join(self.indir, 'sub'))
+
+        self.source1 = self._write(os.path.join(self.indir, 'sample1.hmsa'))
+        self.source2 = self._write(os.path.join(self.indir, 'sub', 'sample2.hmsa'))
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _write(self, filepath, value=1):
+        datafile = DataFile()
+        datum = ImageRaster2D(11, 7, dtype=np.uint16)
+        datum[:] = value
+        datafile.data['Map'] = datum
+        datafile.data['Spectrum'] = Analysis1D(20)
+        datafile.write(filepath)
+        return filepath
+
+    def _render(self, **kwargs):
+        kwargs.setdefault('max_workers', 1)
+        sources = find_sources([self.indir])
+        results, current = render(list(sources), self.outdir, names=sources,
+                                  **kwargs)
+        return sorted((os.path.basename(result.source), result.identifier)
+                      for result in results), current
+
+    def testfind_sources(self):
+        expected = [self.source1, self.source2]
+        sources = find_sources([self.indir])
+        self.assertEqual(expected, list(sources))
+        self.assertEqual('sample1', sources[self.source1])
+        self.assertEqual(os.path.join('sub', 'sample2'), sources[self.source2])
+
+        pattern = os.path.join(self.indir, '**', '*.xml')
+        sources = find_sources([pattern, self.source1])
+        self.assertEqual(expected, list(sources))
+        self.assertEqual(os.path.join('sub', 'sample2'), sources[self.source2])
+
+        sources = find_sources([self.source2])
+        self.assertEqual('sample2', sources[self.source2])
+
+    def testrender(self):
+        results, current = self._render()
+        self.assertEqual(4, len(results))
+        self.assertEqual(0, current)
+        self.assertEqual(4, len(os.listdir(self.outdir))) # With manifest
+        self.assertEqual(2, len(os.listdir(os.path.join(self.outdir, 'sub'))))
+
+        # Up to date
+        self.assertEqual(([], 2), self._render())
+
+        # Touched, same content
+        os.utime(self.source1, None)
+        self.assertEqual(([], 2), self._render())
+
+        # Modified, new data file and missing figure
+        self._write(self.source1, 2)
+        source3 = self._write(os.path.join(self.indir, 'sample3.hmsa'))
+        os.remove(os.path.join(self.outdir, 'sub', 'sample2_Spectrum.png'))
+        results, current = self._render()
+        expected = [('sample1.hmsa', 'Map'), ('sample1.hmsa', 'Spectrum'),
+                    ('sample2.hmsa', 'Map'), ('sample2.hmsa', 'Spectrum'),
+                    ('sample3.hmsa', 'Map'), ('sample3.hmsa', 'Spectrum')]
+        self.assertEqual(expected, results)
+        self.assertEqual(0, current)
+
+        manifest = Manifest(os.path.join(self.outdir, MANIFEST_FILENAME))
+        self.assertEqual(3, len(manifest))
+        self.assertEqual(hash_source(source3), manifest.get(source3)['hash'])
+
+        # Other options
+        results, current = self._render(dpi=20)
+        self.assertEqual(6, len(results))
+        results, current = self._render(force=True, dpi=20)
+        self.assertEqual(6, len(results))
+
+    def testrender_read_once(self):
+        reads = []
+        def _read_identifiers(source):
+            reads.append(source)
+            return read_identifiers(source)
+
+        with mock.patch('pyhmsa_plot.cli.read_identifiers', _read_identifiers), \
+                mock.patch('pyhmsa_plot.batch.read_identifiers', _read_identifiers):
+            self._render()
+        self.assertEqual(sorted([self.source1, self.source2]), sorted(reads))
+
+    def testrender_resume(self):
+        self._render()
+
+        # Interrupted while recording the second data file
+        filepath = os.path.join(self.outdir, MANIFEST_FILENAME)
+        with open(filepath, 'r') as fp:
+            lines = fp.readlines()
+        with open(filepath, 'w') as fp:
+            fp.write(lines[0])
+            fp.write(lines[1][:10])
+        os.remove(os.path.join(self.outdir, 'sub', 'sample2_Spectrum.png'))
+
+        results, current = self._render()
+        self.assertEqual([('sample2.hmsa', 'Map'), ('sample2.hmsa', 'Spectrum')],
+                         results)
+        self.assertEqual(1, current)
+
+    def testrender_without_manifest(self):
+        self._render()
+        os.remove(os.path.join(self.outdir, MANIFEST_FILENAME))
+        self.assertEqual(([], 2), self._render())
+
+    def testrender_errors(self):
+        datafile = DataFile.read(self.source1)
+        datafile.data['Value'] = Analysis0D(1.0)
+        datafile.write(self.source1)
+
+        results, current = self._render()
+        self.assertEqual(5, len(results))
+        self.assertEqual(([], 2), self._render())
+
+        results, current = self._render(retry=True)
+        self.assertEqual(3, len(results))
+        self.assertEqual(1, current)
+
+    def testrender_same_name(self):
+        # Same relative path in two directories
+        otherdir = os.path.join(self.tmpdir, 'other')
+        os.makedirs(otherdir)
+        other = self._write(os.path.join(otherdir, 'sample1.hmsa'), 2)
+        self._render()
+
+        sources = find_sources([otherdir])
+        results, current = render(list(sources), self.outdir, max_workers=1,
+                                  names=sources)
+        self.assertEqual(2, len(results))
+        self.assertTrue(all(result.error for result in results))
+        self.assertIn('already used by %s' % self.source1, results[0].error)
+
+        # Reported again, the figures of the first data file are kept
+        results, current = render(list(sources), self.outdir, max_workers=1,
+                                  names=sources)
+        self.assertEqual(2, len(results))
+        self.assertEqual(([], 2), self._render())
+
+    def testmain(self):
+        argv = [self.indir, '-o', self.outdir, '-j', '1', '-q']
+        self.assertEqual(0, main(argv))
+        self.assertEqual(0, main(argv))
+        self.assertEqual(4, len(os.listdir(self.outdir)))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,128 @@
+"""
+Robust color limits from percentiles of large images.
+"""
+
+# Standard library modules.
+
+# Third party modules.
+import numpy as np
+
+# Local modules.
+
+# Globals and constants variables.
+SAMPLE_SIZE = 2 ** 20 # pixels
+BAND_SIZE = 2 ** 22 # pixels
+BINS = 65536
+
+# Keyword of numpy.percentile selecting the value at the nearest lower rank,
+# renamed in NumPy 1.22 (and the old name removed in NumPy 2)
+if np.lib.NumpyVersion(np.__version__) >= '1.22.0':
+    _LOWER = {'method': 'lower'}
+else: #pragma: no cover
+    _LOWER = {'interpolation': 'lower'}
+
+def lower_percentile(a, q, axis=None, ignore_nan=False):
+    """
+    Returns the percentiles *q* (in [0, 100]) of *a* along *axis*, as
+    :func:`numpy.percentile` (or :func:`numpy.nanpercentile` if
+    *ignore_nan*), taking the value at the nearest lower rank, whatever
+    the version of NumPy.
+    """
+    func = np.nanpercentile if ignore_nan else np.percentile
+    return func(a, q, axis=axis, **_LOWER)
+
+def strided_sample(A, size=SAMPLE_SIZE):
+    """
+    Returns a sample of about *size* pixels of the image *A*, made of every
+    n-th pixel of every n-th row. Only the sampled rows of a memory-mapped
+    image are read.
+    """
+    step = max(1, int(np.ceil(np.sqrt(A.size / size))))
+    return np.asarray(A[::step, ::step])
+
+def percentiles(A, q, method='sample', sample_size=SAMPLE_SIZE):
+    """
+    Returns the percentiles *q* (in [0, 100]) of the finite values of the
+    image *A*, as floats. Returns ``None`` for each percentile if *A* has no
+    finite values.
+
+    :arg method: either
+
+        * ``'sample'``: percentiles of a strided sample of about
+          *sample_size* pixels (see :func:`strided_sample`)
+        * ``'stream'``: percentiles of a histogram built band of rows by
+          band of rows, so that only a band of a memory-mapped image is
+          loaded in memory at any time. The histogram is exact for 8 and
+          16-bit integers (single pass). Otherwise, a first pass finds the
+          range of the values and the histogram has :data:`BINS` bins.
+
+    Percentiles are the values at the nearest lower rank (see
+    :func:`lower_percentile`).
+    """
+    scalar = np.ndim(q) == 0
+    q = np.atleast_1d(np.asarray(q, dtype=float))
+    if ((q < 0) | (q > 100)).any():
+        raise ValueError('Percentiles must be in [0, 100]')
+
+    if method == 'sample':
+        values = strided_sample(A, sample_size)
+        values = values[np.isfinite(values)] \
+            if values.dtype.kind in 'fc' else values.ravel()
+        if values.size == 0:
+            result = [None] * len(q)
+        else:
+            result = lower_percentile(values, q).tolist()
+    elif method == 'stream':
+        result = _stream_percentiles(A, q)
+    else:
+        raise ValueError('Unknown method: %s' % method)
+
+    result = [None if r is None else float(r) for r in result]
+    return result[0] if scalar else result
+
+def _iter_bands(A):
+    rows = max(1, BAND_SIZE // max(1, A[0].size))
+    for r0 in range(0, A.shape[0], rows):
+        band = np.asarray(A[r0:r0 + rows])
+        if band.dtype.kind in 'fc':
+            band = band[np.isfinite(band)]
+        yield band.ravel()
+
+def _stream_percentiles(A, q):
+    if A.dtype.kind in 'biu' and A.dtype.itemsize <= 2:
+        offset = 0 if A.dtype.kind in 'bu' else int(np.iinfo(A.dtype).min)
+        minlength = 2 ** (8 * A.dtype.itemsize)
+        counts = np.zeros(minlength, np.int64)
+        for band in _iter_bands(A):
+            counts += np.bincount((band.astype(np.int64) - offset),
+                                  minlength=minlength)
+        edges = np.arange(minlength) + offset
+    else:
+        vmin, vmax = np.inf, -np.inf
+        for band in _iter_bands(A):
+            if band.size:
+                vmin = min(vmin, band.min())
+                vmax = max(vmax, band.max())
+        if vmin > vmax:
+            return [None] * len(q)
+        if vmin == vmax:
+            return [vmin] * len(q)
+
+        counts = np.zeros(BINS, np.int64)
+        for band in _iter_bands(A):
+            counts += np.histogram(band, BINS, (vmin, vmax))[0]
+        edges = np.linspace(vmin, vmax, BINS + 1)[:-1]
+
+    total = counts.sum()
+    if total == 0:
+        return [None] * len(q)
+
+    # Index of the bin containing the value at the lower rank
+    ranks = np.floor(q / 100.0 * (total - 1)).astype(np.int64)
+    indices = np.searchsorted(np.cumsum(counts), ranks, side='right')
+    result = edges[indices]
+
+    # The extremes are known exactly
+    if A.dtype.kind not in 'biu' or A.dtype.itemsize > 2:
+        result[ranks == total - 1] = vmax
+    return result.tolist()
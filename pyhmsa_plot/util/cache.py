@@ -0,0 +1,70 @@
+""""""
+
+# Standard library modules.
+from collections import OrderedDict
+import threading
+
+# Third party modules.
+
+# Local modules.
+
+# Globals and constants variables.
+
+class LRUCache(object):
+    """
+    Thread-safe mapping holding at most *maxsize* items. When full, the least
+    recently used item is discarded.
+    """
+
+    def __init__(self, maxsize=128):
+        self._maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                return default
+            self._items[key] = value
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self._maxsize:
+                self._items.popitem(last=False)
+
+    def keys(self):
+        """Returns a list of the keys, from the least to the most recently
+        used."""
+        with self._lock:
+            return list(self._items.keys())
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._items.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self, maxsize):
+        with self._lock:
+            self._maxsize = maxsize
+            while len(self._items) > self._maxsize:
+                self._items.popitem(last=False)
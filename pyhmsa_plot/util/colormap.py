@@ -0,0 +1,122 @@
+"""
+Colormapping of scalar data to RGBA, with lookup tables for integer data.
+"""
+
+# Standard library modules.
+
+# Third party modules.
+import numpy as np
+
+import matplotlib
+import matplotlib.cm
+from matplotlib.colors import Colormap
+try:
+    from matplotlib import colormaps # matplotlib >= 3.5
+except ImportError: #pragma: no cover
+    colormaps = None
+
+# Local modules.
+from pyhmsa_plot.util.cache import LRUCache
+
+# Globals and constants variables.
+LUT_MAX_SIZE = 65536
+
+_luts = LRUCache(16)
+
+def get_cmap(cmap=None):
+    """
+    Returns the colormap registered as *cmap* (default: ``image.cmap``),
+    or *cmap* itself if it is a colormap, with any version of matplotlib.
+    """
+    if isinstance(cmap, Colormap):
+        return cmap
+    if cmap is None:
+        cmap = matplotlib.rcParams['image.cmap']
+    if colormaps is not None:
+        return colormaps[cmap]
+    return matplotlib.cm.get_cmap(cmap)
+
+def get_colormap_key(cmap, norm):
+    """
+    Returns a hashable key identifying the state of *cmap* and *norm* from
+    their content, so that in-place modifications (e.g. ``set_under`` or
+    ``norm.vmin = 0``) give another key, and equal copies the same key.
+    The colormap is identified by its colors, including the colors of bad,
+    under and over values. The norm is identified by its type and the
+    numerical values of its attributes (e.g. limits, gamma or boundaries).
+    """
+    return (_get_cmap_key(cmap), _get_norm_key(norm))
+
+def _get_cmap_key(cmap):
+    indices = np.arange(-1, cmap.N + 2)
+    mask = indices > cmap.N # Last index is a bad value
+    colors = cmap(np.ma.array(indices, mask=mask), bytes=True)
+    return cmap.N, colors.tobytes()
+
+def _get_norm_key(norm):
+    items = []
+    for name, value in sorted(vars(norm).items()):
+        if value is None:
+            items.append((name, None))
+            continue
+        try:
+            value = np.asarray(value, dtype=float)
+        except (TypeError, ValueError): # e.g. callbacks
+            continue
+        items.append((name, value.shape, value.tobytes()))
+    return (type(norm),) + tuple(items)
+
+def get_lut(cmap, norm, values):
+    """
+    Returns the RGBA lookup table of *values* mapped through *norm* and
+    *cmap*. Each RGBA color is packed in a uint32, so that colormapping is a
+    single gather of 4-byte items. Tables are cached per colormap, norm,
+    data type and range of *values*.
+    """
+    key = get_colormap_key(cmap, norm) + \
+        (values.dtype.str, values[0], values[-1])
+
+    lut = _luts.get(key)
+    if lut is None:
+        lut = np.ascontiguousarray(cmap(norm(values), bytes=True))
+        lut = lut.view(np.uint32).reshape(-1)
+        _luts.put(key, lut)
+
+    return lut
+
+def apply_colormap(A, cmap, norm):
+    """
+    Maps the scalar data *A* through *norm* and *cmap* and returns the
+    uint8 RGBA array, as ``cmap(norm(A), bytes=True)``.
+
+    Unmasked integer data is colormapped through a lookup table of at most
+    :data:`LUT_MAX_SIZE` entries with a single gather, instead of
+    normalizing each value.
+    For 8 and 16-bit integers, the table covers all possible values, so
+    it only needs to be rebuilt when *cmap* or *norm* changes.
+    """
+    if A.dtype.kind not in 'iu' or np.ma.getmask(A) is not np.ma.nomask:
+        return cmap(norm(A), bytes=True)
+
+    A = np.ma.getdata(A)
+
+    if A.dtype.itemsize <= 2:
+        itype = np.dtype('u%i' % A.dtype.itemsize)
+        values = np.arange(2 ** (8 * itype.itemsize)).astype(itype)
+        lut = get_lut(cmap, norm, values.view(A.dtype))
+        return _gather(lut, A.view(itype))
+
+    if A.size == 0:
+        return cmap(norm(A), bytes=True)
+
+    vmin, vmax = A.min(), A.max()
+    if int(vmax) - int(vmin) >= LUT_MAX_SIZE:
+        return cmap(norm(A), bytes=True)
+
+    values = np.arange(vmin, vmax + 1, dtype=A.dtype)
+    lut = get_lut(cmap, norm, values)
+    return _gather(lut, A - vmin)
+
+def _gather(lut, indices):
+    rgba = np.take(lut, indices)
+    return rgba.view(np.uint8).reshape(indices.shape + (4,))
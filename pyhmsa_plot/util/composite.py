@@ -0,0 +1,111 @@
+"""
+Additive color composite of several images.
+"""
+
+# Standard library modules.
+
+# Third party modules.
+import numpy as np
+
+from matplotlib.colors import to_rgb
+
+# Local modules.
+from pyhmsa_plot.util.memmap import is_memmap, create_memmap
+
+# Globals and constants variables.
+BAND_SIZE = 2 ** 20 # pixels
+COLORS = [(1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0),
+          (0.0, 1.0, 1.0), (1.0, 0.0, 1.0), (1.0, 1.0, 0.0)]
+
+def composite(images, colors=None, vmins=None, vmaxs=None, out=None):
+    """
+    Returns the additive color composite of the *images* as a RGB array of
+    8-bit integers.
+    Each image is normalized to [0, 1] between its lower and upper limits,
+    multiplied by its color and added to the others. The sum is clipped to
+    [0, 1]. Missing values (NaN) do not contribute.
+
+    The images are blended band of rows by band of rows, all at once, so
+    that only a band of each image is converted to floating point at any
+    time. Memory-mapped images are blended in a temporary memory-mapped
+    array.
+
+    :arg images: sequence of 2D arrays of the same shape
+    :arg colors: color of each image, in any format understood by
+        matplotlib (default: red, green, blue, cyan, magenta, yellow)
+    :arg vmins: lower limit of each image. An image without limit (``None``)
+        is normalized by its minimum.
+    :arg vmaxs: upper limit of each image. An image without limit (``None``)
+        is normalized by its maximum.
+    :arg out: output array of shape ``images[0].shape + (3,)`` (optional)
+    """
+    n = len(images)
+    if n == 0:
+        raise ValueError('No image to blend')
+    shape = images[0].shape
+    if len(shape) != 2 or any(image.shape != shape for image in images):
+        raise ValueError('All images must be 2D and have the same shape')
+
+    if colors is None:
+        if n > len(COLORS):
+            raise ValueError('Specify the colors of more than %i images'
+                             % len(COLORS))
+        colors = COLORS[:n]
+    if len(colors) != n:
+        raise ValueError('There must be one color per image')
+    colors = np.array([to_rgb(color) for color in colors], np.float32)
+
+    offsets, scales = _get_normalization(images, vmins, vmaxs)
+
+    if out is None:
+        if any(is_memmap(image) for image in images):
+            out = create_memmap(shape + (3,), np.uint8)
+        else:
+            out = np.empty(shape + (3,), np.uint8)
+
+    rows = max(1, BAND_SIZE // max(1, shape[1]))
+    W = np.empty((n, min(rows, shape[0]), shape[1]), np.float32)
+    for r0 in range(0, shape[0], rows):
+        r1 = min(r0 + rows, shape[0])
+        band = W[:, :r1 - r0]
+        for index, image in enumerate(images):
+            band[index] = image[r0:r1]
+        band -= offsets
+        band *= scales
+        np.clip(band, 0.0, 1.0, out=band)
+        np.nan_to_num(band, copy=False)
+
+        # Weighted sum of the colors of all images at once
+        rgb = np.tensordot(band, colors, axes=(0, 0))
+        np.clip(rgb, 0.0, 1.0, out=rgb)
+        rgb *= 255.0
+        rgb += 0.5
+        out[r0:r1] = rgb
+
+    return out
+
+def _get_normalization(images, vmins, vmaxs):
+    """
+    Returns the offset and scale of each image, broadcastable against a
+    band of rows of all images.
+    """
+    n = len(images)
+    vmins = [None] * n if vmins is None else list(vmins)
+    vmaxs = [None] * n if vmaxs is None else list(vmaxs)
+    if len(vmins) != n or len(vmaxs) != n:
+        raise ValueError('There must be one limit per image')
+
+    for index, image in enumerate(images):
+        if vmins[index] is None:
+            vmins[index] = np.nanmin(image)
+        if vmaxs[index] is None:
+            vmaxs[index] = np.nanmax(image)
+
+    vmins = np.array(vmins, np.float64)
+    vmaxs = np.array(vmaxs, np.float64)
+    ranges = vmaxs - vmins
+    ranges[~(ranges > 0)] = 1.0
+
+    offsets = vmins.astype(np.float32)[:, np.newaxis, np.newaxis]
+    scales = (1.0 / ranges).astype(np.float32)[:, np.newaxis, np.newaxis]
+    return offsets, scales
@@ -0,0 +1,124 @@
+"""
+Tiled execution of image filters.
+"""
+
+# Standard library modules.
+import os
+import math
+from concurrent.futures import wait, FIRST_COMPLETED
+
+# Third party modules.
+import numpy as np
+
+# Local modules.
+
+# Globals and constants variables.
+MAX_TILE_SIZE = 2 ** 22 # pixels
+TILES_PER_WORKER = 4
+HALO_FACTOR = 4 # minimum extent of a tile, in halos
+
+def get_tile_shape(shape, halo=0, workers=None):
+    """
+    Returns the shape of the tiles to filter an array of *shape* with a
+    filter of *halo*.
+    The tiles are bands of full rows, so that they are read contiguously
+    from a C-ordered (e.g. memory-mapped) array, of at most
+    :data:`MAX_TILE_SIZE` pixels. With *workers*, the array is split in
+    at least :data:`TILES_PER_WORKER` bands per worker, to balance the load.
+    A band is never thinner than :data:`HALO_FACTOR` times the *halo*, so
+    that the overlap between the tiles remains small; it is then split
+    across columns if needed.
+    """
+    height, width = shape[:2]
+    ntiles = max(1, int(math.ceil(height * width / MAX_TILE_SIZE)))
+    if workers is not None:
+        ntiles = max(ntiles, TILES_PER_WORKER * workers)
+
+    minimum = max(1, HALO_FACTOR * halo)
+    rows = max(minimum, int(math.ceil(height / ntiles)))
+    cols = max(minimum, MAX_TILE_SIZE // rows)
+    return max(1, min(rows, height)), max(1, min(cols, width))
+
+def iter_tiles(shape, tile_shape, halo):
+    """
+    Yields the slices of the tiles covering an array of *shape*.
+    For each tile, the tuple ``(source, destination, crop)`` is returned,
+    where *source* is the tile extended by *halo* pixels on each side
+    (within the array), *destination* is the tile itself and *crop* is the
+    tile within the extended tile.
+    """
+    height, width = shape[:2]
+    tile_height, tile_width = tile_shape
+
+    for r0 in range(0, height, tile_height):
+        r1 = min(r0 + tile_height, height)
+        sr0, sr1 = max(0, r0 - halo), min(height, r1 + halo)
+
+        for c0 in range(0, width, tile_width):
+            c1 = min(c0 + tile_width, width)
+            sc0, sc1 = max(0, c0 - halo), min(width, c1 + halo)
+
+            source = (slice(sr0, sr1), slice(sc0, sc1))
+            destination = (slice(r0, r1), slice(c0, c1))
+            crop = (slice(r0 - sr0, r1 - sr0), slice(c0 - sc0, c1 - sc0))
+            yield source, destination, crop
+
+def _filter_tile(func, tile, crop, kwargs):
+    return func(np.asarray(tile), **kwargs)[crop]
+
+def filter_tiled(func, array, halo, out, tile_shape=None,
+                 executor=None, workers=None, **kwargs):
+    """
+    Applies the neighbourhood filter *func* (e.g.
+    :func:`scipy.ndimage.median_filter`) to *array* tile by tile, storing
+    the result in *out*.
+    Each tile is extended by *halo* pixels, which must be at least the
+    radius of the filter, so that the result is identical to filtering
+    the whole array at once.
+
+    If an *executor* (:class:`concurrent.futures.ThreadPoolExecutor` or
+    :class:`ProcessPoolExecutor <concurrent.futures.ProcessPoolExecutor>`)
+    is specified, the tiles are filtered in parallel. With a process pool,
+    *func* and *kwargs* must be picklable.
+    Otherwise, only one tile of *array* is loaded in memory at any time.
+    With an executor, at most two tiles per worker are; *workers* is the
+    number of workers of the *executor* (by default, the number of CPUs).
+    By default, the shape of the tiles is derived from the shape of
+    *array* and the number of *workers* (see :func:`get_tile_shape`).
+
+    :return: *out*
+    """
+    if executor is None:
+        workers = None
+    elif workers is None:
+        workers = os.cpu_count() or 1
+    if tile_shape is None:
+        tile_shape = get_tile_shape(array.shape, halo, workers)
+    tiles = iter_tiles(array.shape, tile_shape, halo)
+
+    if executor is None:
+        for source, destination, crop in tiles:
+            out[destination] = _filter_tile(func, array[source], crop, kwargs)
+        return out
+
+    pending = {}
+
+    def store(futures):
+        for future in futures:
+            out[pending.pop(future)] = future.result()
+
+    try:
+        for source, destination, crop in tiles:
+            if len(pending) >= 2 * workers:
+                store(wait(pending, return_when=FIRST_COMPLETED).done)
+
+            future = executor.submit(_filter_tile, func,
+                                     np.asarray(array[source]), crop, kwargs)
+            pending[future] = destination
+
+        store(wait(pending).done)
+    finally:
+        for future in pending:
+            future.cancel()
+
+    return out
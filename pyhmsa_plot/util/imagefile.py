@@ -0,0 +1,102 @@
+"""
+Writing of 8-bit arrays as image files, without matplotlib.
+"""
+
+# Standard library modules.
+import io
+import os
+import zlib
+import struct
+
+# Third party modules.
+import numpy as np
+
+# Local modules.
+
+# Globals and constants variables.
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6} # channels: color type
+FORMATS = {'png': 'png', 'jpg': 'jpeg', 'jpeg': 'jpeg'}
+
+def _png_chunk(name, data):
+    return struct.pack('>I', len(data)) + name + data + \
+        struct.pack('>I', zlib.crc32(name + data) & 0xffffffff)
+
+def encode_png(A, compression=6):
+    """
+    Returns the PNG file content of the 8-bit array *A*, either grayscale
+    (2D), or gray and alpha, RGB or RGBA (3D, with 2, 3 or 4 channels).
+
+    :arg compression: zlib compression level, from 0 (none) to 9
+    """
+    A = np.asarray(A)
+    if A.dtype != np.uint8:
+        raise TypeError('Only 8-bit arrays are supported')
+    channels = 1 if A.ndim == 2 else A.shape[-1]
+    if A.ndim not in (2, 3) or channels not in PNG_COLOR_TYPES:
+        raise ValueError('Invalid dimensions for image data')
+
+    # Each row starts with its filter type, 0 (none)
+    height, width = A.shape[:2]
+    raw = np.zeros((height, 1 + width * channels), np.uint8)
+    raw[:, 1:] = A.reshape(height, -1)
+
+    header = struct.pack('>IIBBBBB', width, height, 8,
+                         PNG_COLOR_TYPES[channels], 0, 0, 0)
+    return b''.join([PNG_SIGNATURE,
+                     _png_chunk(b'IHDR', header),
+                     _png_chunk(b'IDAT', zlib.compress(raw.data, compression)),
+                     _png_chunk(b'IEND', b'')])
+
+def encode_jpeg(A, quality=90):
+    """
+    Returns the JPEG file content of the 8-bit array *A*, grayscale or RGB.
+    The alpha channel, if any, is discarded.
+    Requires Pillow.
+    """
+    try:
+        from PIL import Image
+    except ImportError: # pragma: no cover
+        raise ImportError('Pillow is required to write JPEG images')
+
+    A = np.asarray(A)
+    if A.ndim == 3:
+        A = A[..., :1] if A.shape[-1] == 2 else A[..., :3]
+        A = np.ascontiguousarray(A.squeeze(-1) if A.shape[-1] == 1 else A)
+
+    buffer = io.BytesIO()
+    Image.fromarray(A).save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+def get_format(filepath):
+    """
+    Returns the image format (``'png'`` or ``'jpeg'``) of the extension of
+    *filepath*.
+    """
+    ext = os.path.splitext(filepath)[1][1:].lower()
+    if ext not in FORMATS:
+        raise ValueError('Unsupported image format: %s' % ext)
+    return FORMATS[ext]
+
+def encode_image(A, format='png', **kwargs):
+    """
+    Returns the content of the image file of *A* in *format*
+    (``'png'`` or ``'jpeg'``). Other keyword arguments are passed to
+    :func:`encode_png` or :func:`encode_jpeg`.
+    """
+    if format == 'png':
+        return encode_png(A, **kwargs)
+    elif format == 'jpeg':
+        return encode_jpeg(A, **kwargs)
+    raise ValueError('Unsupported image format: %s' % format)
+
+def write_image(filepath, A, format=None, **kwargs):
+    """
+    Writes *A* as an image file to *filepath*. If *format* is ``None``, it
+    is guessed from the extension of *filepath* (see :func:`get_format`).
+    """
+    if format is None:
+        format = get_format(filepath)
+    data = encode_image(A, format, **kwargs)
+    with open(filepath, 'wb') as fp:
+        fp.write(data)
@@ -0,0 +1,201 @@
+"""
+Opt-in instrumentation of the plotting stages.
+
+Durations of stages and counters (e.g. cache hits and misses) are only
+recorded while a :class:`Recorder` is active::
+
+    with record() as recorder:
+        for datum in datums:
+            plot.save(filepath, datum)
+    recorder.dump('stats.json')
+
+When no recorder is active, :func:`stage` and :func:`count` do nothing.
+A recorder is only active in the context where it was activated (the
+thread or, from Python 3.7, the asyncio task), so that concurrent plots do
+not record into each other. Functions run in other threads on behalf of
+this context are wrapped with :func:`bind`.
+"""
+
+# Standard library modules.
+import json
+import time
+import threading
+import functools
+import contextlib
+from collections import OrderedDict
+try:
+    import contextvars
+except ImportError: #pragma: no cover (Python 3.6)
+    contextvars = None
+
+# Third party modules.
+
+# Local modules.
+
+# Globals and constants variables.
+
+if contextvars is not None:
+    _recorders = contextvars.ContextVar('recorders', default=())
+    _get_recorders = _recorders.get
+    _set_recorders = _recorders.set
+else: #pragma: no cover
+    _local = threading.local()
+
+    def _get_recorders():
+        return getattr(_local, 'recorders', ())
+
+    def _set_recorders(recorders):
+        _local.recorders = recorders
+
+class Recorder(object):
+    """
+    Thread-safe collection of stage durations and counters.
+    """
+
+    def __init__(self):
+        self._durations = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def start_stage(self, name):
+        """
+        Called when the stage *name* starts in the context where the
+        recorder is active. Does nothing by default; a subclass may raise
+        an exception to interrupt the plot (e.g. if it was cancelled).
+        """
+        pass
+
+    def add_duration(self, name, duration):
+        with self._lock:
+            self._durations.setdefault(name, []).append(duration)
+
+    def add_count(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def merge(self, other):
+        """
+        Adds the durations and counters of *other*, either a
+        :class:`Recorder` or a dictionary returned by :meth:`to_dict`
+        with ``raw=True`` (e.g. from another process).
+        """
+        if isinstance(other, Recorder):
+            other = other.to_dict(raw=True)
+
+        with self._lock:
+            for name, durations in other['stages'].items():
+                self._durations.setdefault(name, []).extend(durations)
+            for name, n in other['counters'].items():
+                self._counters[name] = self._counters.get(name, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+            self._counters.clear()
+
+    def get_durations(self, name):
+        with self._lock:
+            return list(self._durations.get(name, []))
+
+    def get_count(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def to_dict(self, raw=False):
+        """
+        Returns the statistics of each stage (number of calls, total, mean,
+        minimum and maximum durations in seconds) and the counters.
+        If *raw*, the list of durations of each stage is returned instead
+        of their statistics.
+        """
+        with self._lock:
+            stages = OrderedDict()
+            for name in sorted(self._durations):
+                durations = self._durations[name]
+                if raw:
+                    stages[name] = list(durations)
+                    continue
+
+                stats = OrderedDict()
+                stats['count'] = len(durations)
+                stats['total'] = sum(durations)
+                stats['mean'] = stats['total'] / len(durations)
+                stats['min'] = min(durations)
+                stats['max'] = max(durations)
+                stages[name] = stats
+
+            counters = OrderedDict(sorted(self._counters.items()))
+
+        return OrderedDict([('stages', stages), ('counters', counters)])
+
+    def dump(self, filepath, raw=False):
+        """
+        Saves the statistics (see :meth:`to_dict`) as JSON in *filepath*.
+        """
+        with open(filepath, 'w') as fp:
+            json.dump(self.to_dict(raw), fp, indent=2)
+
+@contextlib.contextmanager
+def record(recorder=None):
+    """
+    Activates *recorder*, or a new :class:`Recorder`, within the context.
+    Recorders can be nested; all active recorders receive the same data.
+    """
+    if recorder is None:
+        recorder = Recorder()
+
+    previous = _get_recorders()
+    _set_recorders(previous + (recorder,))
+    try:
+        yield recorder
+    finally:
+        _set_recorders(previous)
+
+def bind(func):
+    """
+    Returns a function calling *func* with the recorders active when
+    :func:`bind` is called, e.g. to record a task submitted to a thread.
+    """
+    recorders = _get_recorders()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        previous = _get_recorders()
+        _set_recorders(recorders)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _set_recorders(previous)
+    return wrapper
+
+@contextlib.contextmanager
+def _timed_stage(name, recorders):
+    for recorder in recorders:
+        recorder.start_stage(name)
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        for recorder in recorders:
+            recorder.add_duration(name, duration)
+
+_null_stage = contextlib.suppress()
+
+def stage(name):
+    """
+    Returns a context manager recording the duration of the stage *name*
+    in the active recorders.
+    """
+    recorders = _get_recorders()
+    if not recorders:
+        return _null_stage
+    return _timed_stage(name, recorders)
+
+def count(name, n=1):
+    """
+    Increments the counter *name* of the active recorders by *n*.
+    """
+    for recorder in _get_recorders():
+        recorder.add_count(name, n)
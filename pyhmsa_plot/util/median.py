@@ -0,0 +1,168 @@
+"""
+Histogram-based median filter for integer images.
+"""
+
+# Standard library modules.
+
+# Third party modules.
+import numpy as np
+
+import scipy.ndimage as ndimage
+
+# Local modules.
+
+# Globals and constants variables.
+BAND_SIZE = 2 ** 18 # pixels
+
+# Maximum number of distinct values of a band, per element of the kernel,
+# for which the histogram is faster than scipy
+MAX_LEVELS_PER_ELEMENT = 2
+
+def median_filter(input, size=3, origin=0):
+    """
+    Calculates a median filter of the integer image *input* with a
+    rectangular kernel of *size*, which gives the same result as
+    :func:`scipy.ndimage.median_filter` with the default ``'reflect'``
+    boundary mode.
+
+    The median of each pixel is found from the cumulative histogram of its
+    neighbourhood. The values are first replaced by their rank among the
+    distinct values of a band of rows. For each rank, the number of
+    neighbours below or equal to it is obtained for all pixels at once with
+    box sums. The cost per pixel therefore grows with the number of
+    distinct values, not with the size of the kernel, which makes large
+    kernels cheap for count data with few levels.
+    A band with more than :data:`MAX_LEVELS_PER_ELEMENT` distinct values
+    per element of the kernel is filtered with scipy instead, which is then
+    faster.
+
+    :arg input: 2D array of integers
+    :arg size: size of the kernel, either an integer or a tuple for each
+        axis
+    :arg origin: placement of the kernel, as in
+        :func:`scipy.ndimage.median_filter`
+
+    :return: filtered array, of the same type as *input*
+    """
+    input = np.asarray(input)
+    if input.ndim != 2:
+        raise ValueError('Only 2D arrays are supported')
+    if input.dtype.kind not in 'biu':
+        raise TypeError('Only integer arrays are supported')
+
+    sizes = [int(s) for s in np.broadcast_to(size, 2)]
+    origins = [int(o) for o in np.broadcast_to(origin, 2)]
+    pads = []
+    for s, o in zip(sizes, origins):
+        if s < 1:
+            raise ValueError('Invalid kernel size: %s' % s)
+        if not -(s // 2) <= o <= (s - 1) // 2:
+            raise ValueError('Invalid origin: %s' % o)
+        before = s // 2 + o
+        pads.append((before, s - 1 - before))
+
+    output = np.empty_like(input)
+    if input.size == 0:
+        return output
+
+    # Rank of the median among the values of the kernel
+    target = sizes[0] * sizes[1] // 2 + 1
+
+    height, width = input.shape
+    rows = max(1, BAND_SIZE // max(1, width))
+    (top, bottom), (left, right) = pads
+
+    for r0 in range(0, height, rows):
+        r1 = min(r0 + rows, height)
+        band = _pad_band(input, r0, r1, top, bottom)
+        band = np.pad(band, ((0, 0), (left, right)), mode='symmetric')
+
+        values, ranks = _compress(band)
+        if len(values) > MAX_LEVELS_PER_ELEMENT * sizes[0] * sizes[1]:
+            # The kernel lies within the padded band for the output rows
+            filtered = ndimage.median_filter(band, sizes, origin=origins)
+            output[r0:r1] = filtered[top:top + r1 - r0, left:left + width]
+        else:
+            output[r0:r1] = values[_median_rank(ranks, sizes, target)]
+
+    return output
+
+def _pad_band(input, r0, r1, top, bottom):
+    """
+    Returns the rows [r0 - top, r1 + bottom) of *input*, where the rows
+    outside the array are mirrored, as with ``np.pad(mode='symmetric')``.
+    """
+    height = input.shape[0]
+    indices = np.arange(r0 - top, r1 + bottom)
+
+    # Reflect the indices until they all fall within the array
+    while True:
+        below, above = indices < 0, indices >= height
+        if not below.any() and not above.any():
+            break
+        indices = np.where(below, -indices - 1, indices)
+        indices = np.where(above, 2 * height - indices - 1, indices)
+
+    if indices[0] == r0 - top and indices[-1] == r1 + bottom - 1:
+        return input[r0 - top:r1 + bottom]
+    return input[indices]
+
+def _compress(A):
+    """
+    Returns the sorted distinct values of *A* and the rank of each element
+    of *A* among them.
+    """
+    if A.dtype.itemsize <= 2:
+        offset = int(A.min())
+        counts = np.bincount((A.ravel() - offset).astype(np.intp))
+        present = counts > 0
+        values = (np.flatnonzero(present) + offset).astype(A.dtype)
+        lut = np.cumsum(present) - 1
+        ranks = lut[(A - offset).astype(np.intp)]
+    else:
+        values, ranks = np.unique(A, return_inverse=True)
+        ranks = ranks.reshape(A.shape)
+
+    return values, ranks.astype(_index_dtype(len(values)))
+
+def _index_dtype(n):
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if n <= np.iinfo(dtype).max:
+            return dtype
+    return np.uint64
+
+def _median_rank(ranks, sizes, target):
+    """
+    Returns, for each pixel, the rank of the median of its neighbourhood.
+    *ranks* is padded by the kernel.
+    Since the number of neighbours below or equal to a rank increases with
+    the rank, the rank of the median is the number of ranks for which this
+    number is below *target*.
+    """
+    ky, kx = sizes
+    shape = (ranks.shape[0] - ky + 1, ranks.shape[1] - kx + 1)
+
+    count = np.zeros(shape, np.int32)
+    median = np.zeros(shape, np.intp)
+    for rank in range(ranks.max() + 1):
+        count += _box_sum(ranks == rank, ky, kx)
+
+        below = count < target
+        if not below.any():
+            break
+        median += below
+
+    return median
+
+def _box_sum(B, ky, kx):
+    """
+    Returns the sum of each window of *ky* x *kx* elements of *B*.
+    """
+    cumsum = np.cumsum(B, axis=0, dtype=np.int32)
+    S = cumsum[ky - 1:].copy()
+    S[1:] -= cumsum[:-ky]
+
+    cumsum = np.cumsum(S, axis=1, out=S)
+    out = cumsum[:, kx - 1:].copy()
+    out[:, 1:] -= cumsum[:, :-kx]
+    return out
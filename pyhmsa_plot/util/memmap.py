@@ -0,0 +1,125 @@
+"""
+Memory-mapped access to the data of HMSA files.
+"""
+
+# Standard library modules.
+import os
+import mmap
+import binascii
+import tempfile
+import weakref
+
+# Third party modules.
+from pkg_resources import iter_entry_points
+
+import numpy as np
+
+from pyhmsa.fileformat.datafile import _DataFileReaderMixin, _extract_filepath
+from pyhmsa.fileformat.xmlhandler.datum.imageraster import \
+    ImageRaster2DXMLHandler
+
+# Local modules.
+
+# Globals and constants variables.
+
+class _MemmapImageRaster2DXMLHandler(ImageRaster2DXMLHandler):
+
+    def _parse_binary(self, element):
+        offset = self._parse_data_offset(element)
+        dtype = self._parse_datum_type(element)
+        length = self._parse_data_length(element)
+        return np.memmap(self._hmsa_file.name, dtype, 'r', offset,
+                         (length // dtype.itemsize,))
+
+class _MemmapDataFileReader(_DataFileReaderMixin):
+
+    def _update_status(self, progress, status):
+        pass
+
+    def is_cancelled(self):
+        return False
+
+    def _read_data(self, datafile, root, hmsa_file):
+        # Check UID
+        xml_uid = root.attrib['UID'].encode('ascii')
+        hmsa_uid = binascii.hexlify(hmsa_file.read(8))
+        if xml_uid.upper() != hmsa_uid.upper():
+            raise ValueError('UID in XML (%s) does not match UID in HMSA (%s)' % \
+                             (xml_uid, hmsa_uid))
+
+        # Load handlers, memory-mapped handler first
+        handlers = [_MemmapImageRaster2DXMLHandler(datafile.version, hmsa_file,
+                                                   datafile.conditions)]
+        for entry_point in iter_entry_points('pyhmsa.fileformat.xmlhandler.datum'):
+            handler_class = entry_point.resolve()
+            handler = handler_class(datafile.version, hmsa_file,
+                                    datafile.conditions)
+            handlers.append(handler)
+
+        # Parse data
+        for element in root.findall('Data/*'):
+            key = element.get('Name', 'Inst%i' % len(datafile.data))
+
+            for handler in handlers:
+                if handler.can_parse(element):
+                    datafile.data[key] = handler.parse(element)
+                    break
+
+def read_memmap(filepath):
+    """
+    Reads an existing HMSA data file, where the data of the
+    :class:`ImageRaster2D <pyhmsa.spec.datum.imageraster.ImageRaster2D>`
+    datums is memory-mapped (read-only) from the HMSA file instead of being
+    loaded in memory. Only the parts of a map which are accessed are read
+    from disk.
+    Other datums are read as usual.
+    Since it would require to read the whole file, the checksum is not
+    verified.
+
+    :arg filepath: either the location of the XML or HMSA file.
+        Note that both have to be present.
+
+    :return: data file
+    :rtype: :class:`DataFile <pyhmsa.datafile.DataFile>`
+    """
+    filepath_xml, filepath_hmsa = _extract_filepath(filepath)
+    if not os.path.exists(filepath_xml):
+        raise IOError('XML file is missing')
+    if not os.path.exists(filepath_hmsa):
+        raise IOError('HMSA file is missing')
+
+    reader = _MemmapDataFileReader()
+    with open(filepath_xml, 'rb') as xml_file, \
+            open(filepath_hmsa, 'rb') as hmsa_file:
+        datafile = reader._read(xml_file, hmsa_file)
+    datafile._filepath = filepath_hmsa
+
+    return datafile
+
+def is_memmap(array):
+    """
+    Returns whether the data of *array* is memory-mapped, i.e. whether
+    *array* or one of its bases is a :class:`numpy.memmap`.
+    """
+    while array is not None:
+        if isinstance(array, (np.memmap, mmap.mmap)):
+            return True
+        array = getattr(array, 'base', None)
+    return False
+
+def create_memmap(shape, dtype):
+    """
+    Returns a writable :class:`numpy.memmap` backed by a temporary file,
+    which is deleted when the array is garbage collected.
+    The file stays open as long as it is mapped, as required on Windows.
+    """
+    fp = tempfile.TemporaryFile()
+    try:
+        array = np.memmap(fp, dtype, 'w+', shape=shape)
+    except:
+        fp.close()
+        raise
+
+    # Closed once the mapping, shared by the views of the array, is released
+    weakref.finalize(array.base, fp.close)
+    return array
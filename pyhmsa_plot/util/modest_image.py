@@ -4,6 +4,11 @@ set_extent.
 """
 from __future__ import print_function, division
 
+import copy
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import matplotlib
 rcParams = matplotlib.rcParams
 
@@ -13,6 +18,16 @@ import matplotlib.transforms as mtransforms
 import matplotlib.cbook as cbook
 import numpy as np
 
+from pyhmsa_plot.util.cache import LRUCache
+from pyhmsa_plot.util.colormap import apply_colormap, get_colormap_key
+from pyhmsa_plot.util.instrument import stage, count, bind
+
+REDUCTIONS = {'mean': np.mean, 'sum': np.sum, 'max': np.max, 'min': np.min}
+TILE_CACHE_SIZE = 256 # RGBA tiles
+TILE_DATA_CACHE_SIZE = 256 # downsampled data of the tiles
+BAND_SIZE = 2 ** 26 # bytes
+AUTOSCALE_SIZE = 512
+
 
 class ModestImage(mi.AxesImage):
 
@@ -35,33 +50,238 @@ class ModestImage(mi.AxesImage):
 
     def __init__(self, *args, **kwargs):
         self._full_res = None
+        self._pyramid = None
+        self._reduction = 'stride'
+        self._dtype = None
+        self._flip = (False, False)
+        self._pipeline = None
+        self._processed = {}
+        self._processed_locks = {}
+        self._tile_size = None
+        self._tile_cache = LRUCache(TILE_CACHE_SIZE)
+        self._tile_data_cache = LRUCache(TILE_DATA_CACHE_SIZE)
+        self._tile_colormap = None
+        self._view_rgba = None
+        self._has_invalid = None
+        self._generation = 0
+        self._lock = threading.RLock() # guards the swap of the data
+        self._level_locks = {}
+        self._prefetch = False
+        self._prefetch_future = None
+        self._prefetch_token = None
         self._sx, self._sy = None, None
         self._bounds = None
         self._scale_transform = None
         super(ModestImage, self).__init__(*args, **kwargs)
 
+    def set_reduction(self, reduction):
+        """
+        Set how the data array is downsampled before drawing. With
+        ``'stride'``, every n-th pixel is kept. With ``'mean'``, ``'sum'``,
+        ``'max'`` or ``'min'``, each block of n x n pixels is reduced to a
+        single value. Block reductions only apply to scalar (2D) images;
+        RGB(A) images are always downsampled with ``'stride'``.
+        With ``'sum'``, the pyramid levels store the sums of the blocks (of
+        integers, in 64-bit integers, see :func:`reduction_dtype`), but the
+        drawn values are the sums divided by the number of pixels of their
+        blocks, so that they match the norm of the full-resolution data.
+
+        ACCEPTS: ['stride' | 'mean' | 'sum' | 'max' | 'min']
+        """
+        if reduction != 'stride' and reduction not in REDUCTIONS:
+            raise ValueError('Unknown reduction: %s' % reduction)
+        self._reduction = reduction
+        self._reset_pyramid()
+
+    def get_reduction(self):
+        """Return the downsampling method"""
+        return self._reduction
+
+    def set_dtype(self, dtype):
+        """
+        Set the data type of the pyramid levels and of the downsampled
+        arrays which are normalized and colormapped. If *None*, the type
+        resulting from the reduction is used (e.g. float64 for ``'mean'``).
+        With ``'native'``, the data type of the image array is kept.
+        Values are rounded and clipped when cast to an integer type.
+        The full resolution array is never converted.
+        The data type only applies to scalar (2D) images.
+
+        ACCEPTS: None, 'native' or numpy dtype
+        """
+        if dtype is not None and not is_native(dtype):
+            dtype = np.dtype(dtype)
+        self._dtype = dtype
+        self._reset_pyramid()
+
+    def get_dtype(self):
+        """Return the data type of the downsampled arrays"""
+        return self._dtype
+
+    def set_flip(self, flip):
+        """
+        Set whether the image array is displayed flipped horizontally
+        and/or vertically, as a tuple ``(flip_x, flip_y)``.
+        Flipping is done through a view of the array, so an array
+        stored in another orientation than the displayed one (e.g. a
+        C-contiguous buffer) is never copied; only the downsampled array
+        which is drawn is in the displayed orientation.
+
+        ACCEPTS: (bool, bool)
+        """
+        self._flip = (bool(flip[0]), bool(flip[1]))
+        self._reset_pyramid()
+
+    def get_flip(self):
+        """Return whether the image array is flipped horizontally and
+        vertically"""
+        return self._flip
+
+    def _get_oriented(self):
+        """Returns a view of the image array in the displayed orientation."""
+        flip_x, flip_y = self._flip
+        return self._full_res[::-1 if flip_y else 1, ::-1 if flip_x else 1]
+
+    def set_pipeline(self, pipeline):
+        """
+        Set the :class:`Pipeline <pyhmsa_plot.util.pipeline.Pipeline>`
+        applied to the image before it is drawn, or *None*.
+        The pipeline is evaluated lazily when drawing, only on the visible
+        region (extended by the halo of the pipeline) of the pyramid level
+        matching the view, with its parameters scaled to the resolution of
+        the level. Zoomed out views are therefore cheap approximations of
+        the processed image, while views at 1:1 are exact.
+        With tiling, the processed tiles are cached.
+        The pipeline must not change the shape of the image.
+
+        ACCEPTS: Pipeline or None
+        """
+        self._pipeline = pipeline if pipeline else None
+        self._reset_pyramid()
+
+    def get_pipeline(self):
+        """Return the pipeline applied to the image"""
+        return self._pipeline
+
+    def _reset_pyramid(self):
+        if self._full_res is None:
+            return
+        with self._lock:
+            self._cancel_prefetch()
+            self._pyramid = {0: self._get_oriented()}
+            self._level_locks = {}
+            self._processed = {}
+            self._processed_locks = {}
+            self._generation += 1
+            self._tile_cache.clear()
+            self._tile_data_cache.clear()
+        self._sx, self._sy = None, None
+        self._bounds = None
+
+    def set_tile_size(self, size):
+        """
+        Set the size of the tiles, in downsampled pixels, in which the
+        image is colormapped before drawing. The RGBA array of each tile is
+        cached, so that panning only colormaps the newly exposed tiles.
+        If *None*, tiling is disabled and the colormapping is done by
+        matplotlib on the whole visible area.
+
+        ACCEPTS: int or None
+        """
+        with self._lock:
+            self._cancel_prefetch()
+            self._tile_size = size
+            self._generation += 1
+            self._tile_cache.clear()
+            self._tile_data_cache.clear()
+        self._bounds = None
+
+    def get_tile_size(self):
+        """Return the size of the tiles"""
+        return self._tile_size
+
+    def set_prefetch(self, prefetch):
+        """
+        Set whether the views likely to be drawn next (the neighbouring
+        views when panning, and the views when zooming in or out) are
+        computed ahead of time in a background thread. The pyramid levels
+        of these views are computed and, if tiling is enabled, their RGBA
+        tiles are cached.
+
+        ACCEPTS: bool
+        """
+        self._prefetch = prefetch
+        if not prefetch:
+            self._cancel_prefetch()
+
+    def get_prefetch(self):
+        """Return whether views are prefetched in a background thread"""
+        return self._prefetch
+
+    def set_tile_cache_size(self, maxsize):
+        """
+        Set the maximum number of RGBA tiles kept in the cache. The
+        downsampled data of the tiles is cached separately, so that a
+        change of norm or colormap does not evict it.
+
+        ACCEPTS: int
+        """
+        self._tile_cache.maxsize = maxsize
+
+    def get_tile_cache_size(self):
+        """Return the maximum number of RGBA tiles kept in the cache"""
+        return self._tile_cache.maxsize
+
+    def _get_reduction_func(self):
+        if self._full_res.ndim != 2:
+            return None
+        return REDUCTIONS.get(self._reduction)
+
+    def _get_dtype(self):
+        if self._dtype is None or self._full_res.ndim != 2:
+            return None
+        if is_native(self._dtype):
+            return reduction_dtype(self._reduction, self._full_res.dtype)
+        return reduction_dtype(self._reduction, self._dtype)
+
     def set_data(self, A):
         """
         Set the image array
 
         ACCEPTS: numpy/PIL Image A
         """
-        self._full_res = A
-        self._A = A
-
-        if self._A.dtype != np.uint8 and not np.can_cast(self._A.dtype,
-                                                         np.float):
+        if A.dtype != np.uint8 and not np.can_cast(A.dtype, np.float):
             raise TypeError("Image data can not convert to float")
 
-        if (self._A.ndim not in (2, 3) or
-                (self._A.ndim == 3 and self._A.shape[-1] not in (3, 4))):
+        if (A.ndim not in (2, 3) or
+                (A.ndim == 3 and A.shape[-1] not in (3, 4))):
                 raise TypeError("Invalid dimensions for image data")
 
+        # a prefetch in progress must not see the new data with the state
+        # of the previous one, nor cache anything computed from it
+        with self._lock:
+            self._cancel_prefetch()
+            self._full_res = A
+            self._A = A
+            self._pyramid = {0: self._get_oriented()}
+            self._level_locks = {}
+            self._processed = {}
+            self._processed_locks = {}
+            self._generation += 1
+            self._tile_cache.clear()
+            self._tile_data_cache.clear()
+        self._view_rgba = None
+
+        # integer data never needs to be masked, float data is only checked
+        # for non-finite values when first drawn
+        self._has_invalid = False if A.dtype.kind in 'biu' else None
+
         self._imcache = None
         self._rgbacache = None
         self._oldxslice = None
         self._oldyslice = None
         self._sx, self._sy = None, None
+        self._bounds = None
         self._scale_transform = None
 
     def set_extent(self, extent):
@@ -69,9 +289,36 @@ class ModestImage(mi.AxesImage):
         self._scale_transform = None
 
     def get_array(self):
-        """Override to return the full-resolution array"""
+        """Override to return the full-resolution array, as set (i.e. not
+        flipped)"""
         return self._full_res
 
+    def autoscale(self):
+        """Override to autoscale on the full-resolution array"""
+        if self._full_res is None:
+            raise TypeError('You must first set_array for mappable')
+        self.norm.autoscale(self._get_autoscale_array())
+        self.changed()
+
+    def autoscale_None(self):
+        """Override to autoscale on the full-resolution array"""
+        if self._full_res is None:
+            raise TypeError('You must first set_array for mappable')
+        self.norm.autoscale_None(self._get_autoscale_array())
+        self.changed()
+
+    def _get_autoscale_array(self):
+        """Returns the full-resolution array or, with a pipeline, the
+        processed pyramid level not larger than AUTOSCALE_SIZE, so that the
+        full resolution image does not have to be processed."""
+        if self._pipeline is None:
+            return self._full_res
+
+        level = 0
+        while max(self._full_res.shape[:2]) > AUTOSCALE_SIZE * 2 ** level:
+            level += 1
+        return self._get_processed_level(level)
+
     def _get_transform(self):
         """Creates a transformation from the data limits (real extent) to the
         array limit (shape of array)."""
@@ -82,7 +329,7 @@ class ModestImage(mi.AxesImage):
             return mtransforms.IdentityTransform()
 
         x0 = y0 = 0.0
-        y1, x1 = self._full_res.shape
+        y1, x1 = self._full_res.shape[:2]
         arrayLim = extent_to_bbox(x0, x1, y0, y1, self.origin)
 
         dataLim = self.axes.dataLim
@@ -90,6 +337,306 @@ class ModestImage(mi.AxesImage):
         self._scale_transform = mtransforms.BboxTransform(dataLim, arrayLim)
         return self._scale_transform
 
+    def _get_level(self, level):
+        """Returns the array at *level* of the image pyramid. Each level
+        halves the resolution of the previous one, so that
+        ``level[i, j] == full_res[i * 2 ** level, j * 2 ** level]``.
+        With a block reduction, ``level[i, j]`` is instead the reduction of
+        the corresponding ``2 ** level`` x ``2 ** level`` block.
+        Levels are only computed when first requested, from the closest
+        finer level already available."""
+        pyramid = self._pyramid
+        if level in pyramid:
+            count('modest_image.level_hit')
+            return pyramid[level]
+
+        # a level may be requested both by draw and by the prefetch thread;
+        # the pyramid and its locks are taken together, so that a level is
+        # never computed from or into the pyramid of other data
+        with self._lock:
+            pyramid = self._pyramid
+            lock = self._level_locks.setdefault(level, threading.Lock())
+            func, dtype = self._get_reduction_func(), self._get_dtype()
+        with lock:
+            if level not in pyramid:
+                count('modest_image.level_miss')
+                base = max(l for l in pyramid if l < level)
+                pyramid[level] = downsample(pyramid[base],
+                                            2 ** (level - base), func, dtype)
+        return pyramid[level]
+
+    def _get_processed_level(self, level):
+        """Returns the whole array at *level* of the image pyramid processed
+        by the pipeline, if any. Processed levels are computed when first
+        requested."""
+        if self._pipeline is None:
+            return self._get_level(level)
+
+        processed = self._processed
+        if level in processed:
+            return processed[level]
+
+        with self._lock:
+            processed = self._processed
+            lock = self._processed_locks.setdefault(level, threading.Lock())
+            pipeline = self._pipeline
+        with lock:
+            if level not in processed:
+                count('modest_image.pipeline_miss')
+                A = self._get_level(level)
+                with stage('modest_image.pipeline'):
+                    processed[level] = pipeline.apply(A, 2 ** level)
+        return processed[level]
+
+    def _get_region(self, level, lx0, lx1, ly0, ly1):
+        """Returns the region [ly0:ly1, lx0:lx1] of the pyramid *level*,
+        processed by the pipeline, if any. Only the region extended by the
+        halo of the pipeline is processed, so the result is the same as the
+        region of the whole processed level."""
+        A = self._get_level(level)
+        if self._pipeline is None:
+            return A[ly0:ly1, lx0:lx1]
+
+        # the whole level may already be processed (see autoscale)
+        processed = self._processed.get(level)
+        if processed is not None:
+            return processed[ly0:ly1, lx0:lx1]
+
+        scale = 2 ** level
+        halo = self._pipeline.get_halo(scale)
+        sx0, sx1 = max(0, lx0 - halo), min(A.shape[1], lx1 + halo)
+        sy0, sy1 = max(0, ly0 - halo), min(A.shape[0], ly1 + halo)
+
+        count('modest_image.pipeline_region')
+        with stage('modest_image.pipeline'):
+            A = self._pipeline.apply(np.asarray(A[sy0:sy1, sx0:sx1]), scale)
+        return A[ly0 - sy0:ly1 - sy0, lx0 - sx0:lx1 - sx0]
+
+    def _select_level(self, sx, sy):
+        """Returns the coarsest pyramid level which still provides at least
+        the resolution required by the strides *sx* and *sy*."""
+        level = 0
+        while 2 ** (level + 1) <= min(sx, sy):
+            level += 1
+        return level
+
+    def _downsample(self, level, lx0, lx1, lsx, ly0, ly1, lsy):
+        """Downsamples the region [ly0:ly1, lx0:lx1] of the pyramid *level*
+        by the strides *lsx* and *lsy*. Returns the downsampled array and
+        the end of the region effectively covered along both axes."""
+        shape = self._get_level(level).shape
+        lx1 = min(lx1, shape[1])
+        ly1 = min(ly1, shape[0])
+        A = self._get_region(level, lx0, lx1, ly0, ly1)
+
+        func = self._get_reduction_func()
+        dtype = self._get_dtype()
+        if func is None:
+            return cast(A[::lsy, ::lsx], dtype), lx1, ly1
+
+        A = block_reduce(A, lsy, lsx, func, dtype)
+        lx1, ly1 = lx0 + A.shape[1] * lsx, ly0 + A.shape[0] * lsy
+        if self._reduction == 'sum':
+            A = A / (4 ** level * lsx * lsy)
+        return A, lx1, ly1
+
+    def _mask_invalid(self, A):
+        """Masks the non-finite values of *A* if the image data contains any.
+        Otherwise, *A* is only wrapped in a masked array without mask, which
+        avoids scanning it and allocating a mask."""
+        if self._has_invalid is None:
+            self._has_invalid = has_invalid(self._full_res)
+        if self._has_invalid:
+            return cbook.safe_masked_invalid(A)
+        return np.ma.asarray(A)
+
+    def _get_colormap_key(self):
+        return get_colormap_key(self.cmap, self.norm)
+
+    def _get_view_rgba(self):
+        """Returns the RGBA array of the downsampled integer data of an
+        untiled view, colormapped through a lookup table (see
+        :func:`apply_colormap <pyhmsa_plot.util.colormap.apply_colormap>`),
+        or None if the view is colormapped by matplotlib. The array is
+        cached until the norm or colormap changes."""
+        A = self._A
+        if A is None or A.ndim != 2 or A.dtype.kind not in 'iu' or \
+                self.get_interpolation() not in ('none', 'nearest'):
+            return None
+
+        colormap = self._get_colormap_key()
+        if self._view_rgba is None or self._view_rgba[0] != colormap:
+            self._view_rgba = (colormap, apply_colormap(A, self.cmap, self.norm))
+        return self._view_rgba[1]
+
+    def make_image(self, renderer, magnification=1.0, unsampled=False):
+        """Override to resample the colormapped view of integer data, as
+        for the tiles, instead of normalizing the data"""
+        rgba = self._get_view_rgba()
+        if rgba is None:
+            return super(ModestImage, self).make_image(
+                renderer, magnification, unsampled)
+
+        A, self._A = self._A, rgba
+        try:
+            return super(ModestImage, self).make_image(
+                renderer, magnification, unsampled)
+        finally:
+            self._A = A
+
+    def _get_tile(self, level, lsx, lsy, tx, ty, colormap=None):
+        """Returns the colormapped RGBA array of tile (*tx*, *ty*) of the
+        pyramid *level* downsampled by the strides *lsx* and *lsy*.
+        Both the downsampled data and the RGBA array of the tile are cached,
+        so that a change of norm or colormap only requires to colormap the
+        cached data again. *colormap* is the current colormap key, if
+        already known."""
+        datakey = (self._generation, level, lsx, lsy, tx, ty)
+        if colormap is None:
+            colormap = self._get_colormap_key()
+        key = datakey + colormap
+        rgba = self._tile_cache.get(key)
+        if rgba is not None:
+            count('modest_image.tile_hit')
+            return rgba
+        count('modest_image.tile_miss')
+
+        A = self._get_tile_data(datakey)
+        if A.ndim == 2:
+            rgba = apply_colormap(A, self.cmap, self.norm)
+        else:
+            rgba = self.to_rgba(A, bytes=True)
+
+        # the norm or colormap may have changed while computing the tile
+        if colormap == self._get_colormap_key():
+            self._tile_cache.put(key, rgba)
+        return rgba
+
+    def _get_tile_data(self, datakey, token=None):
+        """Returns the downsampled data of the tile identified by *datakey*
+        (see :meth:`_get_tile`). When prefetched, the data is only cached if
+        the prefetch *token* is still current."""
+        A = self._tile_data_cache.get(datakey)
+        if A is not None:
+            return A
+
+        count('modest_image.tile_data_miss')
+        _generation, level, lsx, lsy, tx, ty = datakey
+        spanx, spany = self._tile_size * lsx, self._tile_size * lsy
+        lx0, ly0 = tx * spanx, ty * spany
+        A, _, _ = self._downsample(level, lx0, lx0 + spanx, lsx,
+                                   ly0, ly0 + spany, lsy)
+        A = self._mask_invalid(A)
+        self._put_cache(self._tile_data_cache, datakey, A, token)
+        return A
+
+    def _put_cache(self, cache, key, value, token=None):
+        """Caches *value*, unless it was prefetched with a *token* which is
+        no longer current (i.e. the data or view changed meanwhile)."""
+        if token is None:
+            cache.put(key, value)
+            return
+        with self._lock:
+            if self._is_prefetching(token):
+                cache.put(key, value)
+
+    def _render_tiles(self, level, lx0, lx1, lsx, ly0, ly1, lsy, colormap):
+        """Assembles the RGBA tiles covering the region [ly0:ly1, lx0:lx1]
+        of the pyramid *level*, colormapped as identified by *colormap*.
+        Returns the RGBA array and the region of the level it covers."""
+        spanx, spany = self._tile_size * lsx, self._tile_size * lsy
+        tx0, tx1 = lx0 // spanx, -(-lx1 // spanx)
+        ty0, ty1 = ly0 // spany, -(-ly1 // spany)
+
+        rows = []
+        for ty in range(ty0, ty1):
+            tiles = [self._get_tile(level, lsx, lsy, tx, ty, colormap)
+                     for tx in range(tx0, tx1)]
+            rows.append(np.concatenate(tiles, axis=1))
+        A = np.concatenate(rows, axis=0)
+
+        shape = self._get_level(level).shape
+        lx0, ly0 = tx0 * spanx, ty0 * spany
+        lx1 = min(lx0 + A.shape[1] * lsx, shape[1])
+        ly1 = min(ly0 + A.shape[0] * lsy, shape[0])
+        return A, lx0, lx1, ly0, ly1
+
+    def _get_level_region(self, x0, x1, sx, y0, y1, sy):
+        """Returns the pyramid level matching the strides *sx* and *sy*, the
+        region [y0:y1, x0:x1] of the full resolution array converted into
+        the pixels of this level and the remaining strides."""
+        level = self._select_level(sx, sy)
+        factor = 2 ** level
+        shape = self._get_level(level).shape
+        lx0, lx1 = x0 // factor, min(-(-x1 // factor), shape[1])
+        ly0, ly1 = y0 // factor, min(-(-y1 // factor), shape[0])
+        lsx = max(1, min(sx // factor, lx1 - lx0))
+        lsy = max(1, min(sy // factor, ly1 - ly0))
+        return level, lx0, lx1, lsx, ly0, ly1, lsy
+
+    def _cancel_prefetch(self):
+        with self._lock:
+            self._prefetch_token = None
+            future, self._prefetch_future = self._prefetch_future, None
+        if future is not None:
+            future.cancel()
+
+    def _is_prefetching(self, token):
+        return self._prefetch_token is token and not _prefetch_stop.is_set()
+
+    def _schedule_prefetch(self, x0, x1, sx, y0, y1, sy):
+        """Computes, in a background thread, the views around the current
+        view [y0:y1:sy, x0:x1:sx]."""
+        self._cancel_prefetch()
+        executor = get_prefetch_executor()
+        if executor is None: # exiting
+            return
+
+        viewports = neighbour_viewports(x0, x1, sx, y0, y1, sy,
+                                        self._full_res.shape)
+
+        # the tiles are colormapped with copies of the colormap and norm,
+        # since matplotlib objects must not be used outside of the drawing
+        # thread
+        colormap = None
+        if self._tile_size is not None and self._full_res.ndim == 2:
+            colormap = (self._get_colormap_key(), copy.deepcopy(self.cmap),
+                        copy.copy(self.norm))
+
+        with self._lock:
+            self._prefetch_token = token = object()
+            self._prefetch_future = executor.submit(
+                bind(self._prefetch_viewports), viewports, token,
+                self._generation, self._tile_size, colormap)
+
+    def _prefetch_viewports(self, viewports, token, generation, tile_size,
+                            colormap):
+        for viewport in viewports:
+            if not self._is_prefetching(token):
+                return
+            level, lx0, lx1, lsx, ly0, ly1, lsy = \
+                self._get_level_region(*viewport)
+            if tile_size is None:
+                continue
+
+            spanx, spany = tile_size * lsx, tile_size * lsy
+            for ty in range(ly0 // spany, -(-ly1 // spany)):
+                for tx in range(lx0 // spanx, -(-lx1 // spanx)):
+                    # stop if a new view was drawn or the data changed
+                    if not self._is_prefetching(token):
+                        return
+                    datakey = (generation, level, lsx, lsy, tx, ty)
+                    A = self._get_tile_data(datakey, token)
+
+                    # RGB(A) tiles are only converted when drawn
+                    if colormap is None:
+                        continue
+                    key, cmap, norm = colormap
+                    if datakey + key not in self._tile_cache:
+                        rgba = apply_colormap(A, cmap, norm)
+                        self._put_cache(self._tile_cache, datakey + key, rgba,
+                                        token)
+
     def _scale_to_res(self):
         """ Change self._A and _extent to render an image whose
         resolution is matched to the eventual rendering."""
@@ -100,13 +647,37 @@ class ModestImage(mi.AxesImage):
         x0, x1, sx, y0, y1, sy = extract_matched_slices(ax, shp, transform)
 
         # have we already calculated what we need?
+        colormap = None if self._tile_size is None \
+            else self._get_colormap_key()
         if (self._bounds is not None
             and sx >= self._sx and sy >= self._sy
             and x0 >= self._bounds[0] and x1 <= self._bounds[1]
-            and y0 >= self._bounds[2] and y1 <= self._bounds[3]):
+            and y0 >= self._bounds[2] and y1 <= self._bounds[3]
+            and self._tile_colormap == colormap):
+            count('modest_image.view_hit')
             return
-        self._A = self._full_res[y0:y1:sy, x0:x1:sx]
-        self._A = cbook.safe_masked_invalid(self._A)
+        count('modest_image.view_miss')
+
+        # slice the pyramid level matching the strides, instead of the full
+        # resolution array
+        level, lx0, lx1, lsx, ly0, ly1, lsy = \
+            self._get_level_region(x0, x1, sx, y0, y1, sy)
+        factor = 2 ** level
+
+        if self._tile_size is None:
+            A, lx1, ly1 = \
+                self._downsample(level, lx0, lx1, lsx, ly0, ly1, lsy)
+            self._A = self._mask_invalid(A)
+            self._view_rgba = None
+        else:
+            self._A, lx0, lx1, ly0, ly1 = \
+                self._render_tiles(level, lx0, lx1, lsx, ly0, ly1, lsy,
+                                   colormap)
+        self._tile_colormap = colormap
+
+        x0, x1 = lx0 * factor, min(lx1 * factor, shp[1])
+        y0, y1 = ly0 * factor, min(ly1 * factor, shp[0])
+        sx, sy = lsx * factor, lsy * factor
 
         extentLim = extent_to_bbox(x0 - 0.5, x1 - 0.5, y0 - 0.5, y1 - 0.5, self.origin)
         extentLim = transform.inverted().transform_bbox(extentLim)
@@ -118,9 +689,14 @@ class ModestImage(mi.AxesImage):
         self._bounds = (x0, x1, y0, y1)
         self.changed()
 
+        if self._prefetch:
+            self._schedule_prefetch(x0, x1, sx, y0, y1, sy)
+
     def draw(self, renderer, *args, **kwargs):
-        self._scale_to_res()
-        super(ModestImage, self).draw(renderer, *args, **kwargs)
+        with stage('modest_image.scale_to_res'):
+            self._scale_to_res()
+        with stage('modest_image.draw'):
+            super(ModestImage, self).draw(renderer, *args, **kwargs)
 
 
 def main():
@@ -201,6 +777,158 @@ def imshow(axes, X, cmap=None, norm=None, aspect=None,
     return im
 
 
+def block_reduce(A, sy, sx, func, dtype=None):
+    """Reduces each block of *sy* x *sx* pixels of *A* to a single value
+    using *func* (e.g. :func:`numpy.mean`). Incomplete blocks at the end of
+    each axis are discarded. If *dtype* is specified, the result is cast
+    with :func:`cast`."""
+    ny, nx = A.shape[0] // sy, A.shape[1] // sx
+    A = A[:ny * sy, :nx * sx]
+    return cast(func(A.reshape(ny, sy, nx, sx), axis=(1, 3)), dtype)
+
+
+def reduction_dtype(reduction, dtype):
+    """Returns the data type of the blocks of *dtype* reduced with
+    *reduction*: sums of integers are accumulated in 64-bit integers, so
+    that they are not clipped, otherwise *dtype*."""
+    if reduction != 'sum' or dtype is None or is_native(dtype):
+        return dtype
+    dtype = np.dtype(dtype)
+    if dtype.kind in 'bu':
+        return np.dtype(np.uint64)
+    if dtype.kind == 'i':
+        return np.dtype(np.int64)
+    return dtype
+
+
+def is_native(dtype):
+    """Returns whether *dtype* is ``'native'``, the data type of the image
+    array (see :meth:`ModestImage.set_dtype`)."""
+    return isinstance(dtype, str) and dtype == 'native'
+
+
+def cast(A, dtype):
+    """Returns *A* cast to *dtype*, or *A* itself if it is already of this
+    type or *dtype* is None. When casting to an integer type, values are
+    rounded and clipped to the range of the type."""
+    if dtype is None or A.dtype == dtype:
+        return A
+
+    dtype = np.dtype(dtype)
+    if dtype.kind in 'iu':
+        if A.dtype.kind in 'fc':
+            A = np.rint(A)
+        info = np.iinfo(dtype)
+        A = np.clip(A, info.min, info.max)
+    return A.astype(dtype)
+
+
+_prefetch_executor = None
+_prefetch_lock = threading.Lock()
+_prefetch_stop = threading.Event()
+
+def get_prefetch_executor():
+    """Returns the executor shared by all images to prefetch views, or
+    None once it is shut down (see :func:`shutdown_prefetch_executor`)."""
+    global _prefetch_executor
+    with _prefetch_lock:
+        if _prefetch_executor is None and not _prefetch_stop.is_set():
+            _prefetch_executor = ThreadPoolExecutor(max_workers=1)
+        return _prefetch_executor
+
+def shutdown_prefetch_executor(wait=True):
+    """Stops the prefetches and shuts down their executor. The pending
+    prefetches are skipped and the running one stops at its next tile.
+    Views are no longer prefetched afterwards.
+    Called when the interpreter exits."""
+    global _prefetch_executor
+    with _prefetch_lock:
+        _prefetch_stop.set()
+        executor, _prefetch_executor = _prefetch_executor, None
+    if executor is not None:
+        executor.shutdown(wait)
+
+atexit.register(shutdown_prefetch_executor)
+
+
+def neighbour_viewports(x0, x1, sx, y0, y1, sy, shape):
+    """Returns the views likely to be drawn after the view
+    [y0:y1:sy, x0:x1:sx] of an array of *shape*: the four neighbouring views
+    when panning, then the views when zooming in and out by a factor 2.
+    Each view is returned as a tuple ``(x0, x1, sx, y0, y1, sy)``, clipped
+    to the array."""
+    height, width = shape[:2]
+    dx, dy = x1 - x0, y1 - y0
+    cx, cy = (x0 + x1) // 2, (y0 + y1) // 2
+
+    candidates = [(x0 + dx, x1 + dx, sx, y0, y1, sy),
+                  (x0 - dx, x1 - dx, sx, y0, y1, sy),
+                  (x0, x1, sx, y0 + dy, y1 + dy, sy),
+                  (x0, x1, sx, y0 - dy, y1 - dy, sy),
+                  (cx - dx // 4, cx + dx // 4, max(1, sx // 2),
+                   cy - dy // 4, cy + dy // 4, max(1, sy // 2)),
+                  (cx - dx, cx + dx, sx * 2, cy - dy, cy + dy, sy * 2)]
+
+    viewports = []
+    for vx0, vx1, vsx, vy0, vy1, vsy in candidates:
+        vx0, vx1 = max(0, vx0), min(width, vx1)
+        vy0, vy1 = max(0, vy0), min(height, vy1)
+        if vx0 >= vx1 or vy0 >= vy1:
+            continue
+        viewports.append((vx0, vx1, vsx, vy0, vy1, vsy))
+    return viewports
+
+
+def has_invalid(A):
+    """Returns whether *A* is masked or contains non-finite values.
+    Float arrays are scanned in bands of rows."""
+    if np.ma.getmask(A) is not np.ma.nomask:
+        return True
+    if A.dtype.kind not in 'fc':
+        return False
+
+    rowsize = max(1, A[0].size * A.itemsize)
+    rows = max(1, BAND_SIZE // rowsize)
+    for r0 in range(0, A.shape[0], rows):
+        if not np.isfinite(A[r0:r0 + rows]).all():
+            return True
+    return False
+
+
+def downsample(A, factor, func=None, dtype=None):
+    """Downsamples *A* by *factor* along both axes, either by keeping every
+    *factor*-th pixel or, if *func* is specified, by reducing each block of
+    *factor* x *factor* pixels with :func:`block_reduce`.
+    If *dtype* is specified, the result is cast with :func:`cast`.
+    The array is processed in bands of rows, so that only a band of a
+    memory-mapped array is loaded in memory at any time.
+    The mask of a masked array is kept; a block is only masked if all its
+    pixels are."""
+    rowsize = max(1, A[0].size * A.itemsize)
+    rows = factor * max(1, BAND_SIZE // (factor * rowsize))
+    empty = np.ma.empty if np.ma.isMaskedArray(A) else np.empty
+
+    if func is None:
+        shape = (-(-A.shape[0] // factor), -(-A.shape[1] // factor))
+        out = empty(shape + A.shape[2:], A.dtype if dtype is None else dtype)
+        for r0 in range(0, A.shape[0], rows):
+            band = cast(A[r0:r0 + rows:factor, ::factor], dtype)
+            out[r0 // factor:r0 // factor + band.shape[0]] = band
+        return out
+
+    out = None
+    shape = (A.shape[0] // factor, A.shape[1] // factor)
+    for r0 in range(0, shape[0] * factor, rows):
+        band = block_reduce(A[r0:r0 + rows], factor, factor, func, dtype)
+        if out is None:
+            out = empty(shape, band.dtype)
+        out[r0 // factor:r0 // factor + band.shape[0]] = band
+
+    if out is None:
+        out = block_reduce(A, factor, factor, func, dtype)
+    return out
+
+
 def extent_to_bbox(x0, x1, y0, y1, origin):
     xmin = x0
     xmax = x1
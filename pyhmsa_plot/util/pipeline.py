@@ -0,0 +1,399 @@
+"""
+Composable preprocessing of images.
+
+A :class:`Pipeline` is a sequence of stages applied one after the other::
+
+    pipeline = Pipeline([BackgroundSubtraction(sigma=50.0),
+                         GaussianFilter(1.5),
+                         Clip(vmin=0)])
+    filtered = pipeline.apply(image)
+
+Consecutive pointwise stages (e.g. :class:`Clip`) are fused and applied in
+a single pass over the image, band of rows by band of rows, without
+intermediate full-size arrays.
+A pipeline can also be applied to a downsampled image, with its
+parameters scaled to the resolution of this image (see
+:meth:`Pipeline.apply`), to preview the result cheaply.
+"""
+
+# Standard library modules.
+
+# Third party modules.
+import numpy as np
+
+import scipy.ndimage as ndimage
+
+# Local modules.
+from pyhmsa_plot.util.modest_image import REDUCTIONS, downsample, cast
+from pyhmsa_plot.util.median import median_filter
+from pyhmsa_plot.util.memmap import is_memmap, create_memmap
+from pyhmsa_plot.util.filters import filter_tiled
+
+# Globals and constants variables.
+BAND_SIZE = 2 ** 22 # pixels
+MEDIAN_FILTER_ENGINES = {'scipy': ndimage.median_filter,
+                         'histogram': median_filter}
+
+class _Stage(object):
+    """
+    Base class of the stages. A stage is a callable applied to an image,
+    which returns a new image.
+    """
+
+    #: Whether the stage is applied to each pixel independently
+    pointwise = False
+
+    def __call__(self, A):
+        raise NotImplementedError
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.get_key() == other.get_key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.get_key())
+
+    def __repr__(self):
+        return '<%s(%s)>' % (type(self).__name__,
+                             ', '.join(map(repr, self.get_key()[1:])))
+
+    def get_key(self):
+        """
+        Returns a hashable key identifying the stage and its parameters.
+        """
+        raise NotImplementedError
+
+    def get_halo(self):
+        """
+        Returns the number of neighbouring pixels required on each side
+        to calculate a pixel.
+        """
+        return 0
+
+    def scaled(self, scale):
+        """
+        Returns the equivalent stage for an image downsampled by *scale*.
+        """
+        return self
+
+    def oriented(self, flip):
+        """
+        Returns the stage to apply to the image stored in another
+        orientation than the displayed one, where *flip* is
+        ``(flip_x, flip_y)``, so that the result is the same as applying
+        this stage to the displayed image.
+        """
+        return self
+
+class _PointwiseStage(_Stage):
+
+    pointwise = True
+
+    def __call__(self, A):
+        return _PointwiseGroup([self])(A)
+
+    def apply_inplace(self, W):
+        """
+        Applies the stage to the floating point array *W* in place.
+        """
+        raise NotImplementedError
+
+class _PointwiseGroup(_Stage):
+    """
+    Fusion of consecutive pointwise stages.
+    The stages are applied band of rows by band of rows to a floating point
+    copy of the band, which is cast back to the type of the image once.
+    """
+
+    pointwise = True
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+
+    def get_key(self):
+        return (type(self).__name__,) + \
+            tuple(stage.get_key() for stage in self.stages)
+
+    def __call__(self, A, out=None):
+        if out is None:
+            out = create_memmap(A.shape, A.dtype) if is_memmap(A) \
+                else np.empty(A.shape, A.dtype)
+
+        dtype = A.dtype if A.dtype.kind == 'f' else np.float64
+        rows = max(1, BAND_SIZE // max(1, A[0].size))
+        for r0 in range(0, A.shape[0], rows):
+            W = np.array(A[r0:r0 + rows], dtype)
+            for stage in self.stages:
+                stage.apply_inplace(W)
+            out[r0:r0 + rows] = cast(W, A.dtype)
+
+        return out
+
+class Binning(_Stage):
+    """
+    Reduces each block of *factor* x *factor* pixels to a single value.
+    Incomplete blocks at the end of each axis are discarded.
+
+    :arg factor: size of the blocks
+    :arg reduction: ``'mean'``, ``'sum'``, ``'max'`` or ``'min'``
+    """
+
+    def __init__(self, factor, reduction='mean'):
+        if reduction not in REDUCTIONS:
+            raise ValueError('Unknown reduction: %s' % reduction)
+        self.factor = int(factor)
+        self.reduction = reduction
+
+    def get_key(self):
+        return (type(self).__name__, self.factor, self.reduction)
+
+    def __call__(self, A):
+        return downsample(A, self.factor, REDUCTIONS[self.reduction])
+
+class GaussianFilter(_Stage):
+    """
+    Smooths the image with a Gaussian kernel of standard deviation *sigma*
+    (in pixels), with :func:`scipy.ndimage.gaussian_filter`.
+    """
+
+    def __init__(self, sigma):
+        self.sigma = float(sigma)
+
+    def get_key(self):
+        return (type(self).__name__, self.sigma)
+
+    def get_halo(self):
+        return int(4.0 * self.sigma + 0.5) + 1
+
+    def scaled(self, scale):
+        return GaussianFilter(self.sigma / scale)
+
+    def __call__(self, A):
+        return ndimage.gaussian_filter(np.asarray(A), self.sigma)
+
+class MedianFilter(_Stage):
+    """
+    Median filter with a kernel of *size*.
+
+    :arg engine: ``'scipy'`` (:func:`scipy.ndimage.median_filter`) or
+        ``'histogram'`` (:func:`pyhmsa_plot.util.median.median_filter`, for
+        integer images only; other images are filtered with scipy)
+    """
+
+    def __init__(self, size=3, engine='scipy', origin=0):
+        if engine not in MEDIAN_FILTER_ENGINES:
+            raise ValueError('Unknown median filter engine: %s' % engine)
+        self.size = tuple(int(s) for s in np.broadcast_to(size, 2))
+        self.engine = engine
+        self.origin = tuple(int(o) for o in np.broadcast_to(origin, 2))
+
+    def get_key(self):
+        return (type(self).__name__, self.size, self.engine, self.origin)
+
+    def get_halo(self):
+        return max(self.size)
+
+    def scaled(self, scale):
+        if scale == 1:
+            return self
+        # A kernel keeps at least 3 pixels, otherwise the filter vanishes
+        size = [max(min(s, 3), int(round(s / scale))) for s in self.size]
+        origin = [int(np.clip(o, -(s // 2), (s - 1) // 2))
+                  for s, o in zip(size, self.origin)]
+        return MedianFilter(size, self.engine, origin)
+
+    def oriented(self, flip):
+        # The kernel is mirrored along the flipped axes: its origin is
+        # negated and, since an even kernel is not centred, shifted by one
+        flip_x, flip_y = flip
+        origin = [-origin - (1 - size % 2) if flipped else origin
+                  for size, origin, flipped in
+                  zip(self.size, self.origin, (flip_y, flip_x))]
+        return MedianFilter(self.size, self.engine, origin)
+
+    def __call__(self, A):
+        A = np.asarray(A)
+        if self.size == (1, 1):
+            return A
+        func = MEDIAN_FILTER_ENGINES[self.engine]
+        if A.dtype.kind not in 'biu':
+            func = ndimage.median_filter
+        return func(A, size=self.size, origin=self.origin)
+
+class BackgroundSubtraction(_Stage):
+    """
+    Subtracts a background from the image, either a constant *value* or,
+    if *sigma* is specified, the image smoothed with a Gaussian kernel of
+    standard deviation *sigma* (in pixels).
+    For integer images, the result is clipped to the range of the type.
+    """
+
+    def __init__(self, value=None, sigma=None):
+        if (value is None) == (sigma is None):
+            raise ValueError('Specify either a value or a sigma')
+        self.value = None if value is None else float(value)
+        self.sigma = None if sigma is None else float(sigma)
+        self.pointwise = sigma is None
+
+    def get_key(self):
+        return (type(self).__name__, self.value, self.sigma)
+
+    def get_halo(self):
+        if self.sigma is None:
+            return 0
+        return int(4.0 * self.sigma + 0.5) + 1
+
+    def scaled(self, scale):
+        if self.sigma is None:
+            return self
+        return BackgroundSubtraction(sigma=self.sigma / scale)
+
+    def apply_inplace(self, W):
+        W -= self.value
+
+    def __call__(self, A):
+        A = np.asarray(A)
+        if self.pointwise:
+            return _PointwiseGroup([self])(A)
+
+        dtype = A.dtype if A.dtype.kind == 'f' else np.float64
+        W = np.array(A, dtype)
+        W -= ndimage.gaussian_filter(W, self.sigma)
+        return cast(W, A.dtype)
+
+class Clip(_PointwiseStage):
+    """
+    Clips the values of the image to [*vmin*, *vmax*].
+    Either limit can be ``None``.
+    """
+
+    def __init__(self, vmin=None, vmax=None):
+        self.vmin = None if vmin is None else float(vmin)
+        self.vmax = None if vmax is None else float(vmax)
+
+    def get_key(self):
+        return (type(self).__name__, self.vmin, self.vmax)
+
+    def apply_inplace(self, W):
+        if self.vmin is not None:
+            np.maximum(W, self.vmin, out=W)
+        if self.vmax is not None:
+            np.minimum(W, self.vmax, out=W)
+
+class Pipeline(object):
+    """
+    Sequence of stages applied to an image.
+    """
+
+    def __init__(self, stages=()):
+        self._stages = list(stages)
+
+    def __len__(self):
+        return len(self._stages)
+
+    def __iter__(self):
+        return iter(self._stages)
+
+    def __getitem__(self, index):
+        return self._stages[index]
+
+    def __eq__(self, other):
+        return isinstance(other, Pipeline) and self.get_key() == other.get_key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.get_key())
+
+    def __repr__(self):
+        return '<Pipeline(%s)>' % ', '.join(map(repr, self._stages))
+
+    def append(self, stage):
+        self._stages.append(stage)
+
+    def extend(self, stages):
+        self._stages.extend(stages)
+
+    def clear(self):
+        del self._stages[:]
+
+    def get_key(self):
+        """
+        Returns a hashable key identifying the stages and their parameters.
+        """
+        return tuple(stage.get_key() for stage in self._stages)
+
+    def get_halo(self, scale=1):
+        """
+        Returns the number of neighbouring pixels required on each side to
+        calculate a pixel of an image downsampled by *scale*, i.e. the
+        margin with which a region must be extended so that processing the
+        region gives the same result as processing the whole image.
+        """
+        return sum(stage.scaled(scale).get_halo() for stage in self._stages)
+
+    def split(self):
+        """
+        Splits the pipeline in two pipelines: the leading stages which
+        change the shape of the image (:class:`Binning`) and the remaining
+        stages, which can be applied to a downsampled image.
+        If a stage changing the shape is preceded by other stages, the
+        second pipeline is empty.
+        """
+        index = 0
+        while index < len(self._stages) and \
+                isinstance(self._stages[index], Binning):
+            index += 1
+
+        if any(isinstance(stage, Binning) for stage in self._stages[index:]):
+            return Pipeline(self._stages), Pipeline()
+
+        return Pipeline(self._stages[:index]), Pipeline(self._stages[index:])
+
+    def _fuse(self, stages):
+        steps = []
+        group = []
+        for stage in stages:
+            if stage.pointwise:
+                group.append(stage)
+                continue
+            if group:
+                steps.append(_PointwiseGroup(group))
+                group = []
+            steps.append(stage)
+        if group:
+            steps.append(_PointwiseGroup(group))
+        return steps
+
+    def apply(self, A, scale=1, flip=(False, False), executor=None):
+        """
+        Applies the stages to the image *A* and returns the result.
+
+        :arg scale: downsampling factor of *A* compared to the image for
+            which the parameters of the stages are defined. The kernels
+            of the filters are scaled accordingly, so that the result
+            approximates the downsampled result of the full resolution
+            image.
+        :arg flip: ``(flip_x, flip_y)``, whether *A* is flipped compared to
+            the displayed orientation (see :meth:`_Stage.oriented`)
+        :arg executor: executor to filter tiles in parallel (see
+            :func:`filter_tiled <pyhmsa_plot.util.filters.filter_tiled>`)
+
+        Memory-mapped images are processed tile by tile into temporary
+        memory-mapped arrays.
+        """
+        stages = [stage.scaled(scale).oriented(flip) for stage in self._stages]
+
+        for step in self._fuse(stages):
+            halo = step.get_halo()
+            if halo and (is_memmap(A) or executor is not None):
+                out = create_memmap(A.shape, A.dtype) if is_memmap(A) \
+                    else np.empty(A.shape, A.dtype)
+                A = filter_tiled(step, A, halo, out, executor=executor)
+            else:
+                A = step(A)
+
+        return A
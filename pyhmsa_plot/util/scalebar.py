@@ -0,0 +1,194 @@
+"""
+Scale bar drawn directly in the pixels of an RGB(A) array, without
+matplotlib's figure machinery.
+"""
+
+# Standard library modules.
+import io
+import bisect
+
+# Third party modules.
+import numpy as np
+
+import matplotlib
+import matplotlib.image as mimage
+from matplotlib.colors import to_rgba
+from matplotlib.offsetbox import AnchoredOffsetbox
+from matplotlib.font_manager import FontProperties
+from matplotlib.mathtext import math_to_image
+
+# Local modules.
+from pyhmsa_plot.util.cache import LRUCache
+
+# Globals and constants variables.
+
+# Horizontal and vertical alignment of each location code
+LOCATIONS = {1: ('right', 'upper'), 2: ('left', 'upper'),
+             3: ('left', 'lower'), 4: ('right', 'lower'),
+             5: ('right', 'center'), 6: ('left', 'center'),
+             7: ('right', 'center'), 8: ('center', 'lower'),
+             9: ('center', 'upper'), 10: ('center', 'center')}
+
+# Lengths of the scale bar, as by matplotlib_scalebar
+PREFERRED_VALUES = [1, 2, 5, 10, 15, 20, 25, 50, 75, 100, 125, 150, 200, 500, 750]
+
+_texts = LRUCache(64)
+
+def _get_value(scalebar, attr, default):
+    value = getattr(scalebar, attr)
+    if value is None:
+        value = matplotlib.rcParams.get('scalebar.' + attr, default)
+    return value
+
+def _get_formatter(scalebar):
+    """
+    Returns the function formatting the value and units of the scale.
+    """
+    if hasattr(scalebar, 'scale_formatter'): # newer matplotlib_scalebar
+        formatter = scalebar.scale_formatter
+    else:
+        formatter = scalebar.label_formatter
+    if formatter is None:
+        formatter = getattr(scalebar.dimension, 'create_label', None) or \
+            (lambda value, units: '{} {}'.format(value, units))
+    return formatter
+
+def _calculate_best_length(scalebar, length_px):
+    """
+    Returns the length in pixels, value and units of the longest preferred
+    length of the *scalebar* shorter than *length_px*.
+    """
+    value = length_px * scalebar.dx
+    newvalue, newunits = \
+        scalebar.dimension.calculate_preferred(value, scalebar.units)
+    factor = value / newvalue
+
+    index = bisect.bisect_left(PREFERRED_VALUES, newvalue)
+    if index > 0:
+        index -= 1
+    newvalue = PREFERRED_VALUES[index]
+
+    return newvalue * factor / scalebar.dx, newvalue, newunits
+
+def render_text(text, size, dpi):
+    """
+    Returns the coverage (0 to 255) of the *text* rendered with the default
+    font of matplotlib, at *size* points and *dpi*, as a 2D uint8 array.
+    The *text* may contain mathtext (e.g. ``'50 $\\mu$m'``), rendered by
+    matplotlib's mathtext parser.
+    """
+    key = (text, size, dpi)
+    coverage = _texts.get(key)
+    if coverage is None:
+        buffer = io.BytesIO()
+        math_to_image(text, buffer, FontProperties(size=size), dpi, 'png')
+        buffer.seek(0)
+        alpha = mimage.imread(buffer, format='png')[..., 3]
+        coverage = np.round(alpha * 255.0).astype(np.uint8)
+        coverage.setflags(write=False)
+        _texts.put(key, coverage)
+    return coverage
+
+def _blend(A, y0, x0, coverage, color):
+    """
+    Blends *color* (RGBA floats) into *A* at (*y0*, *x0*) with the
+    *coverage* (floats from 0 to 1), clipped to the array.
+    """
+    height, width = coverage.shape
+    y1, x1 = min(A.shape[0], y0 + height), min(A.shape[1], x0 + width)
+    cy0, cx0 = max(0, -y0), max(0, -x0)
+    y0, x0 = max(0, y0), max(0, x0)
+    if y1 <= y0 or x1 <= x0:
+        return
+
+    alpha = coverage[cy0:cy0 + y1 - y0, cx0:cx0 + x1 - x0, np.newaxis] * color[3]
+    region = A[y0:y1, x0:x1]
+    channels = region.shape[-1]
+    blended = region * (1.0 - alpha) + \
+        np.asarray(color[:channels]) * 255.0 * alpha
+    if channels == 4:
+        blended[..., 3] = region[..., 3] * (1.0 - alpha[..., 0]) + \
+            255.0 * alpha[..., 0]
+    region[...] = np.round(blended)
+
+def burn_scalebar(A, scalebar, dpi=None):
+    """
+    Draws the *scalebar* in the RGB or RGBA uint8 array *A*, in place.
+    The length of a pixel is given by ``scalebar.dx`` (in
+    ``scalebar.units``). The length, location, colors and frame of the
+    scale bar are calculated as by
+    :class:`ScaleBar <matplotlib_scalebar.scalebar.ScaleBar>`, with the
+    same defaults, for a figure of *dpi* (default: ``figure.dpi``).
+    The label and font properties of the scale bar are ignored; the scale
+    is written with the default font.
+    """
+    if dpi is None:
+        dpi = matplotlib.rcParams['figure.dpi']
+    height, width = A.shape[:2]
+    if scalebar.dx == 0 or height == 0 or width == 0:
+        return A
+
+    length_fraction = _get_value(scalebar, 'length_fraction', 0.2)
+    if hasattr(scalebar, 'width_fraction'): # newer matplotlib_scalebar
+        width_fraction = _get_value(scalebar, 'width_fraction', 0.01)
+    else:
+        width_fraction = _get_value(scalebar, 'height_fraction', 0.01)
+    location = _get_value(scalebar, 'location', 'upper right')
+    if isinstance(location, str):
+        location = AnchoredOffsetbox.codes[location]
+    pad = _get_value(scalebar, 'pad', 0.2)
+    border_pad = _get_value(scalebar, 'border_pad', 0.1)
+    sep = _get_value(scalebar, 'sep', 5)
+    frameon = _get_value(scalebar, 'frameon', True)
+    color = to_rgba(_get_value(scalebar, 'color', 'k'))
+    box_color = to_rgba(_get_value(scalebar, 'box_color', 'w'))
+    box_alpha = _get_value(scalebar, 'box_alpha', 1.0)
+
+    # Length and scale
+    if scalebar.fixed_value is None:
+        length_px, value, units = \
+            _calculate_best_length(scalebar, width * length_fraction)
+    else:
+        value = scalebar.fixed_value
+        units = scalebar.fixed_units or scalebar.units
+        length_px = scalebar.dimension.convert(value, units, scalebar.units) \
+            / scalebar.dx
+    length_px = max(1, int(round(length_px)))
+    bar_height = max(1, int(round(height * width_fraction)))
+
+    # The units are written as by the scale bar, e.g. "um" as "$\\mu$m"
+    label = _get_formatter(scalebar)(value,
+                                     scalebar.dimension.to_latex(units))
+    fontsize = matplotlib.rcParams['font.size']
+    text = render_text(label, fontsize, dpi)
+
+    # Layout of the box, in pixels: bar above the centred scale
+    fontsize_px = fontsize * dpi / 72.0
+    pad_px = int(round(pad * fontsize_px))
+    border_px = int(round(border_pad * fontsize_px))
+    sep_px = int(round(sep * dpi / 72.0))
+    content_width = max(length_px, text.shape[1])
+    content_height = bar_height + sep_px + text.shape[0]
+    box_width = content_width + 2 * pad_px
+    box_height = content_height + 2 * pad_px
+
+    halign, valign = LOCATIONS[location]
+    box_x0 = {'left': border_px,
+              'center': (width - box_width) // 2,
+              'right': width - box_width - border_px}[halign]
+    box_y0 = {'upper': border_px,
+              'center': (height - box_height) // 2,
+              'lower': height - box_height - border_px}[valign]
+
+    if frameon:
+        box_color = box_color[:3] + (box_color[3] * box_alpha,)
+        _blend(A, box_y0, box_x0, np.ones((box_height, box_width)), box_color)
+
+    x0 = box_x0 + pad_px
+    y0 = box_y0 + pad_px
+    _blend(A, y0, x0 + (content_width - length_px) // 2,
+           np.ones((bar_height, length_px)), color)
+    _blend(A, y0 + bar_height + sep_px, x0 + (content_width - text.shape[1]) // 2,
+           text / 255.0, color)
+
+    return A
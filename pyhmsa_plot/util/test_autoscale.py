@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+
+# Third party modules.
+import numpy as np
+
+# Local modules.
+from pyhmsa_plot.util.autoscale import \
+    percentiles, strided_sample, lower_percentile
+
+# Globals and constants variables.
+
+class TestAutoscale(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        random = np.random.RandomState(0)
+        self.data = random.poisson(20, (301, 207)).astype(np.uint16)
+        self.data[5, 7] = 60000 # Hot pixel
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+
+    def teststrided_sample(self):
+        sample = strided_sample(self.data, 1000)
+        self.assertLessEqual(sample.size, 1000)
+        self.assertGreater(sample.size, 250)
+
+        sample = strided_sample(self.data, self.data.size)
+        self.assertTrue(np.array_equal(self.data, sample))
+
+    def testlower_percentile(self):
+        values = np.sort(self.data, axis=None)
+        for q in (0, 1, 50, 99, 100):
+            expected = values[int(q / 100 * (values.size - 1))]
+            self.assertEqual(expected, lower_percentile(self.data, q))
+
+        data = self.data.astype(np.float64)
+        data[:, 0] = np.nan
+        actual = lower_percentile(data, [0, 100], axis=1, ignore_nan=True)
+        self.assertEqual((2, data.shape[0]), actual.shape)
+        self.assertEqual(np.nanmin(data, axis=1).tolist(), actual[0].tolist())
+        self.assertEqual(np.nanmax(data, axis=1).tolist(), actual[1].tolist())
+
+    def testpercentiles_sample(self):
+        expected = lower_percentile(self.data, [1, 99])
+        actual = percentiles(self.data, [1, 99], sample_size=self.data.size)
+        self.assertEqual(expected.tolist(), actual)
+        self.assertLess(actual[1], 60000)
+
+        self.assertIsInstance(percentiles(self.data, 50), float)
+
+    def testpercentiles_stream(self):
+        q = [0, 0.5, 50, 99.5, 100]
+        for dtype in (np.uint8, np.int16, np.uint16):
+            data = self.data.astype(dtype)
+            expected = lower_percentile(data, q)
+            actual = percentiles(data, q, method='stream')
+            self.assertEqual(expected.tolist(), actual)
+
+    def testpercentiles_stream_float(self):
+        data = self.data.astype(np.float32) / 7.0
+        expected = lower_percentile(data, [1, 99])
+        actual = percentiles(data, [1, 99], method='stream')
+        binwidth = (data.max() - data.min()) / 65536
+        np.testing.assert_allclose(expected, actual, atol=2 * binwidth)
+
+    def testpercentiles_nonfinite(self):
+        data = self.data.astype(np.float64)
+        data[0] = np.nan
+        data[1] = np.inf
+        for method in ('sample', 'stream'):
+            actual = percentiles(data, [0, 100], method=method)
+            self.assertEqual([data[2:].min(), data[2:].max()], actual)
+
+        data[:] = np.nan
+        for method in ('sample', 'stream'):
+            self.assertEqual([None, None],
+                             percentiles(data, [0, 100], method=method))
+
+    def testpercentiles_invalid(self):
+        self.assertRaises(ValueError, percentiles, self.data, 101)
+        self.assertRaises(ValueError, percentiles, self.data, 50, 'unknown')
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
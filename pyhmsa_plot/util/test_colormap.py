@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import copy
+
+# Third party modules.
+import numpy as np
+
+import matplotlib
+import matplotlib.colors as mcolors
+
+# Local modules.
+from pyhmsa_plot.util.colormap import \
+    apply_colormap, get_colormap_key, get_cmap
+
+# Globals and constants variables.
+
+class TestColormap(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.cmap = get_cmap('viridis')
+        self.norm = mcolors.Normalize(100, 5000)
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+
+    def _test_apply_colormap(self, data):
+        expected = self.cmap(self.norm(data), bytes=True)
+        actual = apply_colormap(data, self.cmap, self.norm)
+        self.assertTrue(np.array_equal(expected, actual))
+
+    def testapply_colormap_uint16(self):
+        data = np.random.randint(0, 65535, (50, 40)).astype(np.uint16)
+        self._test_apply_colormap(data)
+
+    def testapply_colormap_int16(self):
+        data = np.random.randint(-32768, 32767, (50, 40)).astype(np.int16)
+        self._test_apply_colormap(data)
+
+    def testapply_colormap_uint8(self):
+        data = np.random.randint(0, 255, (50, 40)).astype(np.uint8)
+        self._test_apply_colormap(data[::2, ::3])
+
+    def testapply_colormap_int32(self):
+        data = np.random.randint(-1000, 6000, (50, 40)).astype(np.int32)
+        self._test_apply_colormap(data)
+
+        data[0, 0] = 10 ** 6
+        self._test_apply_colormap(data)
+
+    def testapply_colormap_float(self):
+        data = np.random.uniform(0, 6000, (50, 40))
+        self._test_apply_colormap(data)
+
+    def testapply_colormap_array_limits(self):
+        # e.g. after autoscaling on an ndarray subclass
+        self.norm = mcolors.Normalize(np.array(100), np.array(5000))
+        data = np.random.randint(0, 6000, (50, 40)).astype(np.uint16)
+        self._test_apply_colormap(data)
+
+    def testapply_colormap_masked(self):
+        data = np.ma.masked_less(np.random.randint(0, 6000, (50, 40)), 50)
+        self._test_apply_colormap(data)
+
+    def testget_colormap_key(self):
+        key = get_colormap_key(self.cmap, self.norm)
+        self.assertEqual(key, get_colormap_key(copy.copy(self.cmap),
+                                               mcolors.Normalize(100, 5000)))
+
+        cmap = copy.copy(self.cmap)
+        cmap.set_under('r')
+        self.assertNotEqual(key, get_colormap_key(cmap, self.norm))
+
+        self.norm.vmin = np.array(0)
+        self.assertNotEqual(key, get_colormap_key(self.cmap, self.norm))
+        self.assertNotEqual(get_colormap_key(self.cmap, mcolors.PowerNorm(1.0)),
+                            get_colormap_key(self.cmap, mcolors.PowerNorm(2.0)))
+
+    def testget_cmap(self):
+        self.assertEqual('viridis', self.cmap.name)
+        self.assertIs(self.cmap, get_cmap(self.cmap))
+        self.assertEqual(matplotlib.rcParams['image.cmap'], get_cmap().name)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+
+# Third party modules.
+import numpy as np
+
+# Local modules.
+import pyhmsa_plot.util.composite as composite_module
+from pyhmsa_plot.util.composite import composite
+
+# Globals and constants variables.
+
+class TestComposite(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        random = np.random.RandomState(0)
+        self.images = [random.poisson(lam, (23, 17)).astype(np.uint16)
+                       for lam in (5, 50, 500)]
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+
+    def _expected(self, images, colors, vmins, vmaxs):
+        rgb = np.zeros(images[0].shape + (3,))
+        for image, color, vmin, vmax in zip(images, colors, vmins, vmaxs):
+            norm = np.clip((image - vmin) / float(vmax - vmin), 0, 1)
+            rgb += np.nan_to_num(norm)[..., np.newaxis] * color
+        return np.round(np.clip(rgb, 0, 1) * 255).astype(np.uint8)
+
+    def testcomposite(self):
+        rgb = composite(self.images)
+        self.assertEqual((23, 17, 3), rgb.shape)
+        self.assertEqual(np.uint8, rgb.dtype)
+
+        vmins = [image.min() for image in self.images]
+        vmaxs = [image.max() for image in self.images]
+        expected = self._expected(self.images, np.eye(3), vmins, vmaxs)
+        np.testing.assert_allclose(expected, rgb, atol=1)
+
+    def testcomposite_limits(self):
+        colors = ['cyan', 'magenta', (1.0, 1.0, 0.0)]
+        vmins = [0, None, 400]
+        vmaxs = [10, 60, None]
+        rgb = composite(self.images, colors, vmins, vmaxs)
+
+        vmins[1] = self.images[1].min()
+        vmaxs[2] = self.images[2].max()
+        cmy = np.array([[0, 1, 1], [1, 0, 1], [1, 1, 0]])
+        expected = self._expected(self.images, cmy, vmins, vmaxs)
+        np.testing.assert_allclose(expected, rgb, atol=1)
+
+    def testcomposite_bands(self):
+        images = [image.astype(np.float32) for image in self.images]
+        images[0][3, 4] = np.nan
+        expected = composite(images)
+
+        band_size = composite_module.BAND_SIZE
+        composite_module.BAND_SIZE = 40
+        try:
+            actual = composite(images)
+        finally:
+            composite_module.BAND_SIZE = band_size
+
+        self.assertTrue(np.array_equal(expected, actual))
+        self.assertEqual(0, actual[3, 4, 0])
+
+    def testcomposite_invalid(self):
+        self.assertRaises(ValueError, composite, [])
+        self.assertRaises(ValueError, composite,
+                          self.images + [np.zeros((3, 3))])
+        self.assertRaises(ValueError, composite, self.images, ['r'])
+        self.assertRaises(ValueError, composite, self.images * 3)
+        self.assertRaises(ValueError, composite, self.images, vmins=[0])
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
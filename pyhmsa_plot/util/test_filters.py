@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# Third party modules.
+import numpy as np
+
+import scipy.ndimage as ndimage
+
+# Local modules.
+from pyhmsa_plot.util.filters import \
+    filter_tiled, iter_tiles, get_tile_shape, MAX_TILE_SIZE
+from pyhmsa_plot.util.median import median_filter
+
+# Globals and constants variables.
+
+class TestFilters(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        random = np.random.RandomState(0)
+        self.data = random.poisson(20, (101, 77)).astype(np.uint16)
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+
+    def testiter_tiles(self):
+        covered = np.zeros(self.data.shape, int)
+        for source, destination, crop in iter_tiles(self.data.shape, (20, 30), 3):
+            covered[destination] += 1
+            self.assertTrue(np.array_equal(self.data[destination],
+                                           self.data[source][crop]))
+        self.assertTrue((covered == 1).all())
+
+    def testget_tile_shape(self):
+        # Whole array
+        self.assertEqual((101, 77), get_tile_shape((101, 77), 2))
+
+        # Bands of full rows, at most the maximum size
+        height, width = get_tile_shape((10000, 5000), 2)
+        self.assertEqual(5000, width)
+        self.assertLessEqual(height * width, MAX_TILE_SIZE)
+
+        # Several bands per worker, not thinner than the halo
+        self.assertEqual((7, 77), get_tile_shape((101, 77), 1, workers=4))
+        self.assertEqual((20, 77), get_tile_shape((101, 77), 5, workers=4))
+
+        # Split across columns if a band is too large
+        height, width = get_tile_shape((100, 10 ** 7), 10)
+        self.assertEqual(40, height)
+        self.assertLessEqual(height * width, MAX_TILE_SIZE)
+
+    def testfilter_tiled_default(self):
+        expected = ndimage.median_filter(self.data, size=5)
+
+        out = np.empty_like(self.data)
+        with ThreadPoolExecutor(3) as executor:
+            actual = filter_tiled(ndimage.median_filter, self.data, 5, out,
+                                  executor=executor, size=5)
+        self.assertTrue(np.array_equal(expected, actual))
+
+    def testfilter_tiled_workers(self):
+        heights = []
+        def func(tile, **kwargs):
+            heights.append(tile.shape[0])
+            return ndimage.median_filter(tile, **kwargs)
+
+        expected = ndimage.median_filter(self.data, size=3)
+
+        out = np.empty_like(self.data)
+        with ThreadPoolExecutor(2) as executor:
+            actual = filter_tiled(func, self.data, 1, out,
+                                  executor=executor, workers=4, size=3)
+        self.assertTrue(np.array_equal(expected, actual))
+        self.assertEqual(15, len(heights))
+        self.assertEqual(9, max(heights))
+
+    def testfilter_tiled_threads(self):
+        expected = ndimage.median_filter(self.data, size=4, origin=-1)
+
+        out = np.empty_like(self.data)
+        with ThreadPoolExecutor(3) as executor:
+            actual = filter_tiled(ndimage.median_filter, self.data, 4, out,
+                                  (16, 16), executor, size=4, origin=-1)
+        self.assertTrue(np.array_equal(expected, actual))
+
+    def testfilter_tiled_processes(self):
+        expected = ndimage.median_filter(self.data, size=5)
+
+        out = np.empty_like(self.data)
+        with ProcessPoolExecutor(2) as executor:
+            actual = filter_tiled(median_filter, self.data, 5, out,
+                                  (32, 32), executor, size=5)
+        self.assertTrue(np.array_equal(expected, actual))
+
+    def testfilter_tiled_error(self):
+        out = np.empty_like(self.data)
+        with ThreadPoolExecutor(2) as executor:
+            self.assertRaises(TypeError, filter_tiled, median_filter,
+                              self.data / 2.0, 3, out, (16, 16), executor,
+                              size=3)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import tempfile
+import shutil
+
+# Third party modules.
+import numpy as np
+
+import matplotlib.image
+
+# Local modules.
+from pyhmsa_plot.util.imagefile import \
+    encode_png, encode_jpeg, get_format, write_image
+
+# Globals and constants variables.
+try:
+    import PIL
+except ImportError:
+    PIL = None
+
+class TestImageFile(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+
+        random = np.random.RandomState(0)
+        self.rgba = random.randint(0, 256, (13, 17, 4)).astype(np.uint8)
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _read(self, filepath):
+        return np.round(matplotlib.image.imread(filepath) * 255).astype(np.uint8)
+
+    def testwrite_png(self):
+        filepath = os.path.join(self.tmpdir, 'image.png')
+        for A in (self.rgba, self.rgba[..., :3], self.rgba[..., 0]):
+            write_image(filepath, A)
+            self.assertTrue(np.array_equal(A, self._read(filepath)))
+
+        # Non-contiguous array
+        A = self.rgba[::-1, ::2, :3]
+        write_image(filepath, A, compression=1)
+        self.assertTrue(np.array_equal(A, self._read(filepath)))
+
+    def testencode_png_invalid(self):
+        self.assertRaises(TypeError, encode_png, self.rgba.astype(np.uint16))
+        self.assertRaises(ValueError, encode_png, self.rgba[0, 0])
+        self.assertRaises(ValueError, encode_png,
+                          np.zeros((3, 3, 5), np.uint8))
+
+    def testget_format(self):
+        self.assertEqual('png', get_format('a/b.PNG'))
+        self.assertEqual('jpeg', get_format('b.jpg'))
+        self.assertEqual('jpeg', get_format('b.jpeg'))
+        self.assertRaises(ValueError, get_format, 'b.tif')
+
+    @unittest.skipIf(PIL is None, 'Pillow is not installed')
+    def testencode_jpeg(self): # pragma: no cover
+        data = encode_jpeg(self.rgba)
+        self.assertEqual(b'\xff\xd8', data[:2])
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
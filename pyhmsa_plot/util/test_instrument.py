@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import logging
+import threading
+
+# Third party modules.
+import numpy as np
+
+from pyhmsa.spec.datum.imageraster import ImageRaster2D
+
+# Local modules.
+from pyhmsa_plot.util.instrument import \
+    Recorder, record, stage, count, bind
+from pyhmsa_plot.spec.datum.imageraster import ImageRaster2DPlot
+
+# Globals and constants variables.
+
+class TestInstrument(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def testrecord(self):
+        with record() as recorder:
+            with stage('a'):
+                count('b')
+                count('b', 2)
+            with stage('a'):
+                pass
+
+        with stage('a'):
+            count('b')
+
+        self.assertEqual(2, len(recorder.get_durations('a')))
+        self.assertEqual(3, recorder.get_count('b'))
+
+        stats = recorder.to_dict()
+        self.assertEqual(2, stats['stages']['a']['count'])
+        self.assertEqual(3, stats['counters']['b'])
+
+    def testrecord_threads(self):
+        def _run():
+            with stage('a'):
+                count('b')
+
+        with record() as recorder:
+            thread = threading.Thread(target=_run)
+            thread.start()
+            thread.join()
+            self.assertEqual(0, recorder.get_count('b'))
+
+            thread = threading.Thread(target=bind(_run))
+            thread.start()
+            thread.join()
+            self.assertEqual(1, recorder.get_count('b'))
+            self.assertEqual(1, len(recorder.get_durations('a')))
+
+    def testmerge(self):
+        recorder = Recorder()
+        recorder.add_duration('a', 1.0)
+        recorder.add_count('b')
+
+        other = Recorder()
+        other.add_duration('a', 3.0)
+        other.add_count('b', 4)
+
+        recorder.merge(other)
+        recorder.merge(other.to_dict(raw=True))
+
+        stats = recorder.to_dict()
+        self.assertEqual(3, stats['stages']['a']['count'])
+        self.assertAlmostEqual(7.0, stats['stages']['a']['total'])
+        self.assertEqual(9, stats['counters']['b'])
+
+    def testsave(self):
+        datum = ImageRaster2D(500, 400, dtype=np.uint16)
+        plot = ImageRaster2DPlot()
+        plot.add_median_filter()
+        filepath = os.path.join(self.tmpdir, 'image.png')
+
+        with record() as recorder:
+            plot.save(filepath, datum)
+            plot.save(filepath, datum)
+
+        stats = recorder.to_dict()
+        for name in ['create_figure', 'plot', 'calculate_extent',
+                     'imshow', 'savefig', 'modest_image.scale_to_res']:
+            self.assertEqual(2, stats['stages'][name]['count'], name)
+        self.assertEqual(1, stats['stages']['apply_median']['count'])
+        self.assertEqual(1, stats['counters']['imageraster.cache_hit'])
+        self.assertGreater(stats['counters']['modest_image.view_miss'], 0)
+
+        filepath = os.path.join(self.tmpdir, 'stats.json')
+        recorder.dump(filepath)
+        with open(filepath, 'r') as fp:
+            self.assertEqual(stats, json.load(fp))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+
+# Third party modules.
+import numpy as np
+
+import scipy.ndimage as ndimage
+
+# Local modules.
+import pyhmsa_plot.util.median as median
+from pyhmsa_plot.util.median import median_filter
+
+# Globals and constants variables.
+
+class TestMedian(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        random = np.random.RandomState(0)
+        self.data = random.poisson(20, (41, 29)).astype(np.uint16)
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+
+    def _assert_scipy_equal(self, data, **kwargs):
+        expected = ndimage.median_filter(data, **kwargs)
+        actual = median_filter(data, **kwargs)
+        self.assertEqual(expected.dtype, actual.dtype)
+        self.assertTrue(np.array_equal(expected, actual), kwargs)
+
+    def testmedian_filter(self):
+        for size in [1, 2, 3, 4, 7, (3, 6), 31, 50]:
+            self._assert_scipy_equal(self.data, size=size)
+
+    def testmedian_filter_origin(self):
+        self._assert_scipy_equal(self.data, size=4, origin=-1)
+        self._assert_scipy_equal(self.data, size=(3, 4), origin=(1, -2))
+        self.assertRaises(ValueError, median_filter, self.data, 3, 2)
+
+    def testmedian_filter_dtypes(self):
+        for dtype in [np.uint8, np.int16, np.int32, np.uint64]:
+            self._assert_scipy_equal((self.data - 10).astype(dtype), size=5)
+        self.assertRaises(TypeError, median_filter, self.data / 2.0)
+
+    def testmedian_filter_engines(self):
+        max_levels = median.MAX_LEVELS_PER_ELEMENT
+        try:
+            for median.MAX_LEVELS_PER_ELEMENT in [0, 1000]: # scipy, histogram
+                self._assert_scipy_equal(self.data, size=3)
+                self._assert_scipy_equal(self.data, size=(3, 4), origin=(1, -2))
+        finally:
+            median.MAX_LEVELS_PER_ELEMENT = max_levels
+
+    def testmedian_filter_bands(self):
+        band_size = median.BAND_SIZE
+        median.BAND_SIZE = 64
+        try:
+            self._assert_scipy_equal(self.data, size=5)
+            self._assert_scipy_equal(self.data, size=100)
+        finally:
+            median.BAND_SIZE = band_size
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
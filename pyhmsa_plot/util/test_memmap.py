@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import shutil
+import tempfile
+import gc
+from tempfile import TemporaryFile
+from unittest import mock
+
+# Third party modules.
+import numpy as np
+
+import scipy.ndimage as ndimage
+
+from pyhmsa.datafile import DataFile
+from pyhmsa.spec.datum.imageraster import ImageRaster2D
+from pyhmsa.spec.condition.acquisition import \
+    AcquisitionRasterXY, POSITION_LOCATION_START
+from pyhmsa.spec.condition.specimenposition import SpecimenPosition
+
+# Local modules.
+from pyhmsa_plot.util.memmap import read_memmap, is_memmap, create_memmap
+from pyhmsa_plot.util.filters import filter_tiled
+from pyhmsa_plot.spec.datum.imageraster import ImageRaster2DPlot
+
+# Globals and constants variables.
+
+class TestMemmap(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+
+        self.datum = ImageRaster2D(110, 70, dtype=np.uint16)
+        self.datum[:] = np.random.randint(0, 1000, self.datum.shape)
+
+        acq = AcquisitionRasterXY(110, 70, (0.5, 'm'), (0.5, 'm'))
+        acq.positions[POSITION_LOCATION_START] = \
+            SpecimenPosition((-2.5, 'm'), (1.5, 'm'), 0.0)
+        self.datum.conditions.add('Acq0', acq)
+
+        datafile = DataFile()
+        datafile.conditions.update(self.datum.conditions)
+        datafile.data['Map'] = self.datum
+
+        self.filepath = os.path.join(self.tmpdir, 'map.hmsa')
+        datafile.write(self.filepath)
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def testread_memmap(self):
+        datafile = read_memmap(self.filepath)
+        datum = datafile.data['Map']
+
+        self.assertIsInstance(datum, ImageRaster2D)
+        self.assertTrue(is_memmap(datum))
+        self.assertTrue(is_memmap(np.flipud(datum.T)))
+        self.assertFalse(is_memmap(self.datum))
+        self.assertTrue(np.array_equal(self.datum, datum))
+        self.assertIn('Acq0', datum.conditions)
+
+    def testfilter_tiled(self):
+        expected = ndimage.median_filter(self.datum, size=5)
+
+        out = create_memmap(self.datum.shape, self.datum.dtype)
+        actual = filter_tiled(ndimage.median_filter, self.datum, 5, out,
+                              tile_shape=(16, 32), size=5)
+        self.assertTrue(np.array_equal(expected, actual))
+
+    def testcreate_memmap(self):
+        files = []
+        def _temporary_file(*args, **kwargs):
+            files.append(TemporaryFile(*args, **kwargs))
+            return files[-1]
+
+        with mock.patch('tempfile.TemporaryFile', _temporary_file):
+            out = create_memmap((10, 20), np.uint16)
+        self.assertTrue(is_memmap(out))
+        view = out[2:5]
+        del out
+        gc.collect()
+
+        # Kept open as long as the array is mapped
+        self.assertFalse(files[0].closed)
+        view[:] = 3
+        self.assertEqual(3 * 3 * 20, view.sum())
+
+        del view
+        gc.collect()
+        self.assertTrue(files[0].closed)
+
+    def testplot(self):
+        datum = read_memmap(self.filepath).data['Map']
+
+        plot = ImageRaster2DPlot()
+        plot.add_median_filter(3)
+        fig = plot.plot(datum)
+
+        aximage = fig.axes[0].images[0]
+        self.assertTrue(is_memmap(aximage.get_array()))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import copy
+import threading
+from unittest import mock
+
+# Third party modules.
+import numpy as np
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Local modules.
+import pyhmsa_plot.util.modest_image as modest_image
+from pyhmsa_plot.util.modest_image import \
+    imshow, block_reduce, downsample, has_invalid, neighbour_viewports, cast, \
+    reduction_dtype
+from pyhmsa_plot.util.colormap import apply_colormap
+
+# Globals and constants variables.
+
+class TestModestImage(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        x, y = np.mgrid[0:2000, 0:1000]
+        self.data = np.sin(x / 10.) * np.cos(y / 30.)
+
+        self.fig = Figure(figsize=(4, 4), dpi=50)
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_axes([0.0, 0.0, 1.0, 1.0])
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+
+    def testdraw_pyramid(self):
+        im = imshow(self.ax, self.data, interpolation='none')
+        self.fig.canvas.draw()
+
+        self.assertGreater(len(im._pyramid), 1)
+        self.assertLess(im._A.shape[0], self.data.shape[0])
+        self.assertLess(im._A.shape[1], self.data.shape[1])
+
+        factor = 2 ** max(im._pyramid)
+        level = im._pyramid[max(im._pyramid)]
+        self.assertTrue(np.array_equal(level, self.data[::factor, ::factor]))
+
+    def testdraw_zoom(self):
+        im = imshow(self.ax, self.data, interpolation='none')
+        self.fig.canvas.draw()
+        nlevels = len(im._pyramid)
+
+        self.ax.set_xlim(100, 200)
+        self.ax.set_ylim(300, 200)
+        self.fig.canvas.draw()
+        self.assertEqual(1, im._sx)
+        self.assertEqual(1, im._sy)
+
+        self.ax.set_xlim(0, 1000)
+        self.ax.set_ylim(2000, 0)
+        self.fig.canvas.draw()
+        self.assertEqual(nlevels, len(im._pyramid))
+
+    def testdraw_reduction(self):
+        data = np.zeros((2000, 1000))
+        data[1001, 501] = 1.0
+
+        im = imshow(self.ax, data, interpolation='none', reduction='max')
+        self.fig.canvas.draw()
+
+        self.assertEqual('max', im.get_reduction())
+        self.assertEqual(1.0, im._pyramid[max(im._pyramid)].max())
+        self.assertEqual(1.0, im._A.max())
+
+        im.set_reduction('mean')
+        self.assertEqual(1, len(im._pyramid))
+        self.fig.canvas.draw()
+        self.assertAlmostEqual(data.mean(), im._A.mean(), 4)
+
+        self.assertRaises(ValueError, im.set_reduction, 'median')
+
+    def testdraw_tiles(self):
+        im = imshow(self.ax, self.data, interpolation='none', tile_size=16)
+        self.fig.canvas.draw()
+
+        self.assertEqual(np.uint8, im._A.dtype)
+        self.assertEqual(4, im._A.shape[2])
+        ntiles = len(im._tile_cache)
+        self.assertGreater(ntiles, 1)
+
+        # Same result as colormapping the whole downsampled area
+        expected = im.to_rgba(self.data[::im._sy, ::im._sx], bytes=True)
+        ny, nx = expected.shape[:2]
+        self.assertTrue(np.array_equal(expected, im._A[:ny, :nx]))
+
+        # Pan: only new tiles are computed
+        self.ax.set_xlim(500, 600)
+        self.ax.set_ylim(600, 500)
+        self.fig.canvas.draw()
+        self.assertEqual(1, im._sx)
+        ntiles = len(im._tile_cache)
+
+        self.ax.set_xlim(510, 610)
+        self.ax.set_ylim(610, 510)
+        self.fig.canvas.draw()
+        self.assertLess(len(im._tile_cache), 2 * ntiles)
+
+        # Change of colormap
+        im.set_clim(-0.5, 0.5)
+        self.fig.canvas.draw()
+        expected = im.to_rgba(self.data[im._bounds[2]:im._bounds[3],
+                                        im._bounds[0]:im._bounds[1]],
+                              bytes=True)
+        self.assertTrue(np.array_equal(expected, im._A))
+
+    def testdraw_invalid(self):
+        data = (self.data * 1000).astype(np.int16)
+        im = imshow(self.ax, data, interpolation='none')
+        self.assertFalse(im._has_invalid)
+        self.fig.canvas.draw()
+        self.assertIs(np.ma.nomask, im._A.mask)
+
+        im.set_data(self.data)
+        self.assertIsNone(im._has_invalid)
+        self.fig.canvas.draw()
+        self.assertFalse(im._has_invalid)
+        self.assertIs(np.ma.nomask, im._A.mask)
+
+        data = self.data.copy()
+        data[0, 0] = np.nan
+        im.set_data(data)
+        self.fig.canvas.draw()
+        self.assertTrue(im._has_invalid)
+        self.assertTrue(im._A.mask[0, 0])
+
+    def testhas_invalid(self):
+        self.assertFalse(has_invalid(np.zeros((5, 5), np.uint16)))
+        self.assertFalse(has_invalid(self.data))
+        self.assertTrue(has_invalid(np.full((5, 5), np.inf)))
+        self.assertTrue(has_invalid(np.ma.masked_less(self.data, 0.0)))
+
+    def testdownsample(self):
+        data = np.arange(7 * 5).reshape(7, 5)
+
+        reduced = downsample(data, 2)
+        self.assertTrue(np.array_equal(data[::2, ::2], reduced))
+
+        reduced = downsample(data, 2, np.max)
+        self.assertTrue(np.array_equal(block_reduce(data, 2, 2, np.max),
+                                       reduced))
+
+    def testdownsample_masked(self):
+        data = np.ma.masked_less(np.arange(8 * 6).reshape(8, 6), 8)
+
+        reduced = downsample(data, 2)
+        self.assertTrue(np.array_equal(data[::2, ::2].mask, reduced.mask))
+
+        # Only fully masked blocks are masked
+        reduced = downsample(data, 2, np.mean)
+        self.assertEqual([True, False, False], reduced.mask[0].tolist())
+        self.assertEqual(8.5, reduced[0, 1])
+        self.assertEqual(15.5, reduced[1, 0])
+        self.assertFalse(reduced.mask[1:].any())
+
+    def testdraw_tiles_integer(self):
+        data = (self.data * 1000 + 1000).astype(np.uint16)
+        im = imshow(self.ax, data, interpolation='none', tile_size=16)
+        self.fig.canvas.draw()
+
+        expected = im.to_rgba(data[::im._sy, ::im._sx], bytes=True)
+        ny, nx = expected.shape[:2]
+        self.assertTrue(np.array_equal(expected, im._A[:ny, :nx]))
+
+        # Only the colormap is applied again, also after an in-place change
+        ntiles = len(im._tile_data_cache)
+        im.set_clim(500, 1500)
+        self.fig.canvas.draw()
+        im.cmap = copy.copy(im.cmap) # Not the registered colormap
+        im.cmap.set_under('r')
+        im.norm.vmin = 1000
+        self.fig.canvas.draw()
+
+        expected = im.cmap(im.norm(data[::im._sy, ::im._sx]), bytes=True)
+        self.assertTrue(np.array_equal(expected, im._A[:ny, :nx]))
+        self.assertEqual(ntiles, len(im._tile_data_cache))
+
+    def testdraw_integer(self):
+        data = (self.data * 1000 + 1000).astype(np.uint16)
+        im = imshow(self.ax, data, interpolation='none')
+
+        # Colormapped through a lookup table, without tiles
+        dtypes = []
+        def _apply_colormap(A, cmap, norm):
+            dtypes.append(A.dtype)
+            return apply_colormap(A, cmap, norm)
+
+        with mock.patch('pyhmsa_plot.util.modest_image.apply_colormap',
+                        _apply_colormap):
+            self.fig.canvas.draw()
+            self.fig.canvas.draw() # Cached
+        self.assertEqual([np.uint16], dtypes)
+        self.assertEqual(np.uint16, im._A.dtype)
+        rgba = np.array(self.fig.canvas.buffer_rgba())
+
+        # Same pixels as matplotlib's colormapping
+        im.set_data(data.astype(np.float64))
+        self.fig.canvas.draw()
+        self.assertTrue(np.array_equal(rgba, self.fig.canvas.buffer_rgba()))
+
+        # Colormapped again after an in-place change
+        im.set_data(data)
+        self.fig.canvas.draw()
+        im.norm.vmin = 1000
+        self.fig.canvas.draw()
+        self.assertFalse(np.array_equal(rgba, self.fig.canvas.buffer_rgba()))
+
+    def testdraw_prefetch(self):
+        im = imshow(self.ax, self.data, interpolation='none', tile_size=16,
+                    prefetch=True)
+        im.set_tile_cache_size(10000)
+
+        self.ax.set_xlim(500, 600)
+        self.ax.set_ylim(600, 500)
+        self.fig.canvas.draw()
+        im._prefetch_future.result()
+        ntiles = len(im._tile_cache)
+
+        # Neighbouring view was already computed
+        im.set_prefetch(False)
+        self.ax.set_xlim(600, 700)
+        self.fig.canvas.draw()
+        self.assertEqual(ntiles, len(im._tile_cache))
+
+    def testdraw_prefetch_set_data(self):
+        im = imshow(self.ax, self.data, interpolation='none', tile_size=16,
+                    prefetch=True)
+        im.set_tile_cache_size(10000)
+
+        # Data changed while the prefetch computes its first tile
+        started, resume = threading.Event(), threading.Event()
+        downsample = im._downsample
+        def _downsample(*args):
+            if threading.current_thread() is not threading.main_thread():
+                started.set()
+                resume.wait(10)
+            return downsample(*args)
+
+        with mock.patch.object(im, '_downsample', _downsample):
+            self.ax.set_xlim(500, 600)
+            self.ax.set_ylim(600, 500)
+            self.fig.canvas.draw()
+            future = im._prefetch_future
+            self.assertTrue(started.wait(10))
+            im.set_data(self.data * 2)
+            resume.set()
+            future.result()
+
+        self.assertEqual(0, len(im._tile_cache))
+        self.assertEqual(0, len(im._tile_data_cache))
+
+    def testshutdown_prefetch_executor(self):
+        with mock.patch.object(modest_image, '_prefetch_executor', None), \
+                mock.patch.object(modest_image, '_prefetch_stop',
+                                  threading.Event()):
+            im = imshow(self.ax, self.data, interpolation='none',
+                        tile_size=16, prefetch=True)
+            self.fig.canvas.draw()
+            future = im._prefetch_future
+            self.assertIsNotNone(future)
+
+            modest_image.shutdown_prefetch_executor()
+            self.assertTrue(future.done())
+            self.assertIsNone(modest_image.get_prefetch_executor())
+
+            # Views are still drawn, without prefetch
+            self.ax.set_xlim(500, 600)
+            self.ax.set_ylim(600, 500)
+            self.fig.canvas.draw()
+            self.assertIsNone(im._prefetch_future)
+
+    def testneighbour_viewports(self):
+        viewports = neighbour_viewports(0, 100, 2, 50, 150, 2, (1000, 1000))
+        self.assertIn((100, 200, 2, 50, 150, 2), viewports)
+        self.assertIn((0, 100, 2, 150, 250, 2), viewports)
+        self.assertIn((0, 100, 2, 0, 50, 2), viewports)
+        self.assertIn((25, 75, 1, 75, 125, 1), viewports)
+        self.assertIn((0, 150, 4, 0, 200, 4), viewports)
+        self.assertEqual(5, len(viewports))
+
+    def testblock_reduce(self):
+        data = np.arange(7 * 5).reshape(7, 5)
+        reduced = block_reduce(data, 3, 2, np.sum)
+        self.assertEqual((2, 2), reduced.shape)
+        self.assertEqual(data[:3, :2].sum(), reduced[0, 0])
+        self.assertEqual(data[3:6, 2:4].sum(), reduced[1, 1])
+
+    def testdraw_dtype(self):
+        data = (self.data * 1000 + 1000).astype(np.uint16)
+        im = imshow(self.ax, data, interpolation='none', reduction='mean',
+                    dtype='native')
+        self.fig.canvas.draw()
+
+        self.assertEqual(np.uint16, im._A.dtype)
+        for level in im._pyramid.values():
+            self.assertEqual(np.uint16, level.dtype)
+
+        im.set_dtype(np.float32)
+        self.assertEqual(1, len(im._pyramid))
+        self.fig.canvas.draw()
+        self.assertEqual(np.float32, im._A.dtype)
+
+        im.set_dtype(None)
+        self.fig.canvas.draw()
+        self.assertEqual(np.float64, im._A.dtype)
+
+    def testdraw_sum(self):
+        data = np.full((2000, 1000), 60000, np.uint16)
+        data[0, 0] = 0
+        im = imshow(self.ax, data, interpolation='none', reduction='sum',
+                    dtype='native', tile_size=16)
+        self.fig.canvas.draw()
+
+        # Sums are not clipped, and drawn as values of full resolution
+        level = im._pyramid[max(im._pyramid)]
+        self.assertEqual(np.uint64, level.dtype)
+        self.assertEqual(60000 * 4 ** max(im._pyramid), level[-1, -1])
+        self.assertEqual((0, 60000), im.get_clim())
+        self.assertTrue(np.array_equal(im.to_rgba(60000, bytes=True),
+                                       im._A[-1, -1]))
+
+        im.set_tile_size(None)
+        self.fig.canvas.draw()
+        self.assertEqual(60000, im._A.max())
+        self.assertLess(im._A.min(), 60000)
+
+        self.assertEqual(np.int64, reduction_dtype('sum', np.int8))
+        self.assertEqual(np.float32, reduction_dtype('sum', np.float32))
+        self.assertEqual(np.uint8, reduction_dtype('max', np.uint8))
+
+    def testdraw_flip(self):
+        im = imshow(self.ax, self.data, interpolation='none', flip=(True, True))
+        self.fig.canvas.draw()
+        self.assertIs(self.data, im.get_array())
+        self.assertTrue(np.shares_memory(self.data, im._pyramid[0]))
+        flipped = im._A
+
+        im.set_flip((False, False))
+        im.set_data(self.data[::-1, ::-1])
+        self.fig.canvas.draw()
+        self.assertTrue(np.array_equal(flipped, im._A))
+
+    def testcast(self):
+        data = np.array([-1.0, 1.4, 1.6, 70000.0])
+        self.assertTrue(np.array_equal([0, 1, 2, 65535],
+                                       cast(data, np.uint16)))
+        self.assertIs(data, cast(data, None))
+        self.assertIs(data, cast(data, np.float64))
+
+    def testset_data(self):
+        im = imshow(self.ax, self.data, interpolation='none')
+        self.fig.canvas.draw()
+
+        im.set_data(self.data[:500, :500])
+        self.assertEqual(1, len(im._pyramid))
+        self.assertIsNone(im._bounds)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
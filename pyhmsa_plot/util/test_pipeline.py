@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# Third party modules.
+import numpy as np
+
+import scipy.ndimage as ndimage
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Local modules.
+from pyhmsa_plot.util.pipeline import \
+    (Pipeline, Binning, GaussianFilter, MedianFilter, BackgroundSubtraction,
+     Clip, _PointwiseGroup)
+from pyhmsa_plot.util.memmap import create_memmap, is_memmap
+from pyhmsa_plot.util.modest_image import imshow
+
+# Globals and constants variables.
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        random = np.random.RandomState(0)
+        self.data = random.poisson(100, (300, 200)).astype(np.uint16)
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+
+    def testapply(self):
+        pipeline = Pipeline([GaussianFilter(1.5),
+                             BackgroundSubtraction(90.0),
+                             Clip(vmax=15.0)])
+        actual = pipeline.apply(self.data)
+
+        expected = ndimage.gaussian_filter(self.data, 1.5).astype(float)
+        expected = np.clip(expected - 90.0, 0.0, 15.0).astype(np.uint16)
+        self.assertEqual(np.uint16, actual.dtype)
+        self.assertTrue(np.array_equal(expected, actual))
+
+    def testfuse(self):
+        pipeline = Pipeline([Clip(10.0), BackgroundSubtraction(5.0),
+                             MedianFilter(3), Clip(vmax=50.0)])
+        steps = pipeline._fuse(pipeline)
+        self.assertEqual(3, len(steps))
+        self.assertIsInstance(steps[0], _PointwiseGroup)
+        self.assertEqual(2, len(steps[0].stages))
+        self.assertIsInstance(steps[1], MedianFilter)
+
+    def testapply_tiled(self):
+        pipeline = Pipeline([BackgroundSubtraction(sigma=20.0),
+                             GaussianFilter(2.0), MedianFilter(4), Clip(10)])
+        expected = pipeline.apply(self.data)
+
+        with ThreadPoolExecutor(2) as executor:
+            actual = pipeline.apply(self.data, executor=executor)
+        self.assertTrue(np.array_equal(expected, actual))
+
+        data = create_memmap(self.data.shape, self.data.dtype)
+        data[:] = self.data
+        actual = pipeline.apply(data)
+        self.assertTrue(is_memmap(actual))
+        self.assertTrue(np.array_equal(expected, actual))
+
+    def testapply_flip(self):
+        pipeline = Pipeline([MedianFilter((4, 3)), GaussianFilter(1.0)])
+        expected = pipeline.apply(self.data)
+
+        actual = pipeline.apply(self.data[::-1, ::-1], flip=(True, True))
+        self.assertTrue(np.array_equal(expected, actual[::-1, ::-1]))
+
+    def testoriented(self):
+        for size, origin in [((5, 3), (1, -1)), ((4, 6), (1, -2)),
+                             ((4, 3), (-2, 1)), ((6, 5), (-1, 2))]:
+            median = MedianFilter(size, origin=origin)
+            expected = median(self.data)
+            for flip_x, flip_y in [(True, False), (False, True), (True, True)]:
+                slices = (slice(None, None, -1 if flip_y else 1),
+                          slice(None, None, -1 if flip_x else 1))
+                actual = median.oriented((flip_x, flip_y))(self.data[slices])
+                self.assertTrue(np.array_equal(expected[slices], actual),
+                                (size, origin, flip_x, flip_y))
+
+    def testscaled(self):
+        self.assertEqual((3, 3), MedianFilter(6).scaled(2).size)
+        self.assertEqual((3, 3), MedianFilter(3).scaled(8).size)
+        self.assertEqual((3, 3), MedianFilter(5).scaled(4).size)
+        self.assertEqual((1, 2), MedianFilter((1, 2)).scaled(8).size)
+        self.assertEqual((-1, 0), MedianFilter(4, origin=(-1, 0)).scaled(2).origin)
+        self.assertEqual((1, 1), MedianFilter(6, origin=2).scaled(2).origin)
+        self.assertAlmostEqual(0.5, GaussianFilter(2.0).scaled(4).sigma)
+        self.assertEqual(Clip(1, 2), Clip(1, 2).scaled(4))
+
+    def testbinning(self):
+        binned = Pipeline([Binning(3, 'sum')]).apply(self.data)
+        self.assertEqual((100, 66), binned.shape)
+        self.assertEqual(self.data[:3, :3].sum(), binned[0, 0])
+
+    def testsplit(self):
+        pipeline = Pipeline([Binning(2), GaussianFilter(1.0), Clip(0.0)])
+        eager, lazy = pipeline.split()
+        self.assertEqual(Pipeline([Binning(2)]), eager)
+        self.assertEqual(Pipeline([GaussianFilter(1.0), Clip(0.0)]), lazy)
+
+        pipeline = Pipeline([GaussianFilter(1.0), Binning(2)])
+        eager, lazy = pipeline.split()
+        self.assertEqual(pipeline, eager)
+        self.assertFalse(lazy)
+
+    def testmodest_image(self):
+        data = np.tile(self.data, (10, 10))
+        fig = Figure(figsize=(4, 4), dpi=50)
+        FigureCanvasAgg(fig)
+        ax = fig.add_axes([0.0, 0.0, 1.0, 1.0])
+
+        pipeline = Pipeline([GaussianFilter(4.0), MedianFilter(3)])
+        im = imshow(ax, data, interpolation='none', pipeline=pipeline)
+        fig.canvas.draw()
+        self.assertNotIn(0, im._processed)
+        self.assertGreater(im._sx, 1)
+
+        # Zoom at 1:1: only the visible region is processed, exactly
+        ax.set_xlim(100, 150)
+        ax.set_ylim(150, 100)
+        fig.canvas.draw()
+        self.assertEqual(1, im._sx)
+        self.assertNotIn(0, im._processed)
+
+        expected = pipeline.apply(data)
+        x0, x1, y0, y1 = im._bounds
+        self.assertTrue(np.array_equal(expected[y0:y1, x0:x1], im._A))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+
+# Third party modules.
+import numpy as np
+
+from matplotlib_scalebar.scalebar import ScaleBar
+
+# Local modules.
+from pyhmsa_plot.util.scalebar import burn_scalebar, render_text
+
+# Globals and constants variables.
+
+class TestScalebar(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.rgb = np.full((200, 300, 3), 128, np.uint8)
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+
+    def _bbox(self, mask):
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        return rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+
+    def testrender_text(self):
+        text = render_text('100 µm', 10, 100)
+        self.assertEqual(np.uint8, text.dtype)
+        self.assertEqual(255, text.max())
+        self.assertGreater(text.shape[1], text.shape[0])
+
+    def testburn_scalebar(self):
+        scalebar = ScaleBar(1e-6, location='lower right')
+        burn_scalebar(self.rgb, scalebar)
+
+        # White box in the lower right corner
+        white = (self.rgb == 255).all(axis=-1)
+        y0, y1, x0, x1 = self._bbox(white)
+        self.assertGreater(y0, 100)
+        self.assertGreater(x0, 150)
+        self.assertLess(200 - y1, 5)
+        self.assertLess(300 - x1, 5)
+
+        # Bar of 50 um (0.2 * 300 px = 60 um)
+        black = (self.rgb == 0).all(axis=-1)
+        self.assertEqual(50, black.sum(axis=1).max())
+        self.assertEqual(2, (black.sum(axis=1) == 50).sum())
+
+    def testrender_text_mathtext(self):
+        # Same as the characters, whatever the mathtext of the units
+        expected = render_text('100 \u00b5m', 10, 100)
+        for label in ('100 $\\mathrm{\\mu}$m', '100 $\\mathregular{\\mu}$m'):
+            text = render_text(label, 10, 100)
+            self.assertLess(abs(expected.shape[1] - text.shape[1]), 5)
+
+    def testburn_scalebar_fixed(self):
+        scalebar = ScaleBar(1e-6, location='lower right', fixed_value=0.02,
+                            fixed_units='mm')
+        burn_scalebar(self.rgb, scalebar)
+
+        # Bar of 20 um, above the scale
+        black = (self.rgb == 0).all(axis=-1)
+        y0 = np.flatnonzero(black.any(axis=1))[0]
+        self.assertEqual(20, black[y0].sum())
+
+    def testburn_scalebar_location(self):
+        rgba = np.zeros((200, 300, 4), np.uint8)
+        scalebar = ScaleBar(1e-6, location='upper left', color='r',
+                            frameon=False)
+        burn_scalebar(rgba, scalebar)
+
+        red = rgba[..., 0] > 0
+        y0, _y1, x0, _x1 = self._bbox(red)
+        self.assertLess(y0, 10)
+        self.assertLess(x0, 10)
+        self.assertTrue((rgba[..., 1:3] == 0).all())
+        self.assertTrue((rgba[red, 3] > 0).all())
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
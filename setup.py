@@ -22,7 +22,8 @@ CMDCLASS = versioneer.get_cmdclass()
 
 INSTALL_REQUIRES = ['pyHMSA', 'matplotlib', 'matplotlib_colorbar',
                     'matplotlib_scalebar', 'scipy']
-EXTRAS_REQUIRE = {'develop': ['nose', 'coverage']}
+EXTRAS_REQUIRE = {'develop': ['nose', 'coverage'],
+                  'jpeg': ['Pillow']}
 
 setup(name='pyHMSA-plot',
       version=versioneer.get_version(),
@@ -53,6 +54,9 @@ setup(name='pyHMSA-plot',
       install_requires=INSTALL_REQUIRES,
       extras_require=EXTRAS_REQUIRE,
 
+      entry_points={'console_scripts':
+                    ['pyhmsa-plot = pyhmsa_plot.cli:main']},
+
       zip_safe=True,
 
       test_suite='nose.collector',